@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+# Built-in
+import glob
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+
+# ReelFX
+from pipe_api.scene_archive import scene_archive
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+INDEX_DIR = os.path.join(os.path.expanduser('~'), '.lightning',
+                         'scene_archive_index')
+# Oldest entries are dropped past this many scenes
+MAX_ENTRIES = 200
+# Quoted values of a scene that may be the paths of files it references
+REFERENCE_RE = re.compile(r'"((?:/|\$\{?HIP\}?/|\$\{?JOB\}?/)[^"\n]*)"')
+HIP_RE = re.compile(r'\$\{?HIP\}?(?=/)')
+# Variables and expressions left in a path once the environment is expanded,
+# frame numbers for instance.  They are matched with a glob.
+VARIABLE_RE = re.compile(r'\$\{?\w+\}?|`[^`]*`')
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+class ArchiveIndex(object):
+    """ A small local index of scene path and content hash to archive path.
+    The same contents saved to another scene, the scene of another shot for
+    instance, never share an archive.  The index is a directory of small
+    json files, one per entry, each replaced in one rename, so concurrent
+    submissions never write the same file or read a partial one.  Entries
+    whose archive no longer exists are dropped when they are looked up.
+    """
+    def __init__(self, path=INDEX_DIR, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+
+    def entry_path(self, scene_path, scene_hash):
+        """(str) The file of the entry of a scene and its hash. """
+        key = '{0}\n{1}'.format(os.path.abspath(scene_path), scene_hash)
+        return os.path.join(self.path, '{0}.json'.format(
+            hashlib.sha1(key).hexdigest()))
+
+    def get(self, scene_path, scene_hash):
+        """(str) The archive of the given scene and hash, or None. """
+        entry_path = self.entry_path(scene_path, scene_hash)
+        try:
+            with open(entry_path) as entry_file:
+                archive_path = json.load(entry_file)['path']
+        except (IOError, ValueError, KeyError):
+            return None
+        if not os.path.isfile(archive_path):
+            self.remove(entry_path)
+            return None
+        return archive_path
+
+    def add(self, scene_path, scene_hash, archive_path):
+        """ Add an entry, or refresh it so it is the last to be dropped. """
+        if not os.path.exists(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                # Made by another submission in the meantime
+                pass
+        entry = {
+            'scene' : os.path.abspath(scene_path),
+            'hash' : scene_hash,
+            'path' : archive_path,
+            'time' : time.time(),
+        }
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.',
+                                            suffix='.tmp')
+        with os.fdopen(tmp_fd, 'w') as entry_file:
+            json.dump(entry, entry_file)
+        os.rename(tmp_path, self.entry_path(scene_path, scene_hash))
+        self.prune()
+
+    def remove(self, entry_path):
+        try:
+            os.remove(entry_path)
+        except OSError:
+            # Removed by another submission in the meantime
+            pass
+
+    def prune(self):
+        """ Drop the oldest entries past max_entries. """
+        entry_paths = [os.path.join(self.path, name)
+                       for name in os.listdir(self.path)
+                       if name.endswith('.json')]
+        if len(entry_paths) <= self.max_entries:
+            return
+        by_age = []
+        for entry_path in entry_paths:
+            try:
+                by_age.append((os.path.getmtime(entry_path), entry_path))
+            except OSError:
+                continue
+        by_age.sort()
+        for _, entry_path in by_age[:len(by_age) - self.max_entries]:
+            self.remove(entry_path)
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def reference_paths(reference, scene_dir):
+    """(list) The files a path found in a scene stands for, every frame of
+    a sequence for instance.  None when the path starts with a variable
+    that is not set here, so it cannot be told what it points at.
+
+    """
+    path = os.path.expandvars(HIP_RE.sub(lambda match: scene_dir, reference))
+    if not path.startswith('/'):
+        return None
+    path = VARIABLE_RE.sub('*', path)
+    return sorted(match for match in glob.glob(path) if os.path.isfile(match))
+
+def hash_scene(scene_path):
+    """(str) The sha1 hex digest of a scene and of the files it references,
+    which its archive may hold copies of.  Referenced files are hashed by
+    size and modification time, they are often too large to read.  None
+    when a reference cannot be resolved, in which case the archive of the
+    scene is never reused.
+
+    """
+    digest = hashlib.sha1()
+    references = set()
+    with open(scene_path, 'rb') as scene_file:
+        for line in scene_file:
+            digest.update(line)
+            references.update(REFERENCE_RE.findall(line))
+    scene_dir = os.path.dirname(os.path.abspath(scene_path))
+    for reference in sorted(references):
+        paths = reference_paths(reference, scene_dir)
+        if paths is None:
+            return None
+        for path in paths:
+            info = os.stat(path)
+            digest.update('{0}\n{1}\n{2!r}\n'.format(path, info.st_size,
+                                                      info.st_mtime))
+    return digest.hexdigest()
+
+def link_archive(archive_path):
+    """(str) Link an existing archive into a new, unique path next to it.
+    A hard link is used when possible, otherwise a symlink.
+
+    """
+    root, ext = os.path.splitext(archive_path)
+    stamp = time.strftime('%Y%m%d%H%M%S')
+    link_path = '{0}_{1}{2}'.format(root, stamp, ext)
+    count = 1
+    while os.path.lexists(link_path):
+        link_path = '{0}_{1}_{2}{3}'.format(root, stamp, count, ext)
+        count += 1
+    try:
+        os.link(archive_path, link_path)
+    except OSError:
+        os.symlink(archive_path, link_path)
+    return link_path
+
+def archive_scene(scene_path, path_formula, index=None, archive=None,
+                  scene_hash=None):
+    """(str, str) Archive a scene unless an archive of the same scene with
+    the same contents already exists, in which case that archive is linked
+    into place instead of writing a new copy.  The contents include the
+    files the scene references, see hash_scene.  Returns the archive path
+    and the scene hash.  archive is the function that writes a new archive,
+    called with the scene path and the path formula.  It defaults to
+    pipe_api's scene_archive.  scene_hash is worked out here unless given.
+
+    """
+    if index is None:
+        index = ArchiveIndex()
+    if archive is None:
+        archive = lambda path, formula: scene_archive(path, path_formula=formula)
+    if scene_hash is None:
+        scene_hash = hash_scene(scene_path)
+    source = None
+    if scene_hash is not None:
+        source = index.get(scene_path, scene_hash)
+    if source:
+        archive_path = link_archive(source)
+    else:
+        archive_path = source = archive(scene_path, path_formula)
+    if scene_hash is None:
+        return archive_path, scene_hash
+    try:
+        # Also refreshes a reused entry so it is the last to be dropped
+        index.add(scene_path, scene_hash, source)
+    except (IOError, OSError):
+        # The index is only an optimisation
+        pass
+    return archive_path, scene_hash
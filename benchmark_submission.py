@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+""" Measure the submission throughput of the Dispatcher against the local
+farm backend.  Nothing is sent to Qube or the pipeline database.
+
+    benchmark_submission.py --layers 1,10,100,1000 --output bench.json
+    benchmark_submission.py --baseline bench.json
+
+With a baseline, the run fails when a layer count got slower than the
+allowed tolerance.
+"""
+
+# Built-in
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# ReelFX
+from lightning.dispatcher import Dispatcher
+from lightning.farm_backend import LocalBackend, LocalWipContext, LocalPathContext
+from lightning.layer_spec import LayerSpec
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+LAYER_COUNTS = (1, 10, 100, 1000)
+REPEAT = 3
+# Allowed slow down against a baseline before the run fails
+TOLERANCE = 0.25
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+class Resolution(object):
+    def __init__(self, width=1920, height=1080, aspect=1.0):
+        self.width = width
+        self.height = height
+        self.aspect = aspect
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def make_layers(count):
+    """(list) Layers like the ones built by the UI table. """
+    layers = []
+    for i in range(count):
+        layers.append(LayerSpec(
+            'layer{0:04d}'.format(i),
+            pass_type='beauty',
+            frame_range='101-200',
+            left_eye=True,
+            right_eye=False,
+            up=i % 2 == 0,
+            camera='shotcam',
+            priority=3000,
+            cpus=10,
+            mantra_cluster='dead',
+        ))
+    return layers
+
+def run_submission(root, layer_count):
+    """(float, dict) Submit once and return the total time and the time of
+    every phase.
+
+    """
+    backend = LocalBackend(root)
+    wip_ctx = LocalWipContext(root)
+    path_ctx = LocalPathContext(root)
+    scene_path = wip_ctx.get_default_scene_path()
+    if not os.path.exists(os.path.dirname(scene_path)):
+        os.makedirs(os.path.dirname(scene_path))
+    with open(scene_path, 'w') as scene_file:
+        scene_file.write('# local benchmark scene\n')
+
+    start = time.time()
+    dispatcher = Dispatcher(wip_ctx, path_ctx, Resolution(), 'exr',
+                            make_layers(layer_count), reuse_archives=False,
+                            backend=backend)
+    dispatcher.submit()
+    total = time.time() - start
+    phases = dict((step, timing['seconds'])
+                  for step, timing in dispatcher.timings.items())
+    return total, phases
+
+def benchmark(layer_counts=LAYER_COUNTS, repeat=REPEAT):
+    """(dict) The mean submission time, submissions per second and mean
+    phase times for every layer count.
+
+    """
+    os.environ.setdefault('PKG_LIGHTNING', os.path.dirname(os.path.abspath(__file__)))
+    results = {}
+    for layer_count in layer_counts:
+        totals = []
+        phases = {}
+        for _ in range(repeat):
+            root = tempfile.mkdtemp(prefix='dispatcher_bench_')
+            try:
+                total, run_phases = run_submission(root, layer_count)
+            finally:
+                shutil.rmtree(root, ignore_errors=True)
+            totals.append(total)
+            for step, seconds in run_phases.items():
+                phases.setdefault(step, []).append(seconds)
+        mean = sum(totals) / len(totals)
+        results[str(layer_count)] = {
+            'seconds' : mean,
+            'submissions_per_second' : 1.0 / mean if mean else 0.0,
+            'phases' : dict((step, sum(times) / len(times))
+                            for step, times in phases.items()),
+        }
+    return results
+
+def format_results(results):
+    lines = []
+    for layer_count in sorted(results, key=int):
+        result = results[layer_count]
+        lines.append('{0:>5} layers : {1:8.3f}s  {2:8.2f} submissions/s'.format(
+            layer_count, result['seconds'], result['submissions_per_second']))
+        phases = sorted(result['phases'].items(), key=lambda item: -item[1])
+        for step, seconds in phases:
+            lines.append('        {0:<24}{1:8.2f}ms'.format(step, seconds * 1000))
+    return '\n'.join(lines)
+
+def find_regressions(results, baseline, tolerance=TOLERANCE):
+    """(list) The layer counts that are slower than the baseline by more
+    than the tolerance.
+
+    """
+    regressions = []
+    for layer_count, result in results.items():
+        if layer_count not in baseline:
+            continue
+        allowed = baseline[layer_count]['seconds'] * (1.0 + tolerance)
+        if result['seconds'] > allowed:
+            regressions.append(layer_count)
+    return sorted(regressions, key=int)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--layers', default=','.join(map(str, LAYER_COUNTS)),
+                        help='comma separated layer counts')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--output', help='write the results to a json file')
+    parser.add_argument('--baseline', help='compare against a json file')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    layer_counts = [int(count) for count in args.layers.split(',')]
+    results = benchmark(layer_counts, args.repeat)
+    print format_results(results)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=1)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print 'Slower than the baseline: {0} layers'.format(
+                ', '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
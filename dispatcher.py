@@ -1,89 +1,499 @@
 #!/usr/bin/env python
 
 # Built-in
+import cPickle
 import glob
+import json
 import math
 import os
 import shutil
 import sys
+import threading
 import time
 import webbrowser
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 
 # ReelFX
-from app_manager.hou_executer import HouExecuter, MantraExecuter
-from app_manager.session_manager import SessionManager
+from lightning import archive_cache
+from lightning import frame_utils
+from lightning import ifd_history
+from lightning import ifd_retention
+from lightning import layer_packing
+from lightning import manifest
+from lightning import render_cache
+from lightning import render_history
+from lightning.farm_backend import FarmBackend
+from lightning.layer_spec import eye_path, tile_path, EYE_DIRS, EYES
+from lightning.rhou import spool
 from farm_lib.farm_enums import JobType, QubeLanguage, FrameDistribution
 from farm_lib.farm_utils import QubeTrigger, QubeEventName, QubeAgenda
-from farm_lib.qube_job import QubeJob
-from farm_lib.qube_submitter import QubeSubmitter
 import path_lib
-from pipe_api.scene_archive import scene_archive
-from pipe_core.model.wip_output import WipOutputManager, WipOutput
+from pipe_core.model.wip_output import WipOutput
 from pipe_core.model.wip_output_types import WipOutputType
 from pipe_utils.application import Application
-from pipe_utils.email_utils import get_email_address
 from pipe_utils.sequence import FrameSet
 from pipe_utils.string_utils import obj_to_str
-from pipe_utils.system_utils import get_user
 from pipe_utils.version_utils import VersionManager
 from pipe_utils import xml_utils
 
 #------------------------------------------------------------------------------
 # GLOBALS
 #------------------------------------------------------------------------------
+# Archive and submission path formulas for each kind of wip
+PATH_FORMULAS = {
+    'assembly' : ('am_wip_backup_version_dir', 'am_render_dispatcher_dir'),
+    'shot' : ('sh_wip_backup_version_dir', 'sh_render_dispatcher_dir'),
+}
+# Number of shots whose scenes are archived and submissions written at once
+# by Dispatcher.submit_batch
+BATCH_WORKERS = 4
+# Hbatch distribution that splits IFD creation into frame chunks
+HBATCH_FRAME_CHUNK = 'Frame Chunk'
+# Hbatch distribution that pipes the scene straight into mantra, see streams
+HBATCH_DIRECT = 'Direct to Mantra'
+# Order of the frames of the render jobs, see frame_agendas
+FRAME_ORDER_SEQUENTIAL = 'sequential'
+FRAME_ORDER_KEY_FIRST = 'key_first'
+FRAME_ORDER_PROGRESSIVE = 'progressive'
+# Every how many frames the first pass of a progressive order renders
+PROGRESSIVE_STEP = 5
+# Script of the jobs that put the tiles of tiled layers together
+STITCH_SCRIPT = 'exr_stitch.py'
+# Wall clock time an IFD chunk should take, in seconds
+CHUNK_SECONDS = 900
+# Chunk size used until a shot has an IFD history
+DEFAULT_CHUNK_SIZE = 10
+# Every submission appends its timing record here, in the submission path
+TIMINGS_LOG_NAME = 'submission_timings.jsonl'
+# Qube status of the jobs that wait on a spool, its workers release them
+HELD_STATUS = 'blocked'
 
 #------------------------------------------------------------------------------
 # CLASSES
 #------------------------------------------------------------------------------
+class BackgroundTask(threading.Thread):
+    """ Run a function in a worker thread.  result() waits for it and hands
+    back its return value, or raises the error it failed with.
+    """
+    def __init__(self, function, *args, **kwargs):
+        super(BackgroundTask, self).__init__()
+        self.daemon = True
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self._result = None
+        self._exc_info = None
+
+    def run(self):
+        try:
+            self._result = self.function(*self.args, **self.kwargs)
+        except Exception:
+            self._exc_info = sys.exc_info()
+
+    def result(self):
+        self.join()
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+class SubmissionSession(object):
+    """ The user and environment lookups a submission needs.  They are the
+    same for every shot, so a batch of dispatchers shares one session.
+    archive_workers bounds the scene archives its dispatchers write at
+    once, see archive_slot.
+    """
+    def __init__(self, backend=None, archive_workers=None):
+        self.backend = backend or FarmBackend()
+        self.user = self.backend.get_user()
+        self.email_address = self.backend.get_email_address(self.user)
+        self.app_versions = self.backend.get_app_versions()
+        self._archive_slots = None
+        if archive_workers:
+            self._archive_slots = threading.BoundedSemaphore(archive_workers)
+
+    @contextmanager
+    def archive_slot(self):
+        """ Wait until fewer than archive_workers scenes are archived. """
+        if self._archive_slots is None:
+            yield
+            return
+        with self._archive_slots:
+            yield
+
+
+class LayerOutput(object):
+    """ The resolved outputs of a single layer for one submission.  Every
+    lookup that has to go to the pipeline database is done once here.
+    """
+    def __init__(self, wip_output, version):
+        self.wip_output = wip_output
+        self.version = version
+        self.image_path = version.get_path()
+        self.ifd_path = version.get_path(WipOutputType.MANTRA_IFD)
+        base_dirs = wip_output.get_output_base_dirs()
+        self.ifd_base_dir = base_dirs[0]
+        self.render_base_dir = base_dirs[1]
+
+
+class SpoolUnit(object):
+    """ An IFD work unit handed to the hbatch workers of a spool.  It takes
+    the place of the IFD job of its layers.  The jobs that would wait on
+    that job are submitted held instead and listed in labels, and the
+    worker releases them once the IFDs are written.
+    """
+    def __init__(self, job_args):
+        self.job_args = job_args
+        self.labels = []
+
+
+class SubmissionResult(dict):
+    """ The job ids of a submission keyed by job label.  timings is the
+    timing record of the submission, see Dispatcher.timing_record.  reused
+    holds the frames of every layer that were left as they were by an
+    incremental submission.
+    """
+    def __init__(self, job_ids=None, timings=None, reused=None):
+        super(SubmissionResult, self).__init__(job_ids or {})
+        self.timings = timings or {}
+        self.reused = reused or {}
+
+
 class Dispatcher(object):
     def __init__(self, wip_ctx, path_ctx, resolution, outformat,
                  layer_info, after_job = None, test_only=False, notes='',
-                 priority=1000, cpus=1):
-        self.user = get_user()
-        self.email_address = get_email_address(self.user)
+                 priority=1000, cpus=1, reuse_archives=True, session=None,
+                 backend=None, ifd_group_size=1, chunk_seconds=CHUNK_SECONDS,
+                 spool_dir=None, split_stereo=False, repair=False,
+                 incremental=False, ifd_policy=None, pack_layers=False,
+                 merge_passes=False, frame_order=FRAME_ORDER_SEQUENTIAL,
+                 key_frames='', progressive_step=PROGRESSIVE_STEP,
+                 skip_held_frames=False, reuse_renders=False, tiles=0):
+        # First start, total time and call count of every submission step,
+        # see timed
+        self.start_time = time.time()
+        self.timings = {}
+        self._timings_lock = threading.Lock()
+        # The farm and pipeline services, see farm_backend
+        self.session = session or SubmissionSession(backend)
+        self.backend = backend or self.session.backend
+        self.user = self.session.user
+        self.email_address = self.session.email_address
         self.wip_ctx = wip_ctx
         # Retrieve the path formulas based on wip ctx
         self.get_path_formulas()
         self.path_ctx = path_ctx
         self.resolution = resolution
         self.outformat = outformat
+        # Resolved wip outputs and paths, see snapshot
+        self._wip_outputs = None
+        self._output_versions = None
+        self._snapshot = None
         self.layer_info = layer_info
-        self.stringify_elements()
+        self.invalidate_snapshot()
         self.notes = notes
         self.priority = priority
         self.cpus = cpus
-        self.scene_path = self.wip_ctx.get_default_scene_path()
-        # The scene archive path may be an assembly
-        self.scene_archive_path = scene_archive(
-            self.scene_path,
-            path_formula=self.archive_formula,
-        )
-        self.scene_archive_basename = os.path.splitext(
-            os.path.basename(self.scene_archive_path)
-        )[0]
-        self.hou_frame_pattern = '$F4'
-        self.wip_output_mgr = WipOutputManager.instance(pipe_ctx=self.wip_ctx)
-        self.output_versions = self.get_output_versions()
+        # Layers per IFD creation job, 0 puts them all in one job.  Render
+        # jobs wait on the IFD job of their layer, so by default every layer
+        # gets its own and starts rendering as soon as its IFDs are written.
+        self.ifd_group_size = ifd_group_size
+        # Target duration of a frame chunk, see chunk_size
+        self.chunk_seconds = chunk_seconds
         self.after_job = after_job
+        # Warm hbatch workers write the IFDs when set, see spool_ifd_jobs
+        self.spool_dir = spool_dir
+        # Write and render the eyes of stereo layers separately, see
+        # layer_eyes
+        self.split_stereo = split_stereo
+        # Only render the missing frames of the current versions, see
+        # restrict_to_missing_frames
+        self.repair = repair
+        # Only render what changed since the last submission, see
+        # restrict_to_changes
+        self.incremental = incremental
+        # The frames of every layer an incremental submission left alone
+        self.reused = {}
+        # The ifd_retention.RetentionPolicy applied once frames are rendered
+        self.ifd_policy = ifd_policy
+        # Render cheap layers together, see layer_packs
+        self.pack_layers = pack_layers
+        # Let passes that only differ in their AOVs share a mantra node, see
+        # rhou.render.merge_passes
+        self.merge_passes = merge_passes
+        # The order mantra renders frames in and the hero and key frames of
+        # the shot, see frame_agendas
+        self.frame_order = frame_order
+        self.key_frames = key_frames
+        self.progressive_step = progressive_step
+        # Render a single frame of every hold, see rhou.ifd_hash
+        self.skip_held_frames = skip_held_frames
+        # Take frames whose IFD was rendered before from the render cache
+        self.reuse_renders = reuse_renders
+        # Tiles every frame is split into, see tiled
+        self.tiles = tiles
+        # Before anything is saved or archived
+        self.check_spool()
         self.submission_path = self.path_ctx.get_path(
             self.submission_formula,
             disc=self.wip_ctx.discipline.short_name
         )
-        self.xml_path = os.path.join(
-            self.submission_path,
-            '{0}.xml'.format(self.scene_archive_basename)
-        )
+        self.scene_path = self.wip_ctx.get_default_scene_path()
+        # Reuse the archive of an identical scene, see archive_cache.  The
+        # archive of an assembly holds more than its scene file, so it is
+        # never reused.
+        self.reuse_archives = reuse_archives and not self.wip_ctx.is_assembly()
+        # Worked out by the archive task, see scene_hash
+        self._scene_hash = None
+        self._scene_hashed = threading.Event()
+        # The manifest of the last submission of the shot
+        self.previous = None
+        if self.repair or self.incremental:
+            with self.timed('previous_manifest'):
+                self.previous = self.load_previous_manifest()
+        # Archiving is the slowest step, so it runs in the background while
+        # the rest of the submission is prepared.  See scene_archive_path.
+        self._archive_task = BackgroundTask(self.archive_scene)
+        self._archive_task.start()
+        self.hou_frame_pattern = '$F4'
+        self.wip_output_mgr = self.backend.get_wip_output_manager(self.wip_ctx)
+        with self.timed('output_versions'):
+            self.output_versions = self.get_output_versions()
+        # Everything that was asked for, before a repair or an incremental
+        # submission narrows it down
+        self.requested_layers = [(layer, output.image_path) for layer, output
+                                 in zip(self.layer_info, self.snapshot)]
+        if self.incremental:
+            with self.timed('diff_previous'):
+                self.restrict_to_changes()
+        if self.repair:
+            with self.timed('missing_frames'):
+                self.restrict_to_missing_frames()
         self.py_script = path_lib.join(
             os.environ['PKG_LIGHTNING'],
             'rhou',
             'create_renders.py'
         )
         self.test_only = test_only
+        # Labels of the qube jobs created by this dispatcher
+        self.job_labels = []
+        # The (frames, IFD creation job) pairs of every layer index
+        self.ifd_jobs = {}
+        # The render jobs reporting back to the IFD retention of every IFD
+        # directory, see register_ifds
+        self.retention_jobs = {}
 
     def __repr__(self):
         return '%s %s_%s_%s' % (self.__class__, self.wip_ctx.sequence,
                                   self.wip_ctx.shot, self.wip_ctx.wip)
 
+    @contextmanager
+    def timed(self, step):
+        """ Time a submission step.  A step that runs more than once adds up
+        its time and counts its calls.
+
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            with self._timings_lock:
+                timing = self.timings.setdefault(
+                    step, {'start' : start, 'seconds' : 0.0, 'calls' : 0})
+                timing['seconds'] += seconds
+                timing['calls'] += 1
+
+    def format_timings(self):
+        """(str) The submission steps in the order they started, with their
+        offset from the start of the submission and how long they took.
+
+        """
+        lines = []
+        steps = sorted(self.timings.items(), key=lambda item: item[1]['start'])
+        for step, timing in steps:
+            line = '{0} : +{1:.2f}s, {2:.2f}s'.format(
+                step, timing['start'] - self.start_time, timing['seconds'])
+            if timing['calls'] > 1:
+                line = '{0} ({1} calls)'.format(line, timing['calls'])
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def timing_record(self):
+        """(dict) Where the time of this submission went, as one record. """
+        phases = {}
+        for step, timing in self.timings.items():
+            phases[step] = {
+                'offset' : timing['start'] - self.start_time,
+                'seconds' : timing['seconds'],
+                'calls' : timing['calls'],
+            }
+        return {
+            'time' : self.start_time,
+            'user' : self.user,
+            'sequence' : str(self.wip_ctx.sequence),
+            'shot' : str(self.wip_ctx.shot),
+            'wip' : str(self.wip_ctx.wip),
+            'layers' : len(self.layer_info),
+            'jobs' : len(self.job_labels),
+            'test_only' : self.test_only,
+            'seconds' : time.time() - self.start_time,
+            'phases' : phases,
+        }
+
+    def log_timings(self, record):
+        """ Append a timing record to the log in the submission path. """
+        log_path = os.path.join(self.submission_path, TIMINGS_LOG_NAME)
+        try:
+            if not os.path.exists(self.submission_path):
+                os.makedirs(self.submission_path)
+            with open(log_path, 'a') as log_file:
+                log_file.write(json.dumps(record) + '\n')
+        except (IOError, OSError):
+            # The log is only informational
+            pass
+
+    def finish_submission(self, job_ids):
+        """(SubmissionResult) Log the timings of the submission and hand
+        them back with its job ids.
+
+        """
+        record = self.timing_record()
+        self.log_timings(record)
+        return SubmissionResult(job_ids, record, self.reused)
+
+    def archive_scene(self):
+        """(str) Archive the scene to render.  This runs in a background
+        task started at construction, which hashes the scene first when the
+        hash is needed.  A repair, or an incremental submission of an
+        unchanged scene, renders the archive of the last submission again.
+
+        """
+        try:
+            if self.repair and self.reuses_previous_archive:
+                # The scene rendered is the one of the last submission
+                self._scene_hash = self.previous.get('scene_hash')
+            elif self.incremental or self.reuse_archives:
+                with self.timed('scene_hash'):
+                    self._scene_hash = archive_cache.hash_scene(self.scene_path)
+        finally:
+            self._scene_hashed.set()
+        if self.reuses_previous_archive:
+            return self.previous['render_scene']
+        with self.session.archive_slot(), self.timed('scene_archive'):
+            if self.reuse_archives and self._scene_hash is not None:
+                archive_path, _ = archive_cache.archive_scene(
+                    self.scene_path,
+                    self.archive_formula,
+                    archive=self.backend.scene_archive,
+                    scene_hash=self._scene_hash,
+                )
+                return archive_path
+            # The scene archive path may be an assembly
+            return self.backend.scene_archive(
+                self.scene_path,
+                self.archive_formula,
+            )
+
+    def load_previous_manifest(self):
+        """(dict) The manifest of the last submission of this shot, or None
+        when there is none that can be read.
+
+        """
+        manifest_path = manifest.latest_manifest(self.submission_path)
+        if not manifest_path:
+            return None
+        try:
+            return manifest.load(manifest_path)
+        except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+            return None
+
+    @property
+    def scene_hash(self):
+        """(str) The hash of the scene and of the files it references, see
+        archive_cache.hash_scene.  Waits for the archive task to work it
+        out.  None when it is not needed or cannot be worked out.
+
+        """
+        if not self._scene_hashed.is_set():
+            with self.timed('scene_hash_wait'):
+                self._scene_hashed.wait()
+        return self._scene_hash
+
+    @property
+    def reuses_previous_archive(self):
+        """(bool) Whether the scene archive of the last submission is
+        rendered again instead of archiving the scene.  Repairs always do
+        so the frames match the rest of the version, incremental submissions
+        when the scene did not change.
+
+        """
+        if not self.previous:
+            return False
+        if not os.path.isfile(self.previous.get('render_scene', '')):
+            return False
+        if self.repair:
+            return True
+        return (self.incremental and self.scene_hash is not None and
+                self.previous.get('scene_hash') == self.scene_hash)
+
+    @property
+    def scene_archive_path(self):
+        """(str) The archived scene.  Waits for the archive to finish. """
+        if self._archive_task.is_alive():
+            with self.timed('scene_archive_wait'):
+                return self._archive_task.result()
+        return self._archive_task.result()
+
+    @property
+    def scene_archive_basename(self):
+        return os.path.splitext(os.path.basename(self.scene_archive_path))[0]
+
+    @property
+    def submission_basename(self):
+        """(str) The name of the xml, manifest and prepared scene.  A
+        submission that shares its archive with an earlier one gets a name
+        of its own.
+
+        """
+        if self.reuses_previous_archive:
+            return '{0}_{1}_{2}'.format(
+                self.scene_archive_basename,
+                'repair' if self.repair else 'update',
+                time.strftime('%Y%m%d%H%M%S', time.localtime(self.start_time)))
+        return self.scene_archive_basename
+
+    @property
+    def xml_path(self):
+        return os.path.join(
+            self.submission_path,
+            '{0}.xml'.format(self.submission_basename)
+        )
+
+    @property
+    def manifest_path(self):
+        """(str) The manifest the IFD jobs read their arguments from. """
+        return manifest.manifest_path(self.xml_path)
+
+    @property
+    def render_args_path(self):
+        """(str) Where a test only submission writes its render arguments. """
+        return '{0}_renderArgs.txt'.format(os.path.splitext(self.xml_path)[0])
+
+    @property
+    def prepared_scene_path(self):
+        """(str) Where the IFD job saves the scene once the render nodes
+        are set up.  Archives may be shared between submissions so they are
+        never saved over.
+
+        """
+        ext = os.path.splitext(self.scene_archive_path)[1]
+        return os.path.join(
+            self.submission_path,
+            '{0}{1}'.format(self.submission_basename, ext)
+        )
+
     def add_email_callback(self, qube_job):
         """ Add a callback call to the qube job for emails on
         fail-complete-kill.
@@ -106,7 +516,14 @@ class Dispatcher(object):
         qube_job.add_callback(code, QubeTrigger.get_complete_self_trigger())
         return qube_job
 
-    def create_xml(self):
+    def create_xml(self, render_args=None):
+        """ Build the submission xml out of the render arguments, the ones
+        of this submission by default.  Passing the data that goes in the
+        manifest keeps the two from disagreeing.
+
+        """
+        if render_args is None:
+            render_args = self.render_args
         root = xml_utils.ElementTree.Element('submission')
         root.set('version', '1')
         root.set('date', '1')
@@ -114,8 +531,8 @@ class Dispatcher(object):
         sub_names = ['shot', 'resolution', 'output', 'scenepath', 'rlcfile',
                      'shotopts', 'renders']
         sub_elements = self.create_sub_elements(root, sub_names)
-        self.populate_image_info(sub_elements)
-        self.populate_layer_info(sub_elements['renders'])
+        self.populate_image_info(sub_elements, render_args)
+        self.populate_layer_info(sub_elements['renders'], render_args['layer_info'])
         return root
 
     def create_sub_elements(self, root, elements):
@@ -127,11 +544,9 @@ class Dispatcher(object):
 
     def get_path_formulas(self):
         if self.wip_ctx.is_assembly():
-            self.archive_formula = 'am_wip_backup_version_dir'
-            self.submission_formula = 'am_render_dispatcher_dir'
+            self.archive_formula, self.submission_formula = PATH_FORMULAS['assembly']
         elif self.wip_ctx.is_shot():
-            self.archive_formula = 'sh_wip_backup_version_dir'
-            self.submission_formula = 'sh_render_dispatcher_dir'
+            self.archive_formula, self.submission_formula = PATH_FORMULAS['shot']
         else:
             raise AttributeError( "Currently unknown path formulas for dispatcher")
 
@@ -150,25 +565,256 @@ class Dispatcher(object):
         bug when attempting to pass around a QubeSubmitter.
         """
         # Create base qube submitter
-        submitter = self.create_qube_jobs()
-        submitter.submit()
+        with self.timed('create_qube_jobs'):
+            submitter = self.create_qube_jobs()
+        with self.timed('qube_submit'):
+            submitter.submit()
         job_ids = submitter.get_job_ids()
+        if self.use_spool:
+            self.spool_ifd_jobs(job_ids)
         return job_ids
 
-    def create_qube_jobs(self):
+    def create_qube_jobs(self, submitter=None):
         """(farm_lib.qube_submitter.QubeSubmitter)
         *Currently deprecated.  Use submit_jobs instead* Create the qube jobs
         for the render passes.  The first job that is created is the Houdini job
         which will create the mantra nodes for each pass, apply all the
         settings, and create the IFDs.  Each Mantra pass job is created as an
         after job that will call the Mantra executer and render the IFDs.
+        The jobs are added to the given submitter, or to a new one.
 
         """
         # Create base qube submitter
-        submitter = QubeSubmitter()
-        mgr = SessionManager.inst()
-        env = mgr.env_manager
-        app_versions = env.get_app_versions_dict()
+        if submitter is None:
+            submitter = self.backend.create_submitter()
+        app_versions = self.session.app_versions
+        for indices, frames, name in self.ifd_work_units():
+            if all(self.spools(i) for i in indices):
+                unit = SpoolUnit(self.job_args_for(indices, name, frames))
+                for i in indices:
+                    self.ifd_jobs.setdefault(i, []).append((frames, unit))
+            else:
+                self.create_ifd_job(submitter, app_versions, indices, name, frames)
+        # Add all the IFD dependent jobs
+        self.create_dependent_jobs(submitter, app_versions)
+        return submitter
+
+    def ifd_work_units(self):
+        """(list) The (layer indices, frames, name) of every IFD creation
+        job.  Layers distributed by frame chunk get a job per chunk, layers
+        that stream to mantra a job each, the layers of a pack a job per pack
+        and the others are grouped by ifd_group_size, see ifd_layer_groups.
+        frames is None when a job uses the frame ranges of its layers.
+
+        """
+        chunked = [i for i, layer in enumerate(self.layer_info)
+                   if layer.hbatch_dist == HBATCH_FRAME_CHUNK]
+        streamed = [i for i in range(len(self.layer_info)) if self.streams(i)]
+        packs = self.layer_packs
+        packed = [i for indices in packs for i in indices]
+        whole = [i for i in range(len(self.layer_info))
+                 if i not in chunked and i not in streamed and i not in packed]
+        units = []
+        groups = self.ifd_layer_groups(whole)
+        for number, indices in enumerate(groups):
+            name = ''
+            if len(groups) > 1:
+                if self.ifd_group_size == 1 and len(indices) == 1:
+                    name = self.layer_info[indices[0]].layer
+                else:
+                    name = 'part{0:02d}'.format(number + 1)
+            units.append((indices, None, name))
+        for i in chunked:
+            layer = self.layer_info[i]
+            # The first chunks hold the frames that render first
+            frames = self.order_frames(
+                frame_utils.expand_frames(str(layer.frame_range)))
+            chunks = frame_utils.chunk_frames(frames, self.chunk_size(layer.layer))
+            for number, chunk in enumerate(chunks):
+                name = '{0}_c{1:02d}'.format(layer.layer, number + 1)
+                units.append(([i], frame_utils.compress_frames(chunk), name))
+        for i in streamed:
+            units.append(([i], None, '{0}_direct'.format(self.layer_info[i].layer)))
+        # A pack is written by a single job, which then puts its IFDs together
+        for number, indices in enumerate(packs):
+            units.append((indices, None, 'pack{0:02d}'.format(number + 1)))
+        return units
+
+    @property
+    def layer_packs(self):
+        """(list) The layer indices rendered together in one mantra task
+        per frame, see layer_packing.  Chunked, streamed and split stereo
+        layers are never packed.
+
+        """
+        if not self.pack_layers:
+            return []
+        indices = [i for i, layer in enumerate(self.layer_info)
+                   if layer.hbatch_dist != HBATCH_FRAME_CHUNK and
+                   not self.streams(i) and not self.layer_eyes(i) and
+                   not self.tiled(i)]
+        return layer_packing.pack(
+            self.layer_info, indices, history_path=self.render_history_path,
+            pixels=self.pixels)
+
+    @property
+    def pixels(self):
+        """(int) The pixels of a frame. """
+        return int(self.resolution.width) * int(self.resolution.height)
+
+    def tiled(self, index):
+        """(bool) Whether the frames of a layer are rendered in tiles, each
+        by its own mantra job, and stitched together afterwards.  Streamed
+        layers never write the IFDs this needs.
+
+        """
+        return self.tiles > 1 and not self.streams(index)
+
+    @property
+    def pack_paths(self):
+        """(list) The IFD path of the pack of every layer, None for the
+        layers rendered on their own.
+
+        """
+        paths = [None] * len(self.layer_info)
+        for number, indices in enumerate(self.layer_packs):
+            path = layer_packing.pack_path(
+                self.submission_path, self.submission_basename, number + 1,
+                self.hou_frame_pattern)
+            for i in indices:
+                paths[i] = path
+        return paths
+
+    def streams(self, index):
+        """(bool) Whether a layer is rendered by mantra straight from its
+        IFD job, without writing IFDs to disk.  Repairs and incremental
+        submissions always write IFDs, so that they can be rendered again,
+        and so do the options that work on the IFDs: held frames, the
+        render cache, IFD retention and tiles.
+
+        """
+        if self.repair or self.incremental:
+            return False
+        if (self.skip_held_frames or self.reuse_renders or self.ifd_policy or
+                self.tiles > 1):
+            return False
+        return self.layer_info[index].hbatch_dist == HBATCH_DIRECT
+
+    def merge_key(self, index):
+        """(tuple) What the passes of two layers need in common to be merged, on
+        top of what only the scene tells, see rhou.render.merge_passes.
+
+        """
+        layer = self.layer_info[index]
+        return (layer.pass_type, str(layer.frame_range), layer.camera,
+                layer.left_eye, layer.right_eye, tuple(self.layer_eyes(index)))
+
+    def ifd_layer_groups(self, indices=None):
+        """(list) The given layer indices, all of them by default, split
+        into the groups of the IFD creation jobs of ifd_group_size layers
+        each.  An ifd_group_size of 0 puts every layer in the same job.
+        Passes are only merged within a job, so with merge_passes the
+        layers that may be merged get a job of their own, however many
+        they are.
+
+        """
+        if indices is None:
+            indices = range(len(self.layer_info))
+        groups = []
+        if self.merge_passes:
+            by_key = {}
+            for i in indices:
+                by_key.setdefault(self.merge_key(i), []).append(i)
+            groups = [group for group in by_key.values() if len(group) > 1]
+            merged = set(i for group in groups for i in group)
+            indices = [i for i in indices if i not in merged]
+        size = self.ifd_group_size or len(indices) or 1
+        groups.extend(indices[i:i + size] for i in range(0, len(indices), size))
+        return sorted(groups)
+
+    @property
+    def ifd_history_path(self):
+        """(str) The IFD generation times recorded for this shot. """
+        return os.path.join(self.submission_path, ifd_history.HISTORY_NAME)
+
+    @property
+    def render_history_path(self):
+        """(str) The render times recorded for this shot. """
+        return render_history.history_path(self.submission_path)
+
+    def chunk_size(self, layer_name):
+        """(int) The number of frames per IFD chunk of a layer, so that each
+        chunk takes about chunk_seconds going by the shot's IFD history.
+
+        """
+        seconds = ifd_history.seconds_per_frame(self.ifd_history_path, layer_name)
+        if not seconds:
+            return DEFAULT_CHUNK_SIZE
+        return max(1, int(self.chunk_seconds / seconds))
+
+    @property
+    def use_spool(self):
+        """(bool) Whether the IFDs are written by the hbatch workers of a
+        spool.  A submission that waits for another job needs qube to hold
+        its IFD jobs, so it never uses the spool.  Only the workers release
+        the render jobs, which wait forever when none is running, see
+        check_spool.
+
+        """
+        return bool(self.spool_dir) and not self.after_job
+
+    def spools(self, index):
+        """(bool) Whether the IFDs of a layer are written by the spool.
+        Streamed layers render on the host of their own IFD job instead.
+
+        """
+        return self.use_spool and not self.streams(index)
+
+    def check_spool(self):
+        """ Fail a submission to a spool that no hbatch worker reads. """
+        if not any(self.spools(i) for i in range(len(self.layer_info))):
+            return
+        if not spool.live_workers(self.spool_dir):
+            raise RuntimeError('No hbatch worker is running on the spool '
+                               '{0}'.format(self.spool_dir))
+
+    def spool_ifd_jobs(self, job_ids):
+        """ Hand the IFD work units to the warm hbatch workers of the spool,
+        once the jobs waiting on them are submitted.  Nothing waits for the
+        workers, each of them releases the held jobs of its unit when it is
+        done.  The jobs of a unit that failed stay held.
+
+        """
+        units = []
+        for ifd_jobs in self.ifd_jobs.values():
+            for frames, unit in ifd_jobs:
+                if isinstance(unit, SpoolUnit) and unit not in units:
+                    units.append(unit)
+        with self.timed('spool_submit'):
+            for unit in units:
+                spool.submit(self.spool_dir, self.scene_archive_path,
+                             unit.job_args,
+                             [job_ids[label] for label in unit.labels
+                              if label in job_ids])
+
+    def add_ifd_dependency(self, job, label, ifd_job):
+        """ Make a job wait on the IFD job that writes its IFDs, or on the
+        spool when ifd_job is a SpoolUnit.
+
+        """
+        if isinstance(ifd_job, SpoolUnit):
+            ifd_job.labels.append(label)
+        elif ifd_job is not None:
+            job.add_dependency(ifd_job, QubeEventName.COMPLETE)
+
+    def create_ifd_job(self, submitter, app_versions, indices, name='',
+                       frames=None):
+        """ Create the Houdini job that sets up the mantra nodes and writes
+        the IFDs for the given layer indices.  name tells the jobs of a shot
+        apart when IFD creation is split.  frames limits the job to a frame
+        chunk.
+
+        """
         hou_version = app_versions[Application.HOU]
         kwargs = {}
         # Requirements that need to be determined
@@ -177,57 +823,371 @@ class Dispatcher(object):
         kwargs['cpus'] = self.cpus
         kwargs['allow_local'] = False
         kwargs['requirements'] = ['host.dead_hbatch=1']
-        executer = HouExecuter(
-            self.wip_ctx,
-            app_versions,
-            py_args = self.render_args,
-            startup_scene = self.scene_archive_path,
-        )
+        cluster = 'dead_hbatch'
+        if all(self.streams(i) for i in indices):
+            # Mantra renders on the same host, so the job needs a render node
+            kwargs.update(self.generate_layer_settings(self.layer_info[indices[0]]))
+            cluster = 'dead'
+        with self.timed('hou_executer'):
+            executer = self.backend.create_hou_executer(
+                self.wip_ctx,
+                app_versions,
+                py_args = self.job_args_for(indices, name, frames),
+                startup_scene = self.scene_archive_path,
+            )
         executer.batch_mode = True
         executer.py_script = self.py_script
-        cluster = 'dead_hbatch'
-        qube_job = QubeJob(
+        label = 'IFD_Creation_{seq}_{shot}'.format(seq=self.wip_ctx.sequence,
+                                                   shot=self.wip_ctx.shot)
+        if name:
+            label = '{0}_{1}'.format(label, name)
+        qube_job = self.backend.create_job(
             executer,
             JobType.PROCESS,
             cluster,
             mailaddress=self.email_address,
-            label='IFD_Creation_{seq}_{shot}'.format(seq=self.wip_ctx.sequence,
-                                                     shot=self.wip_ctx.shot),
+            label=label,
             **kwargs
         )
         if self.after_job:
             qube_job.add_dependency(self.after_job, QubeEventName.COMPLETE)
 
         qube_job = self.add_email_callback(qube_job)
+        self.add_job(submitter, qube_job, label)
+        for i in indices:
+            self.ifd_jobs.setdefault(i, []).append((frames, qube_job))
+        return qube_job
+
+    def add_job(self, submitter, qube_job, label):
+        """ Append a job to the submitter and remember it belongs to this
+        dispatcher.
+
+        """
+        self.job_labels.append(label)
         submitter.append(qube_job)
-        # Add all the IFD dependent jobs
-        # self.create_dependent_jobs(submitter, app_versions)
-        return submitter
+
+    def filter_job_ids(self, job_ids):
+        """(dict) The job ids of a submitter that belong to this dispatcher.
+        This is how a batch submission splits its ids per shot.
+
+        """
+        return dict((label, job_ids[label]) for label in self.job_labels
+                    if label in job_ids)
 
     def create_dependent_jobs(self, submitter, app_versions):
-        """ Create the dependent MantraExecuter job that will render the IFDs
-        when they are created.
+        """ Create the dependent MantraExecuter jobs that will render the IFDs
+        when they are created.  Every IFD creation job of a layer gets its
+        own render job for the same frames, so the frames of a chunk start
+        rendering as soon as the chunk is written instead of waiting on the
+        whole layer.
 
         """
-        mantra_jobs = []
+        packs = self.layer_packs
+        packed = [i for indices in packs for i in indices]
         for i, layer in enumerate(self.layer_info):
-            frame_range = FrameSet.parse(layer['frame_range'])
-            executer = MantraExecuter(self.wip_ctx, self.ifd_paths[i], app_versions)
-            job_settings = self.generate_layer_settings(layer)
-            cluster = 'dead'
-            job = QubeJob(
-                executer,
-                JobType.RENDER,
-                cluster,
-                label='Render_{0}'.format(layer['layer']),
-                mailaddress=self.email_address,
-                **job_settings
-            )
-            job.add_dependency(submitter[0], QubeEventName.COMPLETE)
-            job = self.add_email_callback(job)
-            # Allow user to change the distribution
-            job.agendas = QubeAgenda.gen_frame_set_tasks([frame_range], FrameDistribution.SINGLE)
-            submitter.append(job)
+            if self.streams(i):
+                # Already rendered by its IFD job
+                continue
+            if i in packed:
+                continue
+            ifd_jobs = self.ifd_jobs[i]
+            for number, (frames, ifd_job) in enumerate(ifd_jobs):
+                label = 'Render_{seq}_{shot}_{layer}'.format(
+                    seq=self.wip_ctx.sequence, shot=self.wip_ctx.shot,
+                    layer=layer.layer)
+                if len(ifd_jobs) > 1:
+                    label = '{0}_c{1:02d}'.format(label, number + 1)
+                frame_set = FrameSet.parse(frames) if frames else layer.frame_range
+                for eye in self.layer_eyes(i) or [None]:
+                    eye_label = label
+                    if eye:
+                        eye_label = '{0}_{1}'.format(label, EYE_DIRS[eye])
+                    if not self.tiled(i):
+                        self.create_render_job(submitter, app_versions, i,
+                                               eye_label, frame_set, ifd_job,
+                                               eye, frames)
+                        continue
+                    tile_jobs = []
+                    for tile in range(self.tiles):
+                        tile_jobs.append(self.create_render_job(
+                            submitter, app_versions, i,
+                            '{0}_t{1:02d}'.format(eye_label, tile), frame_set,
+                            ifd_job, eye, frames, tile))
+                    self.create_stitch_job(submitter, app_versions, i,
+                                           eye_label.replace('Render_', 'Stitch_', 1),
+                                           frame_set, tile_jobs, eye)
+        for number, indices in enumerate(packs):
+            self.create_pack_job(submitter, app_versions, number + 1, indices)
+        if self.ifd_policy:
+            with self.timed('ifd_registry'):
+                self.register_ifds()
+
+    @property
+    def ifd_registry_dir(self):
+        """(str) The IFD retention registry of this shot. """
+        return ifd_retention.registry_dir(self.submission_path)
+
+    def register_ifds(self):
+        """ Track the IFD directory of every layer version for retention,
+        along with the render jobs that report back on it.
+
+        """
+        for layer, output in zip(self.layer_info, self.snapshot):
+            ifd_dir = os.path.dirname(output.ifd_path)
+            if ifd_dir not in self.retention_jobs:
+                continue
+            ifd_retention.register(
+                self.ifd_registry_dir, ifd_dir, self.wip_ctx.sequence,
+                self.wip_ctx.shot, layer.layer, output.version.number,
+                self.retention_jobs[ifd_dir])
+
+    @property
+    def render_cache_dir(self):
+        """(str) The render cache of this shot. """
+        return render_cache.cache_dir(self.submission_path)
+
+    def cached_frames(self):
+        """(dict) The number of frames of every layer the render cache
+        holds, for the layers that have any.  Which of them a submission
+        reuses is only known once its IFDs are written and hashed, see
+        render_cache.reuse_frames.
+
+        """
+        counts = {}
+        for layer in self.layer_info:
+            count = render_cache.cached_count(self.render_cache_dir, layer.layer)
+            if count:
+                counts[layer.layer] = count
+        return counts
+
+    def add_render_cache_callback(self, qube_job, layer_name, ifd_path,
+                                  image_path, frame_set):
+        """ Add the frames of a render job to the render cache once they
+        are done.
+
+        """
+        lang = QubeLanguage.get_enum('python')
+        code = (
+            "from lightning import render_cache;"
+            "render_cache.on_render_complete({0!r}, {1!r}, {2!r}, {3!r}, {4!r})"
+        ).format(self.render_cache_dir, layer_name, ifd_path, image_path,
+                 str(frame_set))
+        qube_job.add_callback(code, QubeTrigger.get_complete_self_trigger(), language=lang)
+        return qube_job
+
+    def add_render_history_callback(self, qube_job, layer_name, ifd_path):
+        """ Record the render times of a job once it is done, see
+        layer_packing.estimate.  Frames whose IFD only quits, those of a
+        merged pass for instance, are left out.
+
+        """
+        lang = QubeLanguage.get_enum('python')
+        code = (
+            "from lightning import render_history;"
+            "render_history.on_render_complete({0!r}, {1!r}, {2!r}, {3!r})"
+        ).format(self.render_history_path, layer_name, self.pixels, ifd_path)
+        qube_job.add_callback(code, QubeTrigger.get_complete_self_trigger(), language=lang)
+        return qube_job
+
+    def add_retention_callbacks(self, qube_job, label, ifd_path, frame_set):
+        """ Let the IFD retention know when the frames of a render job are
+        done or failed.  The job is registered under its label and the name
+        of the submission, see register_ifds.
+
+        """
+        lang = QubeLanguage.get_enum('python')
+        ifd_dir = os.path.dirname(ifd_path)
+        job = '{0}/{1}'.format(self.submission_basename, label)
+        self.retention_jobs.setdefault(ifd_dir, []).append(job)
+        frames = str(frame_set)
+        complete_code = (
+            "from lightning import ifd_retention;"
+            "ifd_retention.on_render_complete({0!r}, {1!r}, {2!r}, {3!r}, {4!r})"
+        ).format(self.ifd_registry_dir, ifd_dir, job, frames,
+                 self.ifd_policy.to_dict())
+        failed_code = (
+            "from lightning import ifd_retention;"
+            "ifd_retention.on_render_failed({0!r}, {1!r}, {2!r}, {3!r})"
+        ).format(self.ifd_registry_dir, ifd_dir, job, frames)
+        qube_job.add_callback(complete_code, QubeTrigger.get_complete_self_trigger(), language=lang)
+        qube_job.add_callback(failed_code, QubeTrigger.get_fail_self_trigger(), language=lang)
+        return qube_job
+
+    def layer_eyes(self, index):
+        """(list) The eyes whose IFDs are written and rendered separately
+        for a layer.  Empty unless split_stereo is set and the layer renders
+        both eyes, in which case its IFD job writes both from one take set
+        up and every eye gets its own render job.
+
+        """
+        if self.split_stereo and self.layer_info[index].stereo:
+            return list(EYES)
+        return []
+
+    def create_render_job(self, submitter, app_versions, index, label,
+                          frame_set, ifd_job, eye=None, frames=None,
+                          tile=None):
+        """ Create the Mantra job rendering some frames of a layer once the
+        IFD job that writes them is complete.  ifd_job is a SpoolUnit when
+        the IFDs are written by the spool.  eye renders the IFDs of a single
+        eye of a split stereo layer.  frames are the frames of a chunk, see
+        frame_agendas.  tile renders a single tile of a tiled layer.
+
+        """
+        layer = self.layer_info[index]
+        ifd_path = self.ifd_paths[index]
+        if eye:
+            ifd_path = eye_path(ifd_path, eye)
+        if tile is not None:
+            ifd_path = tile_path(ifd_path, tile)
+        with self.timed('mantra_executer'):
+            executer = self.backend.create_mantra_executer(
+                self.wip_ctx, ifd_path, app_versions)
+        job_settings = self.generate_layer_settings(layer)
+        if isinstance(ifd_job, SpoolUnit):
+            job_settings['status'] = HELD_STATUS
+        cluster = 'dead'
+        job = self.backend.create_job(
+            executer,
+            JobType.RENDER,
+            cluster,
+            label=label,
+            mailaddress=self.email_address,
+            **job_settings
+        )
+        self.add_ifd_dependency(job, label, ifd_job)
+        job = self.add_email_callback(job)
+        # The times of tiles do not tell what a frame costs, nor are their
+        # images frames the render cache could provide
+        if tile is None:
+            job = self.add_render_history_callback(job, layer.layer, ifd_path)
+        if self.reuse_renders and tile is None:
+            image_path = self.render_paths[index]
+            if eye:
+                image_path = eye_path(image_path, eye)
+            job = self.add_render_cache_callback(job, layer.layer, ifd_path,
+                                                 image_path, frame_set)
+        if self.ifd_policy:
+            job = self.add_retention_callbacks(job, label, self.ifd_paths[index],
+                                               frame_set)
+        # Allow user to change the distribution
+        job.agendas = self.frame_agendas(frame_set, frames)
+        self.add_job(submitter, job, label)
+        return job
+
+    def create_stitch_job(self, submitter, app_versions, index, label,
+                          frame_set, tile_jobs, eye=None):
+        """ Create the job that stitches the tiles of some frames of a layer
+        into its images, see exr_stitch, once all of them are rendered.  It
+        is a plain python process, Houdini has no OpenEXR bindings.
+
+        """
+        layer = self.layer_info[index]
+        image_path = self.render_paths[index]
+        if eye:
+            image_path = eye_path(image_path, eye)
+        py_args = {
+            'image_path' : image_path,
+            'tile_paths' : [tile_path(image_path, tile)
+                            for tile in range(self.tiles)],
+            'frames' : str(frame_set),
+        }
+        with self.timed('python_executer'):
+            executer = self.backend.create_python_executer(
+                self.wip_ctx, app_versions, py_args=py_args)
+        executer.py_script = path_lib.join(os.environ['PKG_LIGHTNING'],
+                                           STITCH_SCRIPT)
+        job = self.backend.create_job(
+            executer,
+            JobType.PROCESS,
+            'dead_hbatch',
+            label=label,
+            mailaddress=self.email_address,
+            priority=layer.priority,
+            cpus=1,
+            allow_local=False,
+            requirements=['host.dead_hbatch=1'],
+        )
+        for tile_job in tile_jobs:
+            job.add_dependency(tile_job, QubeEventName.COMPLETE)
+        job = self.add_email_callback(job)
+        self.add_job(submitter, job, label)
+        return job
+
+    def create_pack_job(self, submitter, app_versions, number, indices):
+        """ Create the Mantra job rendering a pack of layers, one task per
+        frame of any of them, once the IFD job of the pack is complete.
+
+        """
+        layers = [self.layer_info[i] for i in indices]
+        label = 'Render_{seq}_{shot}_pack{number:02d}'.format(
+            seq=self.wip_ctx.sequence, shot=self.wip_ctx.shot, number=number)
+        frames = set()
+        for layer in layers:
+            frames.update(frame_utils.expand_frames(str(layer.frame_range)))
+        frame_set = FrameSet.parse(frame_utils.compress_frames(sorted(frames)))
+        with self.timed('mantra_executer'):
+            executer = self.backend.create_mantra_executer(
+                self.wip_ctx, self.pack_paths[indices[0]], app_versions)
+        job_settings = self.generate_layer_settings(layers[0])
+        job_settings['cpus'] = max(layer.cpus for layer in layers)
+        job_settings['priority'] = min(layer.priority for layer in layers)
+        ifd_job = self.ifd_jobs[indices[0]][0][1]
+        if isinstance(ifd_job, SpoolUnit):
+            job_settings['status'] = HELD_STATUS
+        cluster = 'dead'
+        job = self.backend.create_job(
+            executer,
+            JobType.RENDER,
+            cluster,
+            label=label,
+            mailaddress=self.email_address,
+            **job_settings
+        )
+        self.add_ifd_dependency(job, label, ifd_job)
+        job = self.add_email_callback(job)
+        if self.reuse_renders:
+            for i in indices:
+                job = self.add_render_cache_callback(
+                    job, self.layer_info[i].layer, self.ifd_paths[i],
+                    self.render_paths[i], self.layer_info[i].frame_range)
+        if self.ifd_policy:
+            for i in indices:
+                job = self.add_retention_callbacks(
+                    job, label, self.ifd_paths[i], self.layer_info[i].frame_range)
+        job.agendas = self.frame_agendas(frame_set)
+        self.add_job(submitter, job, label)
+        return job
+
+    def order_frames(self, frames):
+        """(list) The frames in the order they are rendered.  With
+        FRAME_ORDER_KEY_FIRST the hero and key frames come first and the
+        others are spread over the range.  FRAME_ORDER_PROGRESSIVE renders
+        every progressive_step-th frame before the frames in between.  Either
+        way the whole shot can be looked at long before the job is done.
+
+        """
+        if self.frame_order == FRAME_ORDER_KEY_FIRST:
+            return frame_utils.key_frames_first(frames, self.key_frames)
+        if self.frame_order == FRAME_ORDER_PROGRESSIVE:
+            return frame_utils.progressive_frames(frames, self.progressive_step)
+        return list(frames)
+
+    def frame_agendas(self, frame_set, frames=None):
+        """(list) The qube tasks of a render job, one per frame, in the
+        order of order_frames.  The frames of a chunk were cut out of that
+        order already, so they are kept as they are.
+
+        """
+        if self.frame_order != FRAME_ORDER_SEQUENTIAL:
+            if frames:
+                frames = frame_utils.expand_frames(frames)
+            else:
+                frames = self.order_frames(frame_utils.expand_frames(str(frame_set)))
+            return QubeAgenda.gen_frame_set_tasks(
+                [FrameSet.parse(str(frame)) for frame in frames],
+                FrameDistribution.SINGLE)
+        return QubeAgenda.gen_frame_set_tasks([frame_set], FrameDistribution.SINGLE)
 
     def generate_layer_settings(self, layer):
         """(dict) Generate a dictionary to set the qube jobs for layer
@@ -235,8 +1195,8 @@ class Dispatcher(object):
 
         """
         settings = {}
-        settings['cpus'] = layer['cpus']
-        settings['priority'] = layer['priority']
+        settings['cpus'] = layer.cpus
+        settings['priority'] = layer.priority
         settings['allow_local'] = False
         settings['requirements'] = ['host.dead=1']
         return settings
@@ -251,114 +1211,447 @@ class Dispatcher(object):
                 return cam_inst.name
         return ''
 
-    def populate_image_info(self, sub_elements):
+    def populate_image_info(self, sub_elements, render_args):
         """ Populate the image information like shot, sequence, format,
         and resolution.
         """
-        sub_elements['shot'].set('sequence', str(self.wip_ctx.sequence))
-        sub_elements['shot'].set('shot', str(self.wip_ctx.shot))
-        sub_elements['resolution'].set('width', str(self.resolution.width))
-        sub_elements['resolution'].set('height', str(self.resolution.height))
-        sub_elements['resolution'].set('aspect', str(self.resolution.aspect))
-        sub_elements['output'].set('format', self.outformat)
+        width, height = render_args['resolution']
+        sub_elements['shot'].set('sequence', str(render_args['sequence']))
+        sub_elements['shot'].set('shot', str(render_args['shot']))
+        sub_elements['resolution'].set('width', str(width))
+        sub_elements['resolution'].set('height', str(height))
+        sub_elements['resolution'].set('aspect', str(render_args['aspect']))
+        sub_elements['output'].set('format', render_args['outformat'])
 
-    def populate_layer_info(self, renders):
+    def populate_layer_info(self, renders, layer_info):
         """ Populate each layer information. """
-        for layer in self.layer_info:
-            render = xml_utils.ElementTree.SubElement(renders, 'render')
-            render.set('layer', layer['layer'])
-            render.set('right', layer['renderRightEye'])
-            render.set('left', layer['renderLeftEye'])
-            render.set('proc', layer['cpus'])
-            render.set('priority', layer['priority'])
-            render.set('range', layer['frame_range'])
-            render.set('up', layer['up'])
-            render.set('camera', layer['camera'])
-
-    def stringify_elements(self):
-        """ Xml doesn't like things not string.  Stringify them. """
-        for layer in self.layer_info:
-            for key, attr in layer.iteritems():
-                layer[key] = str(attr)
+        for layer in layer_info:
+            xml_utils.ElementTree.SubElement(renders, 'render',
+                                             layer.xml_attributes())
+
+    def write_submission(self):
+        """ Create the submission xml and the manifest and write them next
+        to the archive.  Both are made from the same render arguments.  A
+        test only submission renders nothing, so it writes no manifest that
+        the next incremental submission could take for a submitted one.
+
+        """
+        render_args = self.render_args
+        with self.timed('create_xml'):
+            root = self.create_xml(render_args)
+        with self.timed('write_xml'):
+            self.write_xml(root, self.xml_path)
+        if self.test_only:
+            return
+        with self.timed('write_manifest'):
+            manifest.write(self.manifest_path, render_args)
+
+    def write_render_args(self):
+        """ Keep the render arguments of a test only submission for
+        inspection, nothing goes to the farm.
+
+        """
+        with open(self.render_args_path, 'w') as myFile:
+            myFile.write(obj_to_str(self.render_args, useb64encode=True))
+
+    @classmethod
+    def submit_batch(cls, specs, resolution, outformat,
+                     workers=BATCH_WORKERS, **kwargs):
+        """(list) Submit a whole batch of shots in one go.  specs is a list
+        of (wip_ctx, path_ctx, layer_info) tuples.  The shots share one
+        SubmissionSession and all of their jobs go to the farm through a
+        single QubeSubmitter.  Any extra keyword arguments are passed on to
+        every Dispatcher, test_only included.
+
+        The dispatchers are built one after the other, so output versions
+        are allocated and saved in order.  Their scenes archive in the
+        background meanwhile, no more than workers at once, and a pool of
+        as many workers then waits on the archives and writes the
+        submissions.
+
+        Returns the dispatcher and its SubmissionResult for every spec, in
+        order.
+
+        """
+        session = SubmissionSession(kwargs.pop('backend', None),
+                                    archive_workers=workers)
+        dispatchers = [cls(wip_ctx, path_ctx, resolution, outformat,
+                           layer_info, session=session, **kwargs)
+                       for wip_ctx, path_ctx, layer_info in specs]
+
+        def write_submission(dispatcher):
+            dispatcher.write_submission()
+            if dispatcher.test_only:
+                dispatcher.write_render_args()
+
+        pool = ThreadPool(max(1, min(workers, len(specs))))
+        try:
+            pool.map(write_submission, dispatchers)
+        finally:
+            pool.close()
+            pool.join()
+
+        submitted = [dispatcher for dispatcher in dispatchers
+                     if not dispatcher.test_only]
+        job_ids = {}
+        if submitted:
+            submitter = session.backend.create_submitter()
+            for dispatcher in submitted:
+                with dispatcher.timed('create_qube_jobs'):
+                    dispatcher.create_qube_jobs(submitter)
+            start = time.time()
+            submitter.submit()
+            submit_seconds = time.time() - start
+            job_ids = submitter.get_job_ids()
+            for dispatcher in submitted:
+                if dispatcher.use_spool:
+                    dispatcher.spool_ifd_jobs(job_ids)
+                # The single submit is shared by every shot of the batch
+                dispatcher.timings['qube_submit'] = {
+                    'start' : start, 'seconds' : submit_seconds, 'calls' : 1}
+        return [(dispatcher, dispatcher.finish_submission(
+                    dispatcher.filter_job_ids(job_ids)))
+                for dispatcher in dispatchers]
 
     def submit(self):
-        """ (dict) Create the xml and submit all the jobs. """
-        root = self.create_xml()
-        self.write_xml(root, self.xml_path)
+        """ (SubmissionResult) Create the xml and submit all the jobs.  The
+        scene archive is only waited on once the xml has to be written.  The
+        timings of the submission are logged and returned with the job ids.
+
+        """
+        self.write_submission()
 
         if self.test_only:
-            with open('/people/slu/renderArgs.txt', 'w') as myFile:
-                myFile.write(obj_to_str(self.render_args, useb64encode=True))
+            self.write_render_args()
+            job_ids = {}
         else:
             job_ids = self.submit_jobs()
-        return job_ids
+        return self.finish_submission(job_ids)
+
+    @property
+    def layer_info(self):
+        """(list) The LayerSpec of every layer of this submission. """
+        return self._layer_info
+
+    @layer_info.setter
+    def layer_info(self, layer_info):
+        self._layer_info = layer_info
+        self.invalidate_snapshot()
+
+    @property
+    def output_versions(self):
+        """(list) The WipOutputVersion of every layer. """
+        return self._output_versions
+
+    @output_versions.setter
+    def output_versions(self, versions):
+        self._output_versions = versions
+        self.invalidate_snapshot(wip_outputs=False)
+
+    def invalidate_snapshot(self, wip_outputs=True):
+        """ Drop the resolved outputs so they are looked up again.  This has
+        to be called whenever the layers are modified in place.  Assigning
+        layer_info or output_versions does it automatically.
+
+        """
+        self._snapshot = None
+        if wip_outputs:
+            self._wip_outputs = None
+
+    @property
+    def snapshot(self):
+        """(list) The LayerOutput of every layer.  It is resolved once and
+        shared by all of the path properties until invalidated.
+
+        """
+        if self._snapshot is None:
+            self._snapshot = [
+                LayerOutput(wip_output, version)
+                for wip_output, version in zip(self.wip_outputs,
+                                               self.output_versions)
+            ]
+        return self._snapshot
 
     @property
     def base_render_path(self):
         """Returns the base path for the renders"""
-        return self.wip_outputs[0].get_output_base_dirs()[1]
+        return self.snapshot[0].render_base_dir
 
     @property
     def base_ifd_path(self):
         """Returns the base path for the IFDs"""
-        return self.wip_outputs[0].get_output_base_dirs()[0]
+        return self.snapshot[0].ifd_base_dir
 
     @property
     def render_base_dir(self):
         """ Returns the base directory path for a render folder. """
-        return [wip_output.get_output_base_dirs()[1] for wip_output in self.wip_outputs]
+        return [output.render_base_dir for output in self.snapshot]
 
     @property
     def render_paths(self):
         """Returns a list of render paths for each pass. """
-        render_paths = []
-        for version in self.output_versions:
-            render_paths.append(version.get_path())
-        return render_paths
+        return [output.image_path for output in self.snapshot]
 
     @property
     def ifd_paths(self):
         """Returns a list of IFD paths for each pass. """
-        ifd_paths = []
-        for version in self.output_versions:
-            ifd_paths.append(version.get_path(WipOutputType.MANTRA_IFD))
-        return ifd_paths
+        return [output.ifd_path for output in self.snapshot]
 
     @property
     def render_args(self):
-        """ Return all the arguments to pass to the houdini script. """
+        """ Return all the arguments to pass to the houdini script.  This is
+        what goes in the manifest.
+
+        """
         return {
             'xml_path' : self.xml_path,
             'path_ctx' : self.path_ctx,
+            'sequence' : self.wip_ctx.sequence,
+            'shot' : self.wip_ctx.shot,
+            'resolution' : (int(self.resolution.width),
+                            int(self.resolution.height)),
+            'aspect' : self.resolution.aspect,
+            'outformat' : self.outformat,
             'image_paths' : self.render_paths,
             'ifd_paths' : self.ifd_paths,
             'render_scene' : self.scene_archive_path,
-            'layer_info' : self.layer_info
+            'saved_scene' : self.prepared_scene_path,
+            'history_path' : self.ifd_history_path,
+            'scene_hash' : self.scene_hash,
+            'requested_layers' : self.requested_layers,
+            'layer_info' : self.layer_info,
+            'eyes' : [self.layer_eyes(i) for i in range(len(self.layer_info))],
+            'stream' : [self.streams(i) for i in range(len(self.layer_info))],
+            'pack_paths' : self.pack_paths,
+            'merge_passes' : self.merge_passes,
+            'skip_held_frames' : self.skip_held_frames,
+            'render_cache' : self.render_cache_dir if self.reuse_renders else None,
+            'tiles' : [self.tiles if self.tiled(i) else 0
+                       for i in range(len(self.layer_info))],
+        }
+
+    def render_args_for(self, indices, name='', frames=None):
+        """(dict) The houdini script arguments for a subset of the layers,
+        as the job will read them from the manifest.
+
+        """
+        return manifest.job_args(self.render_args, indices, name, frames)
+
+    def job_args_for(self, indices, name='', frames=None):
+        """(dict) The arguments handed to an IFD job.  Everything else is
+        read from the manifest.
+
+        """
+        return {
+            'manifest_path' : self.manifest_path,
+            'layers' : list(indices),
+            'name' : name,
+            'frames' : frames,
         }
 
     @property
     def wip_outputs(self):
-        wip_outputs = []
-        for layer in self.layer_info:
-            wip_output = self.wip_output_mgr.get_wip_output(layer['layer'])
-            wip_outputs.append(wip_output)
-        return wip_outputs
+        """(list) The WipOutput of every layer, looked up once. """
+        if self._wip_outputs is None:
+            self._wip_outputs = [
+                self.wip_output_mgr.get_wip_output(layer.layer)
+                for layer in self.layer_info
+            ]
+        return self._wip_outputs
 
     def get_output_versions(self):
-        """ Returns the list of WipOutputVersion for every pass. """
-        versions = []
+        """ Returns the list of WipOutputVersion for every pass.  The target
+        version of every layer is worked out before anything is written, and
+        only then are they saved.
+
+        """
+        allocations = self.allocate_output_versions()
+        if not self.repair:
+            self.save_output_versions(allocations)
+        return [allocation[0] for allocation in allocations]
+
+    def allocate_output_versions(self):
+        """(list) Work out the target version of every layer without writing
+        anything.  Each entry is a (version, is_new, previous_note) tuple so
+        that a failed save can be rolled back.
+
+        """
+        allocations = []
         for i, wip_output in enumerate(self.wip_outputs):
             version = wip_output.get_latest_version()
+            if self.repair:
+                # Repairs fill in the current version as it is
+                if not version:
+                    raise ValueError('Nothing to repair for {0}, it has no '
+                                     'output version'.format(
+                                         self.layer_info[i].layer))
+                allocations.append((version, False, version.note))
+                continue
+            is_new = False
             # If there is no version, create one.  If the
             # version up flag is set, version up the wipoutput
             if not version:
                 version = wip_output.get_version(1)
+                is_new = True
             else:
-                if eval(self.layer_info[i]['up']):
+                if self.layer_info[i].up:
                     current_ver = int(version.number)
                     version = wip_output.get_version(current_ver + 1)
+                    is_new = True
+            previous_note = None if is_new else version.note
             version.note = self.notes
-            version.save()
-            versions.append(version)
-        return versions
+            allocations.append((version, is_new, previous_note))
+        return allocations
+
+    def shot_inputs(self):
+        """(dict) The inputs every layer of the submission depends on. """
+        return {
+            'resolution' : (int(self.resolution.width),
+                            int(self.resolution.height)),
+            'outformat' : self.outformat,
+            'scene_hash' : self.scene_hash,
+        }
+
+    def changed_frames(self, index, output, previous_layers):
+        """(list) The frames of a layer that have to be written again.  A
+        layer is submitted in full when it is new, versions up, or renders
+        to another version, camera or eyes than last time.  Otherwise only
+        its frames that were not submitted last time are, and those that
+        were but left nothing behind, see previous_output_exists.
+
+        """
+        layer = self.layer_info[index]
+        frames = frame_utils.expand_frames(str(layer.frame_range))
+        if layer.layer not in previous_layers or layer.up:
+            return frames
+        previous, image_path = previous_layers[layer.layer]
+        if (image_path != output.image_path or
+                previous.camera != layer.camera or
+                previous.pass_type != layer.pass_type or
+                (previous.left_eye, previous.right_eye) !=
+                (layer.left_eye, layer.right_eye)):
+            return frames
+        submitted = set(frame_utils.expand_frames(str(previous.frame_range)))
+        return [frame for frame in frames if frame not in submitted or
+                not self.previous_output_exists(index, output, frame)]
+
+    def previous_output_exists(self, index, output, frame):
+        """(bool) Whether a frame of a layer is rendered, or at least has
+        its IFD written and waiting for mantra, in every eye.  The IFDs of a
+        tiled layer are those of its tiles.
+
+        """
+        outputs = [(output.image_path, output.ifd_path)]
+        if self.layer_eyes(index):
+            outputs = [(eye_path(output.image_path, eye),
+                        eye_path(output.ifd_path, eye))
+                       for eye in self.layer_eyes(index)]
+        for image_path, ifd_path in outputs:
+            if self.tiled(index):
+                ifd_path = tile_path(ifd_path, 0)
+            if frame_utils.frame_rendered(frame_utils.frame_path(
+                    image_path, frame, self.hou_frame_pattern)):
+                continue
+            if not os.path.exists(frame_utils.frame_path(
+                    ifd_path, frame, self.hou_frame_pattern)):
+                return False
+        return True
+
+    def restrict_to_changes(self):
+        """ Narrow every layer down to the frames whose inputs changed since
+        the last submission of the shot.  A different scene, resolution or
+        output format changes every layer, and so does a scene whose hash
+        could not be worked out.  What is left out is kept in reused.
+        Frames that failed to render last time count as reused, a repair
+        takes care of those.
 
+        """
+        if not self.previous or self.scene_hash is None:
+            return
+        for key, value in self.shot_inputs().items():
+            if self.previous.get(key) != value:
+                return
+        previous_layers = dict(
+            (layer.layer, (layer, image_path))
+            for layer, image_path in self.previous.get('requested_layers', []))
+        layers = []
+        wip_outputs = []
+        versions = []
+        for i, (layer, output) in enumerate(zip(self.layer_info, self.snapshot)):
+            frames = frame_utils.expand_frames(str(layer.frame_range))
+            changed = self.changed_frames(i, output, previous_layers)
+            if len(changed) < len(frames):
+                changed_set = set(changed)
+                self.reused[layer.layer] = frame_utils.compress_frames(
+                    [frame for frame in frames if frame not in changed_set])
+            if not changed:
+                continue
+            layers.append(layer.replace(
+                frame_range=FrameSet.parse(frame_utils.compress_frames(changed))))
+            wip_outputs.append(output.wip_output)
+            versions.append(output.version)
+        self.layer_info = layers
+        self._wip_outputs = wip_outputs
+        self.output_versions = versions
+
+    def restrict_to_missing_frames(self):
+        """ Narrow every layer down to the frames whose images are missing
+        from its current version, in either eye of a split stereo layer.
+        Empty or truncated images count as missing, see
+        frame_utils.frame_rendered.  Layers that are complete are dropped
+        from the submission.
+
+        """
+        layers = []
+        wip_outputs = []
+        versions = []
+        for i, (layer, output) in enumerate(zip(self.layer_info, self.snapshot)):
+            image_paths = [output.image_path]
+            if self.layer_eyes(i):
+                image_paths = [eye_path(output.image_path, eye)
+                               for eye in self.layer_eyes(i)]
+            missing = [frame for frame in frame_utils.expand_frames(str(layer.frame_range))
+                       if not all(frame_utils.frame_rendered(
+                           frame_utils.frame_path(path, frame, self.hou_frame_pattern))
+                           for path in image_paths)]
+            if not missing:
+                continue
+            layers.append(layer.replace(
+                frame_range=FrameSet.parse(frame_utils.compress_frames(missing))))
+            wip_outputs.append(output.wip_output)
+            versions.append(output.version)
+        self.layer_info = layers
+        self._wip_outputs = wip_outputs
+        self.output_versions = versions
+
+    def save_output_versions(self, allocations):
+        """ Save the allocated versions.  WipOutputManager has no bulk write,
+        so every version is saved on its own.  If a save fails, the existing
+        versions get their notes back before the error is raised again.
+
+        """
+        saved = []
+        try:
+            for version, is_new, previous_note in allocations:
+                version.save()
+                saved.append(version)
+        except Exception:
+            self.rollback_output_versions(allocations, saved)
+            raise
+
+    def rollback_output_versions(self, allocations, saved):
+        """ Undo what can be undone of a failed save_output_versions.
+        Existing versions get their note back.  pipe_core offers no way to
+        remove a version, so new versions that made it to the store are
+        left there and listed.
+
+        """
+        for version, is_new, previous_note in allocations:
+            if is_new:
+                if version in saved:
+                    print 'Saved {0} before the submission failed'.format(
+                        version.get_path())
+                continue
+            version.note = previous_note
+            if version in saved:
+                version.save()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+""" Stitching of the tiles of a tiled render back into whole EXR frames.
+Every tile is an EXR whose data window is the part of the frame it
+rendered.  All the channels of the tiles, AOVs included, end up in the
+stitched frame with their own pixel types.
+
+    exr_stitch.py /path/to/image.$F4.exr tile00/image.$F4.exr [...] --frames 101-200
+
+On the farm the arguments come from the stitch job, see
+Dispatcher.create_stitch_job.  Only OpenEXR is needed, not Houdini.
+"""
+
+# Built-in
+import argparse
+import os
+import sys
+
+# Third party
+import Imath
+import OpenEXR
+
+# ReelFX
+from lightning import frame_utils
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+# Bytes per pixel of every EXR pixel type
+PIXEL_SIZES = {
+    Imath.PixelType.UINT : 4,
+    Imath.PixelType.HALF : 2,
+    Imath.PixelType.FLOAT : 4,
+}
+# Header attributes of the tiles that do not apply to a scanline file
+TILE_ATTRIBUTES = ('tiles', 'chunkCount')
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def pixel_size(channel):
+    """(int) The bytes per pixel of an Imath.Channel. """
+    return PIXEL_SIZES[channel.type.v]
+
+def data_window(header):
+    """(int, int, int, int) The min x, min y, max x and max y of the pixels
+    an EXR holds.
+
+    """
+    box = header['dataWindow']
+    return box.min.x, box.min.y, box.max.x, box.max.y
+
+def stitch(tile_paths, output_path):
+    """ Write the frame made of the given tiles.  Pixels that no tile
+    covers are left black.
+
+    """
+    tiles = [OpenEXR.InputFile(path) for path in tile_paths]
+    try:
+        headers = [tile.header() for tile in tiles]
+        channels = {}
+        for header in headers:
+            channels.update(header['channels'])
+        windows = [data_window(header) for header in headers]
+        min_x = min(window[0] for window in windows)
+        min_y = min(window[1] for window in windows)
+        max_x = max(window[2] for window in windows)
+        max_y = max(window[3] for window in windows)
+        width = max_x - min_x + 1
+        height = max_y - min_y + 1
+
+        pixels = {}
+        for name, channel in channels.items():
+            size = pixel_size(channel)
+            data = bytearray(width * height * size)
+            for tile, header, window in zip(tiles, headers, windows):
+                if name not in header['channels']:
+                    continue
+                tile_data = tile.channel(name, channel.type)
+                row_bytes = (window[2] - window[0] + 1) * size
+                for row in range(window[3] - window[1] + 1):
+                    start = ((window[1] - min_y + row) * width +
+                             window[0] - min_x) * size
+                    data[start:start + row_bytes] = \
+                        tile_data[row * row_bytes:(row + 1) * row_bytes]
+            pixels[name] = bytes(data)
+    finally:
+        for tile in tiles:
+            tile.close()
+
+    header = dict(headers[0])
+    for attribute in TILE_ATTRIBUTES:
+        header.pop(attribute, None)
+    header['channels'] = channels
+    header['dataWindow'] = Imath.Box2i(Imath.V2i(min_x, min_y),
+                                       Imath.V2i(max_x, max_y))
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    # Written next to the frame and renamed, so a frame is never half there
+    tmp_path = os.path.join(output_dir, '.{0}.tmp.exr'.format(
+        os.path.basename(output_path)))
+    output = OpenEXR.OutputFile(tmp_path, header)
+    try:
+        output.writePixels(pixels)
+    finally:
+        output.close()
+    os.rename(tmp_path, output_path)
+
+def stitch_frames(tile_paths, image_path, frames, pattern='$F4'):
+    """(list) Stitch every frame of a range out of the tiles of an image
+    sequence.  Frames with missing tiles are skipped and returned.  Frames
+    whose image links to another one, that of the pass a pass was merged
+    into for instance, are left as they are.
+
+    """
+    missing = []
+    for frame in frame_utils.expand_frames(frames):
+        if os.path.islink(frame_utils.frame_path(image_path, frame, pattern)):
+            continue
+        frame_tiles = [frame_utils.frame_path(path, frame, pattern)
+                       for path in tile_paths]
+        if not all(os.path.exists(path) for path in frame_tiles):
+            missing.append(frame)
+            continue
+        stitch(frame_tiles, frame_utils.frame_path(image_path, frame, pattern))
+    return missing
+
+def get_environment_args():
+    """(dict) The arguments of the stitch job. """
+    # Only needed on the farm, so the stitch itself works without it
+    from pipe_utils.string_utils import str_to_obj
+    return str_to_obj(os.environ['PY_STARTUP_ARGS'], useb64decode=True)
+
+def main():
+    if 'PY_STARTUP_ARGS' in os.environ:
+        args = get_environment_args()
+        image_path, tile_paths, frames = (args['image_path'],
+                                          args['tile_paths'], args['frames'])
+    else:
+        parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+        parser.add_argument('image_path')
+        parser.add_argument('tile_paths', nargs='+')
+        parser.add_argument('--frames', required=True)
+        args = parser.parse_args()
+        image_path, tile_paths, frames = (args.image_path, args.tile_paths,
+                                          args.frames)
+    missing = stitch_frames(tile_paths, image_path, frames)
+    if missing:
+        sys.stderr.write('Missing tiles for frames {0}\n'.format(
+            frame_utils.compress_frames(missing)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
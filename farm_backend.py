@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+
+# Built-in
+import os
+import shutil
+import threading
+
+# ReelFX
+from app_manager.hou_executer import HouExecuter, MantraExecuter
+from app_manager.python_executer import PythonExecuter
+from app_manager.session_manager import SessionManager
+from farm_lib.qube_job import QubeJob
+from farm_lib.qube_submitter import QubeSubmitter
+from pipe_api.scene_archive import scene_archive
+from pipe_core.model.wip_output import WipOutputManager
+from pipe_core.model.wip_output_types import WipOutputType
+from pipe_utils.application import Application
+from pipe_utils.email_utils import get_email_address
+from pipe_utils.system_utils import get_user
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+# First job id handed out by a LocalSubmitter
+LOCAL_FIRST_JOB_ID = 1000
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+class FarmBackend(object):
+    """ Everything a Dispatcher needs from the farm and the pipeline.  This
+    one talks to the Qube supervisor and the pipeline database.
+    """
+    def get_user(self):
+        return get_user()
+
+    def get_email_address(self, user):
+        return get_email_address(user)
+
+    def get_app_versions(self):
+        return SessionManager.inst().env_manager.get_app_versions_dict()
+
+    def get_wip_output_manager(self, wip_ctx):
+        return WipOutputManager.instance(pipe_ctx=wip_ctx)
+
+    def scene_archive(self, scene_path, path_formula):
+        return scene_archive(scene_path, path_formula=path_formula)
+
+    def create_submitter(self):
+        return QubeSubmitter()
+
+    def create_job(self, executer, job_type, cluster, **kwargs):
+        return QubeJob(executer, job_type, cluster, **kwargs)
+
+    def create_hou_executer(self, wip_ctx, app_versions, **kwargs):
+        return HouExecuter(wip_ctx, app_versions, **kwargs)
+
+    def create_mantra_executer(self, wip_ctx, ifd_path, app_versions):
+        return MantraExecuter(wip_ctx, ifd_path, app_versions)
+
+    def create_python_executer(self, wip_ctx, app_versions, **kwargs):
+        return PythonExecuter(wip_ctx, app_versions, **kwargs)
+
+
+class LocalBackend(FarmBackend):
+    """ An in-process stand-in for the farm and the pipeline database.  It
+    records every archive, job, dependency and agenda so that submissions
+    can be inspected and benchmarked without a supervisor.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.archives = []
+        self.submitters = []
+        self.wip_output_managers = {}
+        self._lock = threading.Lock()
+
+    def get_user(self):
+        return 'local'
+
+    def get_email_address(self, user):
+        return '{0}@localhost'.format(user)
+
+    def get_app_versions(self):
+        return {Application.HOU : 'local'}
+
+    def get_wip_output_manager(self, wip_ctx):
+        key = str(wip_ctx)
+        with self._lock:
+            if key not in self.wip_output_managers:
+                self.wip_output_managers[key] = LocalWipOutputManager(
+                    os.path.join(self.root, 'outputs', key))
+            return self.wip_output_managers[key]
+
+    def scene_archive(self, scene_path, path_formula):
+        with self._lock:
+            root, ext = os.path.splitext(os.path.basename(scene_path))
+            archive_path = os.path.join(
+                self.root, 'archives',
+                '{0}_v{1:03d}{2}'.format(root, len(self.archives) + 1, ext))
+            self.archives.append(archive_path)
+        if not os.path.exists(os.path.dirname(archive_path)):
+            os.makedirs(os.path.dirname(archive_path))
+        shutil.copy(scene_path, archive_path)
+        return archive_path
+
+    def create_submitter(self):
+        submitter = LocalSubmitter()
+        with self._lock:
+            self.submitters.append(submitter)
+        return submitter
+
+    def create_job(self, executer, job_type, cluster, **kwargs):
+        return LocalJob(executer, job_type, cluster, **kwargs)
+
+    def create_hou_executer(self, wip_ctx, app_versions, **kwargs):
+        return LocalExecuter('hbatch', **kwargs)
+
+    def create_mantra_executer(self, wip_ctx, ifd_path, app_versions):
+        return LocalExecuter('mantra', ifd_path=ifd_path)
+
+    def create_python_executer(self, wip_ctx, app_versions, **kwargs):
+        return LocalExecuter('python', **kwargs)
+
+
+class LocalExecuter(object):
+    """ Records what an executer would have run. """
+    def __init__(self, application, **kwargs):
+        self.application = application
+        self.kwargs = kwargs
+        self.batch_mode = False
+        self.py_script = None
+
+
+class LocalJob(object):
+    """ Records a job, its dependencies, callbacks and agenda. """
+    def __init__(self, executer, job_type, cluster, label='', **kwargs):
+        self.executer = executer
+        self.job_type = job_type
+        self.cluster = cluster
+        self.label = label
+        self.settings = kwargs
+        self.dependencies = []
+        self.callbacks = []
+        self.agendas = []
+        self.job_id = None
+
+    def __repr__(self):
+        return '<LocalJob {0} {1}>'.format(self.job_id, self.label)
+
+    def add_dependency(self, job, event):
+        self.dependencies.append((job, event))
+
+    def add_callback(self, code, trigger, language=None):
+        self.callbacks.append((code, trigger, language))
+
+
+class LocalSubmitter(list):
+    """ A QubeSubmitter that hands out job ids locally. """
+    _next_id = LOCAL_FIRST_JOB_ID
+    _id_lock = threading.Lock()
+
+    def submit(self):
+        with self._id_lock:
+            for job in self:
+                job.job_id = LocalSubmitter._next_id
+                LocalSubmitter._next_id += 1
+
+    def get_job_ids(self):
+        return dict((job.label, job.job_id) for job in self)
+
+
+class LocalWipOutputManager(object):
+    """ Wip outputs kept in memory.  Paths are laid out under root. """
+    def __init__(self, root):
+        self.root = root
+        self.wip_outputs = {}
+
+    def get_wip_output(self, name):
+        if name not in self.wip_outputs:
+            self.wip_outputs[name] = LocalWipOutput(self, name)
+        return self.wip_outputs[name]
+
+
+class LocalWipOutput(object):
+    def __init__(self, manager, name):
+        self.manager = manager
+        self.name = name
+        self.versions = {}
+
+    def get_latest_version(self):
+        if not self.versions:
+            return None
+        return self.versions[max(self.versions)]
+
+    def get_version(self, number):
+        return self.versions.get(number) or LocalWipOutputVersion(self, number)
+
+    def get_output_base_dirs(self):
+        return [os.path.join(self.manager.root, 'ifd', self.name),
+                os.path.join(self.manager.root, 'render', self.name)]
+
+
+class LocalWipOutputVersion(object):
+    def __init__(self, wip_output, number):
+        self.wip_output = wip_output
+        self.number = number
+        self.note = ''
+
+    def get_path(self, output_type=None):
+        ifd_dir, render_dir = self.wip_output.get_output_base_dirs()
+        name = self.wip_output.name
+        if output_type == WipOutputType.MANTRA_IFD:
+            return os.path.join(ifd_dir, 'v{0:03d}'.format(self.number),
+                                '{0}.$F4.ifd'.format(name))
+        return os.path.join(render_dir, 'v{0:03d}'.format(self.number),
+                            '{0}.$F4.exr'.format(name))
+
+    def save(self):
+        self.wip_output.versions[self.number] = self
+
+
+class LocalDiscipline(object):
+    def __init__(self, short_name):
+        self.short_name = short_name
+
+
+class LocalWipContext(object):
+    """ Just enough of a WipContext for a Dispatcher. """
+    def __init__(self, root, sequence='9999', shot='0010', wip='lighting',
+                 discipline='lit'):
+        self.root = root
+        self.sequence = sequence
+        self.shot = shot
+        self.wip = wip
+        self.discipline = LocalDiscipline(discipline)
+
+    def __str__(self):
+        return '{0}_{1}_{2}'.format(self.sequence, self.shot, self.wip)
+
+    def is_assembly(self):
+        return False
+
+    def is_shot(self):
+        return True
+
+    def get_default_scene_path(self):
+        return os.path.join(self.root, 'scenes', '{0}.hip'.format(self))
+
+    def get_shot_obj(self):
+        return None
+
+
+class LocalPathContext(object):
+    """ Resolves every path formula to a directory under root. """
+    def __init__(self, root):
+        self.root = root
+
+    def get_path(self, formula, **kwargs):
+        return os.path.join(self.root, formula)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+""" Helpers for the frame range strings used by the dispatcher, such as
+101-200, 101-200x5 or 101,105,110-120, and the frames of image sequences.
+"""
+
+# Built-in
+import os
+import stat
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+# Images smaller than this hold a header at most, as left by a render that
+# died while writing
+MIN_IMAGE_BYTES = 512
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def expand_frames(frame_range):
+    """(list) Every frame of a frame range string, in the order given.
+    Frames that appear more than once are only kept the first time.
+
+    """
+    frames = []
+    seen = set()
+    for section in str(frame_range).replace(' ', '').split(','):
+        if not section:
+            continue
+        step = 1
+        if 'x' in section:
+            section, step = section.split('x')
+            step = int(step)
+        if '-' in section[1:]:
+            # Allow negative start frames
+            split = section.index('-', 1)
+            first, last = int(section[:split]), int(section[split + 1:])
+        else:
+            first = last = int(section)
+        for frame in range(first, last + 1, step):
+            if frame not in seen:
+                seen.add(frame)
+                frames.append(frame)
+    return frames
+
+def compress_frames(frames):
+    """(str) A frame range string for a list of frames.  Consecutive frames
+    are joined into ranges and the order is kept otherwise.
+
+    """
+    sections = []
+    start = end = None
+    for frame in frames:
+        if start is not None and frame == end + 1:
+            end = frame
+            continue
+        if start is not None:
+            sections.append(_section(start, end))
+        start = end = frame
+    if start is not None:
+        sections.append(_section(start, end))
+    return ','.join(sections)
+
+def _section(start, end):
+    if start == end:
+        return str(start)
+    return '{0}-{1}'.format(start, end)
+
+def chunk_frames(frames, size):
+    """(list) The frames split into consecutive chunks of at most size. """
+    size = max(1, int(size))
+    return [frames[i:i + size] for i in range(0, len(frames), size)]
+
+def frame_path(path, frame, pattern='$F4'):
+    """(str) The path of one frame of a sequence path such as
+    image.$F4.exr.
+
+    """
+    padding = int(pattern[2:] or 1)
+    return path.replace(pattern, str(frame).zfill(padding))
+
+def frame_rendered(path, min_bytes=MIN_IMAGE_BYTES):
+    """(bool) Whether the image of a frame is on disk and holds more than a
+    header.  Links are followed, so a held frame counts once the frame it
+    links to is rendered.
+
+    """
+    try:
+        info = os.stat(path)
+    except OSError:
+        return False
+    return stat.S_ISREG(info.st_mode) and info.st_size >= min_bytes
+
+def subdivide_frames(frames):
+    """(list) The frames ordered so that every prefix spreads over the whole
+    range: the first and last frame, then the middle, then the middles of
+    the halves and so on.
+
+    """
+    frames = list(frames)
+    if len(frames) < 3:
+        return frames
+    order = [frames[0], frames[-1]]
+    intervals = [(0, len(frames) - 1)]
+    while intervals:
+        next_intervals = []
+        for low, high in intervals:
+            if high - low < 2:
+                continue
+            middle = (low + high) // 2
+            order.append(frames[middle])
+            next_intervals.extend([(low, middle), (middle, high)])
+        intervals = next_intervals
+    return order
+
+def key_frames_first(frames, key_frames):
+    """(list) The frames with the key frames that are part of them first,
+    in the order given, and the others spread by subdivide_frames.
+
+    """
+    frames = list(frames)
+    present = set(frames)
+    first = [frame for frame in expand_frames(key_frames) if frame in present]
+    skip = set(first)
+    return first + [frame for frame in subdivide_frames(frames)
+                    if frame not in skip]
+
+def progressive_frames(frames, step):
+    """(list) Every step-th frame first, as with a 101-200x5 range, then
+    the frames in between.
+
+    """
+    frames = list(frames)
+    step = max(1, int(step))
+    return frames[::step] + [frame for i, frame in enumerate(frames) if i % step]
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+""" A per shot record of how long IFD generation took.  create_renders
+appends to it and the dispatcher reads it back to size frame chunks.
+"""
+
+# Built-in
+import json
+import os
+import time
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+HISTORY_NAME = 'ifd_history.jsonl'
+# Only the most recent records of a layer are averaged
+RECENT_RECORDS = 20
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def record(history_path, layer, frame_count, seconds):
+    """ Append the time it took to write the IFDs of some frames. """
+    if not frame_count:
+        return
+    history_dir = os.path.dirname(history_path)
+    if not os.path.exists(history_dir):
+        os.makedirs(history_dir)
+    entry = {
+        'layer' : layer,
+        'frames' : frame_count,
+        'seconds' : seconds,
+        'time' : time.time(),
+    }
+    # A single short append, so concurrent jobs do not interleave lines
+    with open(history_path, 'a') as history_file:
+        history_file.write(json.dumps(entry) + '\n')
+
+def load(history_path):
+    """(list) Every readable record of a history file. """
+    records = []
+    try:
+        with open(history_path) as history_file:
+            for line in history_file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except IOError:
+        pass
+    return records
+
+def seconds_per_frame(history_path, layer=None):
+    """(float) The recent average IFD time per frame of a layer.  Layers
+    without a history of their own fall back to the whole shot.  None when
+    nothing was recorded yet.
+
+    """
+    records = load(history_path)
+    layer_records = [entry for entry in records if entry.get('layer') == layer]
+    records = (layer_records or records)[-RECENT_RECORDS:]
+    frames = sum(entry['frames'] for entry in records)
+    if not frames:
+        return None
+    return sum(entry['seconds'] for entry in records) / float(frames)
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+""" Retention of the IFDs of every output version.  The dispatcher registers
+the IFD directory of each layer version it submits along with the render
+jobs of the directory, and the render jobs report back when their frames
+are done.  IFDs of versions that fell out of the policy are then deleted
+or compressed once none of their jobs is pending, except for the frames
+that failed to render.
+
+    ifd_retention.py report /path/to/submission/dir [...]
+    ifd_retention.py clean /path/to/submission/dir --keep-versions 1
+
+The registry of a shot is a directory of small json files, one per IFD
+directory, and one per render job of each directory below jobs, so
+concurrent render callbacks never write the same job file.
+"""
+
+# Built-in
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+# ReelFX
+from lightning import frame_utils
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+REGISTRY_NAME = 'ifd_registry'
+DELETE = 'delete'
+COMPRESS = 'gzip'
+ACTIVE = 'active'
+DELETED = 'deleted'
+COMPRESSED = 'compressed'
+# The states of a render job
+PENDING = 'pending'
+FAILED = 'failed'
+JOBS_DIR = 'jobs'
+IFD_FRAME_RE = re.compile(r'\.(-?\d+)\.ifd$')
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+class RetentionPolicy(object):
+    """ What is kept of the IFDs of a shot.  The newest keep_versions
+    versions of every layer are kept as they are.  Past max_bytes for the
+    shot, older versions are cleaned up as well, oldest first.  The IFDs
+    of failed frames are kept as long as keep_failed is set.
+    """
+    def __init__(self, keep_versions=2, keep_failed=True, max_bytes=None,
+                 action=DELETE):
+        if action not in (DELETE, COMPRESS):
+            raise ValueError('Unknown IFD retention action: {0}'.format(action))
+        # The newest version may still be rendering, so it is always kept
+        self.keep_versions = max(1, keep_versions)
+        self.keep_failed = keep_failed
+        self.max_bytes = max_bytes
+        self.action = action
+
+    def to_dict(self):
+        return {
+            'keep_versions' : self.keep_versions,
+            'keep_failed' : self.keep_failed,
+            'max_bytes' : self.max_bytes,
+            'action' : self.action,
+        }
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def registry_dir(submission_path):
+    """(str) The registry of the shot whose submissions go to a path. """
+    return os.path.join(submission_path, REGISTRY_NAME)
+
+def _entry_path(registry, ifd_dir):
+    name = hashlib.sha1(os.path.abspath(ifd_dir)).hexdigest()
+    return os.path.join(registry, '{0}.json'.format(name))
+
+def _jobs_dir(registry, ifd_dir):
+    name = hashlib.sha1(os.path.abspath(ifd_dir)).hexdigest()
+    return os.path.join(registry, JOBS_DIR, name)
+
+def _job_path(registry, ifd_dir, job):
+    name = hashlib.sha1(job).hexdigest()
+    return os.path.join(_jobs_dir(registry, ifd_dir), '{0}.json'.format(name))
+
+def _write_json(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Made by another process in the meantime
+            pass
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    with os.fdopen(tmp_fd, 'w') as json_file:
+        json.dump(data, json_file)
+    os.rename(tmp_path, path)
+
+def _write_entry(registry, entry):
+    entry['updated'] = time.time()
+    _write_json(_entry_path(registry, entry['ifd_dir']), entry)
+
+def load_entry(registry, ifd_dir):
+    """(dict) The registry entry of an IFD directory, or None. """
+    try:
+        with open(_entry_path(registry, ifd_dir)) as entry_file:
+            return json.load(entry_file)
+    except (IOError, ValueError):
+        return None
+
+def load_entries(registry):
+    """(list) Every readable entry of a registry. """
+    entries = []
+    if not os.path.isdir(registry):
+        return entries
+    for name in os.listdir(registry):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(registry, name)) as entry_file:
+                entries.append(json.load(entry_file))
+        except (IOError, ValueError):
+            continue
+    return entries
+
+def load_jobs(registry, ifd_dir):
+    """(list) The render jobs of an IFD directory that are pending or
+    failed.  Jobs that completed are forgotten.
+
+    """
+    jobs = []
+    jobs_dir = _jobs_dir(registry, ifd_dir)
+    if not os.path.isdir(jobs_dir):
+        return jobs
+    for name in os.listdir(jobs_dir):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(jobs_dir, name)) as job_file:
+                jobs.append(json.load(job_file))
+        except (IOError, ValueError):
+            continue
+    return jobs
+
+def pending_jobs(registry, ifd_dir):
+    """(list) The render jobs of an IFD directory that are not done. """
+    return sorted(job['job'] for job in load_jobs(registry, ifd_dir)
+                  if job['state'] == PENDING)
+
+def failed_frames(registry, ifd_dir):
+    """(list) The frames of an IFD directory whose render job failed.  A
+    job that completes later clears its own frames only, never those of
+    the other eye or tile jobs of the same frames.
+
+    """
+    frames = set()
+    for job in load_jobs(registry, ifd_dir):
+        if job['state'] == FAILED:
+            frames.update(job['frames'])
+    return sorted(frames)
+
+def disk_usage(path):
+    """(int) The bytes taken by every file below a directory. """
+    total = 0
+    for dir_path, dir_names, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                total += os.lstat(os.path.join(dir_path, file_name)).st_size
+            except OSError:
+                continue
+    return total
+
+def register(registry, ifd_dir, sequence, shot, layer, version, jobs=()):
+    """ Start tracking the IFD directory of a layer version and the render
+    jobs that will report back on it, see on_render_complete.  The size of
+    the directory is only known once a job reports back.  The jobs of an
+    earlier submission to the same directory are kept.
+
+    """
+    for job in jobs:
+        _write_json(_job_path(registry, ifd_dir, job),
+                    {'job' : job, 'state' : PENDING, 'frames' : []})
+    entry = load_entry(registry, ifd_dir) or {
+        'ifd_dir' : ifd_dir,
+        'bytes' : 0,
+        'registered' : time.time(),
+    }
+    entry.update({
+        'sequence' : str(sequence),
+        'shot' : str(shot),
+        'layer' : layer,
+        'version' : int(version),
+        # New IFDs are written to it again
+        'state' : ACTIVE,
+    })
+    _write_entry(registry, entry)
+
+def ifd_frame(file_name):
+    """(int) The frame of an IFD file name, or None. """
+    match = IFD_FRAME_RE.search(file_name)
+    if match:
+        return int(match.group(1))
+    return None
+
+def clean_entry(registry, entry, policy):
+    """ Delete or compress the IFDs of an entry, keeping those of failed
+    frames when the policy says so.
+
+    """
+    failed = set()
+    if policy.keep_failed:
+        failed = set(failed_frames(registry, entry['ifd_dir']))
+    for dir_path, dir_names, file_names in os.walk(entry['ifd_dir']):
+        for file_name in file_names:
+            frame = ifd_frame(file_name)
+            if frame is None or frame in failed:
+                continue
+            path = os.path.join(dir_path, file_name)
+            if policy.action == COMPRESS:
+                with open(path, 'rb') as ifd_file:
+                    with gzip.open(path + '.gz', 'wb') as gz_file:
+                        shutil.copyfileobj(ifd_file, gz_file)
+            os.remove(path)
+    entry['state'] = COMPRESSED if policy.action == COMPRESS else DELETED
+    entry['bytes'] = disk_usage(entry['ifd_dir'])
+    _write_entry(registry, entry)
+
+def apply_policy(registry, policy):
+    """(list) Clean up the IFDs of a shot that the policy no longer keeps.
+    Versions that still have pending render jobs are left alone.  Returns
+    the entries that were cleaned.
+
+    """
+    entries = load_entries(registry)
+    busy = set(entry['ifd_dir'] for entry in entries
+               if pending_jobs(registry, entry['ifd_dir']))
+    layers = {}
+    for entry in entries:
+        layers.setdefault(entry['layer'], []).append(entry)
+    expired = []
+    kept = []
+    for layer_entries in layers.values():
+        layer_entries.sort(key=lambda entry: entry['version'], reverse=True)
+        kept.extend(layer_entries[:policy.keep_versions])
+        expired.extend(layer_entries[policy.keep_versions:])
+    cleaned = [entry for entry in expired
+               if entry['state'] == ACTIVE and entry['ifd_dir'] not in busy]
+    if policy.max_bytes is not None:
+        total = sum(entry['bytes'] for entry in entries if entry not in cleaned)
+        # Past the budget, older kept versions go too, but never the newest
+        # version of a layer
+        newest = set(id(layer_entries[0]) for layer_entries in layers.values())
+        candidates = sorted([entry for entry in kept
+                             if entry['state'] == ACTIVE and id(entry) not in newest
+                             and entry['ifd_dir'] not in busy],
+                            key=lambda entry: entry['registered'])
+        for entry in candidates:
+            if total <= policy.max_bytes:
+                break
+            cleaned.append(entry)
+            total -= entry['bytes']
+    for entry in cleaned:
+        clean_entry(registry, entry, policy)
+    return cleaned
+
+def _update_job(registry, ifd_dir, job, frames, failed):
+    entry = load_entry(registry, ifd_dir)
+    if entry is None:
+        return None
+    # Written while the job is still pending, so the entry cannot be
+    # cleaned up in the meantime, see apply_policy
+    entry['bytes'] = disk_usage(ifd_dir)
+    _write_entry(registry, entry)
+    job_path = _job_path(registry, ifd_dir, job)
+    if failed:
+        _write_json(job_path, {'job' : job, 'state' : FAILED,
+                               'frames' : sorted(frames)})
+    else:
+        try:
+            os.remove(job_path)
+        except OSError:
+            # Not registered, or reported twice
+            pass
+    return entry
+
+def on_render_complete(registry, ifd_dir, job, frame_range, policy):
+    """ Qube callback of a render job that finished its frames.  job is
+    the name the job was registered with, frame_range holds its frames
+    and policy is a RetentionPolicy dictionary.
+
+    """
+    frames = frame_utils.expand_frames(frame_range)
+    _update_job(registry, ifd_dir, job, frames, failed=False)
+    apply_policy(registry, RetentionPolicy(**policy))
+
+def on_render_failed(registry, ifd_dir, job, frame_range):
+    """ Qube callback of a render job that failed, its IFDs are kept. """
+    frames = frame_utils.expand_frames(frame_range)
+    _update_job(registry, ifd_dir, job, frames, failed=True)
+
+def format_bytes(count):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(count) < 1024.0:
+            return '{0:.1f}{1}'.format(count, unit)
+        count /= 1024.0
+    return '{0:.1f}TB'.format(count)
+
+def report(registries):
+    """(str) The IFD disk usage of every shot, and of every layer version
+    that still holds IFDs.
+
+    """
+    shots = {}
+    for registry in registries:
+        for entry in load_entries(registry):
+            shots.setdefault((entry['sequence'], entry['shot']), []).append(entry)
+    lines = []
+    for (sequence, shot), entries in sorted(shots.items()):
+        total = sum(entry['bytes'] for entry in entries)
+        lines.append('{0}_{1} : {2} in {3} versions'.format(
+            sequence, shot, format_bytes(total), len(entries)))
+        entries.sort(key=lambda entry: (entry['layer'], entry['version']))
+        for entry in entries:
+            if not entry['bytes']:
+                continue
+            lines.append('    {0:<32} v{1:03d} {2:>10} {3}'.format(
+                entry['layer'], entry['version'],
+                format_bytes(entry['bytes']), entry['state']))
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=('report', 'clean'))
+    parser.add_argument('submission_paths', nargs='+')
+    parser.add_argument('--keep-versions', type=int, default=2)
+    parser.add_argument('--max-bytes', type=int)
+    parser.add_argument('--action', choices=(DELETE, COMPRESS), default=DELETE)
+    parser.add_argument('--discard-failed', action='store_true',
+                        help='do not keep the IFDs of failed frames')
+    args = parser.parse_args()
+
+    registries = [registry_dir(path) for path in args.submission_paths]
+    if args.command == 'clean':
+        policy = RetentionPolicy(args.keep_versions, not args.discard_failed,
+                                 args.max_bytes, args.action)
+        for registry in registries:
+            for entry in apply_policy(registry, policy):
+                print 'Cleaned {0}'.format(entry['ifd_dir'])
+    print report(registries)
+
+
+if __name__ == '__main__':
+    main()
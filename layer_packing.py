@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+""" Packing of cheap layers into shared Mantra tasks.  Every frame of a pack
+is one IFD made of the IFDs of its layers, so a single Mantra process
+renders all of them instead of paying start up once per layer.
+
+Layers are packed by their estimated render seconds and memory per frame,
+see estimate.  The seconds come from the render history of a layer when it
+has one.  Layers without an estimate, or too expensive to share a task,
+stay on their own.  Nothing in here needs Houdini.
+"""
+
+# Built-in
+import os
+import shutil
+import tempfile
+
+# ReelFX
+from lightning import frame_utils
+from lightning import render_history
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+# Estimated (render seconds, GB of memory) per frame of the cheap pass types
+# at BASE_PIXELS, used for memory and for layers without a render history
+PASS_COSTS = {
+    'matte' : (20, 2),
+    'shadow' : (40, 3),
+    'ambientOcclusion' : (90, 4),
+    'depth' : (15, 2),
+}
+# GB of memory per frame at BASE_PIXELS of the pass types that are not in
+# PASS_COSTS, whose render history holds no memory
+DEFAULT_MEMORY = 4
+BASE_PIXELS = 1920 * 1080
+# Render seconds and memory a pack may add up to per frame
+PACK_SECONDS = 180
+PACK_MEMORY = 8
+# Ends every IFD, only the last layer of a pack keeps it
+RAY_QUIT = 'ray_quit'
+# Clears the scene of the previous layer of a pack
+RAY_RESET = 'ray_reset -l -o -g\n'
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def estimate(layer, history_path=None, pixels=None):
+    """(float, float) The render seconds and memory of a frame of a layer,
+    or None when it has no render history and its pass type is not known
+    to be cheap.  The seconds come from the layer's render history when
+    history_path has one for it, and from PASS_COSTS otherwise.  Memory
+    comes from PASS_COSTS, or DEFAULT_MEMORY for other pass types.  Costs
+    scale with the pixels of a frame.
+
+    """
+    pixels = pixels or BASE_PIXELS
+    scale = float(pixels) / BASE_PIXELS
+    seconds = None
+    if history_path:
+        per_pixel = render_history.seconds_per_pixel(history_path, layer.layer)
+        if per_pixel is not None:
+            seconds = per_pixel * pixels
+    cost = PASS_COSTS.get(layer.pass_type)
+    if seconds is None:
+        if cost is None:
+            return None
+        seconds = cost[0] * scale
+    memory = cost[1] if cost else DEFAULT_MEMORY
+    return float(seconds), float(memory * scale)
+
+def pack(layers, indices=None, max_seconds=PACK_SECONDS, max_memory=PACK_MEMORY,
+         history_path=None, pixels=None):
+    """(list) The given layer indices, all of them by default, that share a
+    Mantra task, as lists of two or more indices.  Layers only share a pack
+    with layers of the same mantra cluster.  Packs are filled first fit,
+    most expensive layer first.  history_path and pixels are handed to
+    estimate.
+
+    """
+    if indices is None:
+        indices = range(len(layers))
+    costs = {}
+    for i in indices:
+        cost = estimate(layers[i], history_path, pixels)
+        if cost is not None and cost[0] < max_seconds and cost[1] < max_memory:
+            costs[i] = cost
+    bins = []
+    for i in sorted(costs, key=lambda i: costs[i], reverse=True):
+        seconds, memory = costs[i]
+        for packed in bins:
+            if (packed['cluster'] == layers[i].mantra_cluster and
+                    packed['seconds'] + seconds <= max_seconds and
+                    packed['memory'] + memory <= max_memory):
+                break
+        else:
+            packed = {'cluster' : layers[i].mantra_cluster, 'indices' : [],
+                      'seconds' : 0.0, 'memory' : 0.0}
+            bins.append(packed)
+        packed['indices'].append(i)
+        packed['seconds'] += seconds
+        packed['memory'] += memory
+    packs = [sorted(filled['indices']) for filled in bins
+             if len(filled['indices']) > 1]
+    return sorted(packs)
+
+def pack_path(submission_path, basename, number, pattern='$F4'):
+    """(str) The per frame IFD path of a pack of a submission. """
+    name = '{0}_pack{1:02d}'.format(basename, number)
+    return os.path.join(submission_path, 'ifd_packs', name,
+                        '{0}.{1}.ifd'.format(name, pattern))
+
+def concatenate(ifd_paths, output_path):
+    """ Write the IFDs one after the other into a single IFD.  The scene is
+    reset between them and only the last one quits.
+
+    """
+    output_dir = os.path.dirname(output_path)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=output_dir, prefix='.', suffix='.tmp')
+    with os.fdopen(tmp_fd, 'wb') as output_file:
+        for number, ifd_path in enumerate(ifd_paths):
+            if number:
+                output_file.write(RAY_RESET)
+            if number == len(ifd_paths) - 1:
+                with open(ifd_path, 'rb') as ifd_file:
+                    shutil.copyfileobj(ifd_file, output_file)
+                continue
+            with open(ifd_path, 'rb') as ifd_file:
+                data = ifd_file.read().rstrip()
+            if data.endswith(RAY_QUIT):
+                data = data[:-len(RAY_QUIT)]
+            output_file.write(data.rstrip() + '\n')
+    os.rename(tmp_path, output_path)
+
+def write_pack(ifd_paths, frame_sets, output_path, pattern='$F4'):
+    """(list) Write every frame of a pack out of the per frame IFDs of its
+    layers.  A frame only holds the layers that render it.  Returns the
+    frames written.
+
+    """
+    layer_frames = [set(frame_utils.expand_frames(str(frame_set)))
+                    for frame_set in frame_sets]
+    frames = set().union(*layer_frames)
+    for frame in sorted(frames):
+        members = [frame_utils.frame_path(ifd_path, frame, pattern)
+                   for ifd_path, frames_of_layer in zip(ifd_paths, layer_frames)
+                   if frame in frames_of_layer]
+        concatenate(members, frame_utils.frame_path(output_path, frame, pattern))
+    return sorted(frames)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+# Built-in
+import math
+import os
+
+# ReelFX
+from pipe_utils.sequence import FrameSet
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+EYES = ('left', 'right')
+# Directory of each eye's IFDs and images when the eyes are split
+EYE_DIRS = {'left' : 'l', 'right' : 'r'}
+# Directory of each tile's IFDs and images when frames are rendered in tiles
+TILE_DIR = 'tile{0:02d}'
+# What a layer gets when its priority or cpus are left blank, the same as the
+# Dispatcher defaults
+DEFAULT_PRIORITY = 1000
+DEFAULT_CPUS = 1
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+class LayerSpec(object):
+    """ The settings of one layer of a submission, as picked in the
+    dispatcher table.  Values keep their real types, they only become
+    strings when written to the submission xml.
+    """
+    __slots__ = ('layer', 'pass_type', 'frame_range', 'original_frame_range',
+                 'left_eye', 'right_eye', 'up', 'camera', 'priority', 'cpus',
+                 'mantra_cluster', 'hbatch_dist')
+
+    def __init__(self, layer, pass_type='', frame_range='',
+                 original_frame_range=None, left_eye=True, right_eye=False,
+                 up=False, camera='', priority=DEFAULT_PRIORITY,
+                 cpus=DEFAULT_CPUS,
+                 mantra_cluster='', hbatch_dist=''):
+        self.layer = layer
+        self.pass_type = pass_type
+        if not isinstance(frame_range, FrameSet):
+            frame_range = FrameSet.parse(frame_range)
+        self.frame_range = frame_range
+        if original_frame_range is None:
+            original_frame_range = str(frame_range)
+        self.original_frame_range = original_frame_range
+        self.left_eye = bool(left_eye)
+        self.right_eye = bool(right_eye)
+        self.up = bool(up)
+        self.camera = camera
+        self.priority = to_int(priority, DEFAULT_PRIORITY)
+        self.cpus = to_int(cpus, DEFAULT_CPUS)
+        self.mantra_cluster = mantra_cluster
+        self.hbatch_dist = hbatch_dist
+
+    def __repr__(self):
+        return '<LayerSpec {0} {1}>'.format(self.layer, self.frame_range)
+
+    @property
+    def stereo(self):
+        """(bool) Whether both eyes are rendered. """
+        return self.left_eye and self.right_eye
+
+    def replace(self, **changes):
+        """(LayerSpec) A copy of the layer with some of its values changed. """
+        spec = LayerSpec.__new__(LayerSpec)
+        spec.__setstate__(self.__getstate__())
+        for name, value in changes.items():
+            setattr(spec, name, value)
+        return spec
+
+    def __getstate__(self):
+        # Slotted classes have no __dict__ to pickle, and the frame range is
+        # smaller as a string
+        state = [getattr(self, name) for name in self.__slots__]
+        state[self.__slots__.index('frame_range')] = str(self.frame_range)
+        return tuple(state)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+        self.frame_range = FrameSet.parse(self.frame_range)
+
+    def xml_attributes(self):
+        """(dict) The attributes of the layer's render element in the
+        submission xml.
+
+        """
+        return {
+            'layer' : self.layer,
+            'right' : str(self.right_eye),
+            'left' : str(self.left_eye),
+            'proc' : str(self.cpus),
+            'priority' : str(self.priority),
+            'range' : str(self.frame_range),
+            'up' : str(self.up),
+            'camera' : self.camera,
+        }
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def to_int(value, default):
+    """(int) A number picked in the dispatcher table, or default when the
+    cell was left blank.
+
+    """
+    if value is None or not str(value).strip():
+        return default
+    return int(value)
+
+def eye_path(path, eye):
+    """(str) The path of one eye's IFDs or images, in a directory of the
+    eye next to the file.
+
+    """
+    return os.path.join(os.path.dirname(path), EYE_DIRS[eye],
+                        os.path.basename(path))
+
+def tile_path(path, tile):
+    """(str) The path of one tile's IFDs or images, in a directory of the
+    tile next to the file.
+
+    """
+    return os.path.join(os.path.dirname(path), TILE_DIR.format(tile),
+                        os.path.basename(path))
+
+def tile_grid(count):
+    """(int, int) The columns and rows of count tiles, as square as count
+    allows.
+
+    """
+    count = max(1, int(count))
+    rows = int(math.sqrt(count))
+    while count % rows:
+        rows -= 1
+    return count // rows, rows
+
+def tile_crops(count):
+    """(list) The (left, right, bottom, top) camera crop of every tile, row
+    by row from the bottom left.
+
+    """
+    columns, rows = tile_grid(count)
+    crops = []
+    for row in range(rows):
+        for column in range(columns):
+            crops.append((float(column) / columns, float(column + 1) / columns,
+                          float(row) / rows, float(row + 1) / rows))
+    return crops
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+""" The submission manifest.  The dispatcher writes one per submission next
+to the xml, and the hbatch jobs only get its path plus the part of it they
+handle, instead of every argument in the environment.
+"""
+
+# Built-in
+import cPickle
+import os
+import tempfile
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+# Bumped whenever the layout of the manifest changes
+MANIFEST_VERSION = 10
+MANIFEST_SUFFIX = '_manifest.pkl'
+# Lists that hold one entry per layer
+LAYER_KEYS = ('image_paths', 'ifd_paths', 'layer_info', 'eyes', 'stream',
+              'pack_paths', 'tiles')
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def manifest_path(xml_path):
+    """(str) The manifest that belongs to a submission xml. """
+    return '{0}{1}'.format(os.path.splitext(xml_path)[0], MANIFEST_SUFFIX)
+
+def latest_manifest(directory):
+    """(str) The most recently written manifest of a directory, or None. """
+    try:
+        names = [name for name in os.listdir(directory)
+                 if name.endswith(MANIFEST_SUFFIX)]
+    except OSError:
+        return None
+    paths = [os.path.join(directory, name) for name in names]
+    if not paths:
+        return None
+    return max(paths, key=os.path.getmtime)
+
+def write(path, data):
+    """ Write a manifest.  The file is replaced in one rename so that a job
+    never reads a partial manifest.
+
+    """
+    data = dict(data, version=MANIFEST_VERSION)
+    manifest_dir = os.path.dirname(path)
+    if not os.path.exists(manifest_dir):
+        os.makedirs(manifest_dir)
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=manifest_dir, suffix='.tmp')
+    with os.fdopen(tmp_fd, 'wb') as manifest_file:
+        cPickle.dump(data, manifest_file, cPickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_path, path)
+
+def load(path):
+    """(dict) Read a manifest.  Raises a ValueError for a manifest written
+    by a different version of the dispatcher.
+
+    """
+    with open(path, 'rb') as manifest_file:
+        data = cPickle.load(manifest_file)
+    if data.get('version') != MANIFEST_VERSION:
+        raise ValueError('Unsupported manifest version {0} in {1}'.format(
+            data.get('version'), path))
+    return data
+
+def job_args(data, indices=None, name='', frames=None):
+    """(dict) The arguments of a job that handles some of the layers of a
+    manifest.  Each subset saves its prepared scene under its own name and
+    frames replaces the frame ranges of the layers.
+
+    """
+    args = dict(data)
+    if frames:
+        args['frames'] = frames
+    if indices is not None and len(indices) != len(data['layer_info']):
+        for key in LAYER_KEYS:
+            args[key] = [data[key][i] for i in indices]
+    if name:
+        root, ext = os.path.splitext(args['saved_scene'])
+        args['saved_scene'] = '{0}_{1}{2}'.format(root, name, ext)
+    return args
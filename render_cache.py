@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+""" A per shot index of rendered frames keyed on the hash of their IFD, see
+rhou.ifd_hash.  When a new version of a layer writes an IFD that was
+rendered before, the frame is taken from the earlier image instead of being
+rendered again.
+
+create_renders hashes the IFDs it writes and keeps each hash next to its
+IFD.  The render jobs add their frames to the index once they are done, so
+the index only ever points at finished images.  Like the IFD retention
+registry, the index is a directory of small json files, one per layer and
+hash, so concurrent jobs never write the same file.
+"""
+
+# Built-in
+import json
+import os
+import shutil
+import tempfile
+import time
+
+# ReelFX
+from lightning import frame_utils
+from lightning.rhou import ifd_hash
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+CACHE_NAME = 'render_cache'
+# Added to the path of an IFD for the file holding its hash
+HASH_SUFFIX = '.sha1'
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def cache_dir(submission_path):
+    """(str) The render cache of the shot whose submissions go to a path. """
+    return os.path.join(submission_path, CACHE_NAME)
+
+def _entry_path(cache, layer, frame_hash):
+    return os.path.join(cache, layer, '{0}.json'.format(frame_hash))
+
+def write_hash(ifd_path, frame_hash):
+    """ Keep the hash of an IFD next to it. """
+    with open(ifd_path + HASH_SUFFIX, 'w') as hash_file:
+        hash_file.write(frame_hash)
+
+def read_hash(ifd_path):
+    """(str) The hash kept next to an IFD, or None. """
+    try:
+        with open(ifd_path + HASH_SUFFIX) as hash_file:
+            return hash_file.read().strip() or None
+    except IOError:
+        return None
+
+def lookup(cache, layer, frame_hash):
+    """(str) The image rendered for an IFD hash of a layer, or None when
+    there is none or it is gone.
+
+    """
+    try:
+        with open(_entry_path(cache, layer, frame_hash)) as entry_file:
+            image = json.load(entry_file)['image']
+    except (IOError, ValueError, KeyError):
+        return None
+    if not os.path.exists(image):
+        return None
+    return image
+
+def record(cache, layer, frame_hash, image):
+    """ Add a rendered image to the index. """
+    layer_dir = os.path.join(cache, layer)
+    if not os.path.exists(layer_dir):
+        try:
+            os.makedirs(layer_dir)
+        except OSError:
+            # Made by another process in the meantime
+            pass
+    entry = {'image' : image, 'time' : time.time()}
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=layer_dir, prefix='.', suffix='.tmp')
+    with os.fdopen(tmp_fd, 'w') as entry_file:
+        json.dump(entry, entry_file)
+    os.rename(tmp_path, _entry_path(cache, layer, frame_hash))
+
+def cached_count(cache, layer):
+    """(int) The number of frames of a layer the index can provide. """
+    layer_dir = os.path.join(cache, layer)
+    if not os.path.isdir(layer_dir):
+        return 0
+    count = 0
+    for name in os.listdir(layer_dir):
+        if name.endswith('.json') and lookup(cache, layer, name[:-len('.json')]):
+            count += 1
+    return count
+
+def materialize(source, image):
+    """ Give an image a copy of an earlier one.  A link would let the two
+    versions share a file, so that changing one changes the other.
+
+    """
+    image_dir = os.path.dirname(image)
+    if not os.path.exists(image_dir):
+        os.makedirs(image_dir)
+    tmp_path = os.path.join(image_dir, '.{0}.tmp'.format(os.path.basename(image)))
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    shutil.copy2(source, tmp_path)
+    os.rename(tmp_path, image)
+
+def reuse_frames(cache, layer, ifd_path, image_path, frames, pattern='$F4'):
+    """(dict) Hash the IFDs of some frames of a layer and take the frames
+    that were rendered before from the index.  Their IFDs are replaced by
+    one that only quits.  Returns the reused frames mapped to the image
+    they were taken from.
+
+    """
+    reused = {}
+    for frame in frames:
+        frame_ifd = frame_utils.frame_path(ifd_path, frame, pattern)
+        if not os.path.exists(frame_ifd):
+            continue
+        frame_hash = ifd_hash.hash_ifd(frame_ifd, frame)
+        write_hash(frame_ifd, frame_hash)
+        source = lookup(cache, layer, frame_hash)
+        image = frame_utils.frame_path(image_path, frame, pattern)
+        if source is None or os.path.realpath(source) == os.path.realpath(image):
+            continue
+        materialize(source, image)
+        with open(frame_ifd, 'w') as ifd_file:
+            ifd_file.write(ifd_hash.STUB_IFD)
+        reused[frame] = source
+    return reused
+
+def on_render_complete(cache, layer, ifd_path, image_path, frame_range):
+    """ Qube callback of a render job that finished its frames.  Every frame
+    with a hashed IFD and an image is added to the index.
+
+    """
+    for frame in frame_utils.expand_frames(frame_range):
+        frame_hash = read_hash(frame_utils.frame_path(ifd_path, frame))
+        image = frame_utils.frame_path(image_path, frame)
+        if frame_hash and os.path.exists(image):
+            record(cache, layer, frame_hash, os.path.realpath(image))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+""" A per shot record of how long mantra took to render the frames of every
+layer.  The render jobs append to it once they are complete, see
+on_render_complete, and layer_packing reads it back to estimate what a
+frame of a layer costs.  Records keep the pixels of the frames, so that a
+history taken at one resolution still applies at another.
+"""
+
+# Built-in
+import json
+import os
+import time
+
+# ReelFX
+from lightning import frame_utils
+from lightning import ifd_history
+from lightning.rhou.ifd_hash import STUB_IFD
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+HISTORY_NAME = 'render_history.jsonl'
+# Only the most recent records of a layer are averaged
+RECENT_RECORDS = ifd_history.RECENT_RECORDS
+COMPLETE = 'complete'
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def history_path(submission_path):
+    """(str) The render history of the shot whose submissions go to a path. """
+    return os.path.join(submission_path, HISTORY_NAME)
+
+def record(history_path, layer, frame_count, seconds, pixels):
+    """ Append the time it took to render some frames of a layer. """
+    if not frame_count or not pixels:
+        return
+    history_dir = os.path.dirname(history_path)
+    if not os.path.exists(history_dir):
+        os.makedirs(history_dir)
+    entry = {
+        'layer' : layer,
+        'frames' : frame_count,
+        'seconds' : seconds,
+        'pixels' : pixels,
+        'time' : time.time(),
+    }
+    # A single short append, so concurrent jobs do not interleave lines
+    with open(history_path, 'a') as history_file:
+        history_file.write(json.dumps(entry) + '\n')
+
+def seconds_per_pixel(history_path, layer):
+    """(float) The recent average render seconds per frame and pixel of a
+    layer, None when it has no history.  Unlike IFD times, render times
+    differ too much between layers to fall back to the whole shot.
+
+    """
+    records = [entry for entry in ifd_history.load(history_path)
+               if entry.get('layer') == layer and entry.get('pixels')]
+    records = records[-RECENT_RECORDS:]
+    if not records:
+        return None
+    frames = sum(entry['frames'] for entry in records)
+    seconds = sum(entry['seconds'] / float(entry['pixels']) for entry in records)
+    return seconds / frames
+
+def is_stub(ifd_path, frame):
+    """(bool) Whether the IFD of a frame only quits, as the ones of held
+    frames, cached frames and merged passes do.  Rendering it takes no
+    time, so it tells nothing of what the frame costs.
+
+    """
+    try:
+        frame = int(frame)
+    except ValueError:
+        return False
+    try:
+        with open(frame_utils.frame_path(ifd_path, frame)) as ifd_file:
+            return ifd_file.read(len(STUB_IFD) + 1) == STUB_IFD
+    except IOError:
+        return False
+
+def job_seconds(job_id, ifd_path=None):
+    """(int, float) The number of frames a qube job rendered and the
+    seconds they took.  Given the IFD path of the job, frames whose IFD
+    only quits are left out.
+
+    """
+    # Only available on the farm and the workstations that submit to it
+    import qb
+    job = qb.jobinfo(id=[job_id], agenda=True)[0]
+    frames = 0
+    seconds = 0.0
+    for work in job['agenda']:
+        if work['status'] != COMPLETE:
+            continue
+        if not work['timestart'] or not work['timecomplete']:
+            continue
+        if ifd_path and is_stub(ifd_path, work['name']):
+            continue
+        frames += 1
+        seconds += work['timecomplete'] - work['timestart']
+    return frames, seconds
+
+def on_render_complete(history_path, layer, pixels, ifd_path=None):
+    """ Qube callback of a render job that finished its frames.  Their
+    render times go to the history of the layer, apart from the ones of
+    frames whose IFD only quits, see is_stub.  A pass merged into another
+    one renders nothing but those and is not recorded at all.
+
+    """
+    import qb
+    frames, seconds = job_seconds(qb.jobid(), ifd_path)
+    record(history_path, layer, frames, seconds, pixels)
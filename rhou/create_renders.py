@@ -4,6 +4,7 @@
 import re
 import os
 import sys
+import time
 
 #Houdini
 import hou
@@ -11,17 +12,28 @@ import hou
 #ReelFX
 from houdini_tools.hda_modules.rfxAbcCamera import rfxAbcCamera
 import lightning
+from lightning import frame_utils
+from lightning import ifd_history
+from lightning import layer_packing
+from lightning import manifest
+from lightning import render_cache
+from lightning.layer_spec import eye_path, tile_crops, tile_path
+from lightning.rhou import ifd_hash
 from lightning.rhou import render
-from pipe_utils import xml_utils
 from pipe_utils.sequence import FrameRange, FrameSet
 
 from pipe_utils.string_utils import str_to_obj
 
+# Mantra the scene is piped into when a layer streams
+MANTRA_COMMAND = 'mantra'
+# The IFD of a pass that another pass renders
+STUB_IFD = 'ray_quit\n'
+
 def get_layer_names(layer_info):
     """ Retrieve the layer names from the layer xml. """
     layer_names = []
     for layer in layer_info:
-        layer_names.append(layer.get('layer'))
+        layer_names.append(layer.layer)
     return layer_names
 
 def get_channel_cams(camera_node):
@@ -38,13 +50,24 @@ def get_channel_cams(camera_node):
 
 # XXX TODO Currently the way that the houdini scripts get run
 # is different so the startup arguments will not work correctly.
-# However, this current method is not the best way to do it as
-# the environment variable can get rather large to pass through
+# Only the manifest path and the part of the submission this job
+# handles go through the environment, see get_job_args.
 def get_environment_args():
     args_env =  os.environ['PY_STARTUP_ARGS']
     argv = str_to_obj(args_env, useb64decode=True)
     return argv
 
+def get_job_args(argv=None):
+    """(dict) The arguments of this job, read from the submission
+    manifest.  argv defaults to the arguments in the environment.
+
+    """
+    if argv is None:
+        argv = get_environment_args()
+    data = manifest.load(argv['manifest_path'])
+    return manifest.job_args(data, argv.get('layers'), argv.get('name', ''),
+                             argv.get('frames'))
+
 def symlink_files_to_renders(items_to_symlink, symlink_locations):
     for symlink_item in items_to_symlink:
         for location in symlink_locations:
@@ -55,8 +78,90 @@ def symlink_files_to_renders(items_to_symlink, symlink_locations):
                 # File exists so we do not need to worry
                 continue
 
-def main():
-    argv = get_environment_args()
+def write_merged_outputs(primary_image, image_path, ifd_path, frame_set,
+                         stream=False, tiles=0):
+    """ Give a pass that was merged into another one its own outputs.  Its
+    IFDs only quit, and its images link to the ones of the pass that renders
+    them, which hold its image planes as well.  The same goes for an eye
+    rendered in mono by the other eye.  A tiled pass gets the same for every
+    tile, and its stitch job leaves its linked images alone.
+
+    """
+    outputs = [(primary_image, image_path, ifd_path)]
+    outputs.extend((tile_path(primary_image, tile), tile_path(image_path, tile),
+                    tile_path(ifd_path, tile)) for tile in range(tiles))
+    for primary, image_path, ifd_path in outputs:
+        paths = [image_path] if stream else [image_path, ifd_path]
+        for path in paths:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+        for frame in frame_utils.expand_frames(str(frame_set)):
+            if not stream:
+                with open(frame_utils.frame_path(ifd_path, frame), 'w') as ifd_file:
+                    ifd_file.write(STUB_IFD)
+            image = frame_utils.frame_path(image_path, frame)
+            target = frame_utils.frame_path(primary, frame)
+            if os.path.lexists(image):
+                os.remove(image)
+            os.symlink(os.path.relpath(target, os.path.dirname(image)), image)
+
+def write_ifds(mantra_node, rfx_qube_node, image_path, ifd_path, stream=False):
+    """ Point a mantra node at its outputs and write its IFDs through the
+    rfxQube node.  With stream, the scene is piped straight into a mantra on
+    this host and no IFD is written.
+
+    """
+    # Set the IFD path and image path
+    image_dict = {
+        'vm_picture' : image_path,
+        'soho_outputmode' : True,
+        'soho_diskfile' : ifd_path
+    }
+    if stream:
+        image_dict = {
+            'vm_picture' : image_path,
+            'soho_outputmode' : False,
+            'soho_pipecmd' : MANTRA_COMMAND,
+        }
+    render.set_parms_in_take(image_dict, mantra_node)
+
+    # Create the directory if they do not exist
+    if not os.path.exists(os.path.dirname(image_path)):
+        os.makedirs(os.path.dirname(image_path))
+    if not stream and not os.path.exists(os.path.dirname(ifd_path)):
+        os.makedirs(os.path.dirname(ifd_path))
+
+    # mantra_node.render()
+    rfx_qube_node.parm('execute2').pressButton()
+
+def write_layer_ifds(mantra_node, rfx_qube_node, camera_node, image_path,
+                     ifd_path, stream=False, tiles=0):
+    """ Write the IFDs of a layer, or of each of its tiles when tiles is
+    set.  Every tile crops the camera to its part of the frame and has its
+    outputs in a directory of its own, see exr_stitch.
+
+    """
+    if not tiles:
+        write_ifds(mantra_node, rfx_qube_node, image_path, ifd_path, stream)
+        return
+    for tile, (left, right, bottom, top) in enumerate(tile_crops(tiles)):
+        crop_dict = {
+            'cropl' : left,
+            'cropr' : right,
+            'cropb' : bottom,
+            'cropt' : top,
+        }
+        render.set_parms_in_take(crop_dict, camera_node)
+        write_ifds(mantra_node, rfx_qube_node, tile_path(image_path, tile),
+                   tile_path(ifd_path, tile), stream)
+
+def main(job_args=None):
+    """ Set up the mantra nodes of the job's layers and write their IFDs.
+    job_args are the arguments of an IFD job, read from the environment
+    when they are not given, see hbatch_worker.
+
+    """
+    argv = get_job_args(job_args)
 
     # Get all the argument values out
     path_ctx = argv['path_ctx']
@@ -64,34 +169,60 @@ def main():
     image_paths = argv['image_paths']
     ifd_paths = argv['ifd_paths']
     render_scene = argv['render_scene']
+    # The archive may be shared with other submissions, so the set up scene
+    # is saved elsewhere when the dispatcher says so
+    saved_scene = argv.get('saved_scene', render_scene)
     layer_info = argv['layer_info']
+    # A frame chunk replaces the frame ranges of the layers
+    chunk_frames = argv.get('frames')
+    history_path = argv.get('history_path')
+    # The eyes written separately for every layer
+    eyes = argv.get('eyes') or [[] for _ in layer_info]
+    # The layers rendered right here instead of writing IFDs
+    stream = argv.get('stream') or [False for _ in layer_info]
+    # The IFD of the pack each layer is rendered in, if any
+    pack_paths = argv.get('pack_paths') or [None for _ in layer_info]
+    # Passes that only differ in their image planes share a mantra node
+    merge_passes = argv.get('merge_passes', False)
+    # Only render the first frame of frames with the same IFD
+    skip_held = argv.get('skip_held_frames', False)
+    # Frames rendered before by an earlier version are taken from here
+    cache = argv.get('render_cache')
+    # The number of tiles each frame of a layer is split into
+    tiles = argv.get('tiles') or [0 for _ in layer_info]
 
     hou_root = hou.node('/')
-    # Grab the passes from the xml
-    render_prefs = xml_utils.ElementTree.parse(xml_path)
-    render_root = render_prefs.getroot()
-    # Get the render passes
-    renders = render_root.find('renders')
-    layer_info = renders.getchildren()
-    # Get the resolution
-    res_element = render_root.find('resolution')
-    resolution = (res_element.get('width'), res_element.get('height'))
+    layer_names = get_layer_names(layer_info)
+    resolution = argv['resolution']
     # Get the rst root node
     response = lightning.groups.root.Root.from_path_context(path_ctx)
     root = response.payload
-    # Get the different passes
-    layer_names = get_layer_names(layer_info)
-    # Retrieve the mantra nodes that are created
-    mantra_nodes = render.render(root, passes=layer_names, to_render = False)
+    # Retrieve the mantra nodes that are created.  They are named after
+    # their pass but come back in the order of the rst.
+    # Merged passes also have to render the same frames the same way
+    compatible = dict(
+        (layer_names[i], (str(layer.frame_range), layer.camera, layer.left_eye,
+                          layer.right_eye, tuple(eyes[i]), stream[i]))
+        for i, layer in enumerate(layer_info))
+    mantra_nodes = render.render(root, passes=layer_names, to_render = False,
+                                 merge=merge_passes, compatible=compatible)
+    # The pass whose node renders each merged pass
+    merged = {}
+    for node in mantra_nodes:
+        for name in (node.userData('merged_passes') or '').split():
+            merged[name] = node.name()
+    mantra_nodes = dict((node.name(), node) for node in mantra_nodes)
     # Set the frame ranges and cameras for all the nodes
-    # XXX DONT KNOW IF THE LIST IS 1:1 TO LAYER LIST
-    for i, mantra_node in enumerate(mantra_nodes):
+    for i, layer_name in enumerate(layer_names):
+        if layer_name in merged:
+            continue
+        mantra_node = mantra_nodes[layer_name]
         # Connect the rfxQube node to this
         rfx_qube_node = mantra_node.createOutputNode('rfxQube')
 
         hou_children = hou_root.allSubChildren()
         # get the camera
-        camera_name = layer_info[i].get('camera')
+        camera_name = layer_info[i].camera
         camera_node = [c for c in hou_children if c.name() == camera_name]
         if camera_node:
             camera_node = camera_node[0]
@@ -109,8 +240,8 @@ def main():
         left_cam, right_cam = get_channel_cams(camera_node)
         # Set the camera and frame_range
         # Check whether the user specified only one channel
-        left_channel = eval(layer_info[i].get('left'))
-        right_channel = eval(layer_info[i].get('right'))
+        left_channel = layer_info[i].left_eye
+        right_channel = layer_info[i].right_eye
         render_cam = None
         # Default to the camera set if there are no channels
         if left_channel and not right_channel:
@@ -119,7 +250,9 @@ def main():
             render_cam = right_cam
         if not render_cam:
             render_cam = camera_node
-        frame_set = FrameSet.parse(layer_info[i].get('range'))
+        frame_set = layer_info[i].frame_range
+        if chunk_frames:
+            frame_set = FrameSet.parse(chunk_frames)
         # for frame_range in frame_set.ranges:
         print "Camera Path: {0}".format(render_cam.path())
         parm_dict = {
@@ -137,32 +270,107 @@ def main():
         # include all parms in the take
         hou.hscript('takeinclude {0} *'.format(render_cam.path()))
 
-        # Set the IFD path and image path
-        image_dict = {
-            'vm_picture' : image_paths[i],
-            'soho_outputmode' : True,
-            'soho_diskfile' : ifd_paths[i]
-        }
-        render.set_parms_in_take(image_dict, mantra_node)
-
-        # Create the directory if they do not exist
-        if not os.path.exists(os.path.dirname(image_paths[i])):
-            os.makedirs(os.path.dirname(image_paths[i]))
-        if not os.path.exists(os.path.dirname(ifd_paths[i])):
-            os.makedirs(os.path.dirname(ifd_paths[i]))
-
-        # mantra_node.render()
         render.set_parms_in_take({'show_confirmation' : 0}, rfx_qube_node)
-        rfx_qube_node.parm('execute2').pressButton()
+        start = time.time()
+        eye_cams = {'left' : left_cam, 'right' : right_cam}
+        # The eyes written with their own camera, and those that link to
+        # the first eye because the camera is not a stereo rig
+        written_eyes = eyes[i]
+        linked_eyes = []
+        if eyes[i] and not all(eye_cams[eye] for eye in eyes[i]):
+            print '{0} has no eye cameras, rendering {1} in mono'.format(
+                camera_name, layer_name)
+            written_eyes = eyes[i][:1]
+            linked_eyes = eyes[i][1:]
+            eye_cams = dict((eye, render_cam) for eye in eyes[i])
+        if eyes[i]:
+            # Both eyes come out of this one take set up, each with its own
+            # camera and output paths
+            for eye in written_eyes:
+                hou.hscript('takeinclude {0} *'.format(eye_cams[eye].path()))
+                render.set_parms_in_take({'camera' : eye_cams[eye].path()},
+                                         mantra_node)
+                write_layer_ifds(mantra_node, rfx_qube_node, eye_cams[eye],
+                                 eye_path(image_paths[i], eye),
+                                 eye_path(ifd_paths[i], eye), stream[i],
+                                 tiles[i])
+            for eye in linked_eyes:
+                write_merged_outputs(eye_path(image_paths[i], written_eyes[0]),
+                                     eye_path(image_paths[i], eye),
+                                     eye_path(ifd_paths[i], eye), frame_set,
+                                     stream[i], tiles[i])
+        else:
+            write_layer_ifds(mantra_node, rfx_qube_node, render_cam,
+                             image_paths[i], ifd_paths[i], stream[i], tiles[i])
+        # Streamed layers also render, their time says nothing about IFDs
+        if history_path and not stream[i]:
+            ifd_history.record(history_path, layer_name, len(list(frame_set)),
+                               time.time() - start)
+        outputs = [(image_paths[i], ifd_paths[i])]
+        if eyes[i]:
+            outputs = [(eye_path(image_paths[i], eye), eye_path(ifd_paths[i], eye))
+                       for eye in written_eyes]
+        frames = frame_utils.expand_frames(str(frame_set))
+        for image_path, ifd_path in outputs:
+            # Tiles are only put together after rendering
+            if stream[i] or tiles[i]:
+                break
+            held = {}
+            if skip_held:
+                # Asking for held frames to be skipped says the time does
+                # not change the image
+                held = ifd_hash.skip_held_frames(ifd_path, image_path, frames,
+                                                 ignore_time=True)
+                print 'Skipped {0} held frames of {1}: {2}'.format(
+                    len(held), os.path.basename(ifd_path),
+                    frame_utils.compress_frames(sorted(held)))
+            if cache:
+                # Held frames already link to a frame of their own
+                reused = render_cache.reuse_frames(
+                    cache, layer_name, ifd_path, image_path,
+                    [frame for frame in frames if frame not in held])
+                print 'Reused {0} rendered frames of {1}: {2}'.format(
+                    len(reused), os.path.basename(ifd_path),
+                    frame_utils.compress_frames(sorted(reused)))
 
         # Create the symlink
         items_to_symlink = [render_scene, xml_path]
-        symlink_locations = [os.path.dirname(image_paths[i]),
-                             os.path.dirname(ifd_paths[i])]
+        output_paths = [image_paths[i], ifd_paths[i]]
+        if eyes[i]:
+            output_paths = [eye_path(path, eye) for path in output_paths
+                            for eye in eyes[i]]
+        symlink_locations = [os.path.dirname(path) for path in output_paths]
         symlink_files_to_renders(items_to_symlink, symlink_locations)
 
+    # Merged passes link to the outputs of the pass that renders them
+    for i, layer_name in enumerate(layer_names):
+        if layer_name not in merged:
+            continue
+        primary = layer_names.index(merged[layer_name])
+        frame_set = layer_info[i].frame_range
+        if chunk_frames:
+            frame_set = FrameSet.parse(chunk_frames)
+        outputs = [(image_paths[primary], image_paths[i], ifd_paths[i])]
+        if eyes[i]:
+            outputs = [tuple(eye_path(path, eye) for path in output)
+                       for output in outputs for eye in eyes[i]]
+        for primary_image, image_path, ifd_path in outputs:
+            write_merged_outputs(primary_image, image_path, ifd_path,
+                                 frame_set, stream[i], tiles[i])
+        print 'Merged {0} into {1}'.format(layer_name, merged[layer_name])
+
+    # Put the IFDs of every pack together, a pack is always written by a
+    # single job
+    for pack_path in sorted(set(path for path in pack_paths if path)):
+        members = [i for i, path in enumerate(pack_paths) if path == pack_path]
+        frames = layer_packing.write_pack(
+            [ifd_paths[i] for i in members],
+            [layer_info[i].frame_range for i in members], pack_path)
+        print 'Packed {0} layers into {1} frames of {2}'.format(
+            len(members), len(frames), pack_path)
+
     # Save houdini scene
-    hou.hipFile.save(render_scene)
+    hou.hipFile.save(saved_scene)
 
     # Secure shutdown
 
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+""" A long lived Houdini session that writes the IFDs of spooled work
+items, so that Houdini start up, the license and the HDAs are paid once
+for many submissions instead of once per IFD job.
+
+    hython hbatch_worker.py --spool /path/to/spool --idle-timeout 600
+
+Every item loads its scene archive, runs create_renders with the item's
+arguments and clears the scene again before the next one.  The held render
+jobs of an item are then released.  Those of a failed item stay held, so
+they can be released by hand once its IFDs are written some other way.
+The worker keeps a heartbeat in the spool while it runs, submissions to a
+spool without one fail, see Dispatcher.check_spool.
+"""
+
+# Built-in
+import argparse
+import os
+import socket
+import threading
+import time
+import traceback
+
+#Houdini
+import hou
+
+#Qube
+import qb
+
+#ReelFX
+from lightning.rhou import create_renders
+from lightning.rhou import spool
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+# Seconds without work before the worker exits, 0 runs forever
+IDLE_TIMEOUT = 600
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def reset_scene():
+    """ Throw away everything the last item set up. """
+    hou.hipFile.clear(suppress_save_prompt=True)
+
+def release_jobs(job_ids):
+    """ Let the held qube jobs of an item start. """
+    if job_ids:
+        qb.unblock(job_ids)
+
+def process_item(item):
+    """ Write the IFDs of a single work item. """
+    hou.hipFile.load(item['scene'], suppress_save_prompt=True,
+                     ignore_load_warnings=True)
+    try:
+        create_renders.main(item['args'])
+    finally:
+        reset_scene()
+
+def keep_heartbeat(spool_dir, worker_id, stopped):
+    """ Beat every spool.HEARTBEAT_SECONDS until stopped is set, items may
+    take much longer than that.
+
+    """
+    while not stopped.is_set():
+        spool.heartbeat(spool_dir, worker_id)
+        stopped.wait(spool.HEARTBEAT_SECONDS)
+
+def run(spool_dir, idle_timeout=IDLE_TIMEOUT, max_items=0):
+    """(int) Process work items until the spool has been empty for
+    idle_timeout seconds, or max_items were processed.  Returns the number
+    of items processed.
+
+    """
+    worker_id = '{0}_{1}'.format(socket.gethostname(), os.getpid())
+    stopped = threading.Event()
+    beat = threading.Thread(target=keep_heartbeat,
+                            args=(spool_dir, worker_id, stopped))
+    beat.daemon = True
+    beat.start()
+    try:
+        return process_items(spool_dir, idle_timeout, max_items)
+    finally:
+        stopped.set()
+        beat.join()
+        spool.retire(spool_dir, worker_id)
+
+def process_items(spool_dir, idle_timeout, max_items):
+    """(int) The loop of run. """
+    processed = 0
+    idle_since = time.time()
+    while not max_items or processed < max_items:
+        claimed = spool.claim(spool_dir)
+        if claimed is None:
+            if idle_timeout and time.time() - idle_since > idle_timeout:
+                break
+            time.sleep(spool.POLL_SECONDS)
+            continue
+        item_id, item = claimed
+        print 'Processing work item {0}'.format(item_id)
+        start = time.time()
+        try:
+            process_item(item)
+        except Exception:
+            error = traceback.format_exc()
+            print error
+            spool.finish(spool_dir, item_id, item, error=error)
+        else:
+            spool.finish(spool_dir, item_id, item)
+            print 'Finished work item {0} in {1:.2f}s'.format(
+                item_id, time.time() - start)
+            release_jobs(item.get('release'))
+        processed += 1
+        idle_since = time.time()
+    return processed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--spool', default=spool.SPOOL_DIR)
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT)
+    parser.add_argument('--max-items', type=int, default=0)
+    args = parser.parse_args()
+    run(args.spool, args.idle_timeout, args.max_items)
+
+
+if __name__ == '__main__':
+    main()
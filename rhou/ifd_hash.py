@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+""" Detection of held frames.  Frames whose IFDs only differ in the frame
+number of their labels and image names render the same image, and so do
+frames that also differ in their time unless a shader or motion blur
+depends on it, which is why leaving the time out is up to the caller.
+Only the first frame of such a group is rendered, the IFDs of the others
+are replaced by one that only quits and their images link to the rendered
+one.  The same hashes, time included, key the render_cache.
+
+Nothing in here needs Houdini.
+"""
+
+# Built-in
+import hashlib
+import os
+
+# ReelFX
+from lightning import frame_utils
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+# Lines that differ between frames and versions without changing the image
+IGNORED_PREFIXES = ('#', 'ray_comment', 'ray_image')
+# Lines that hold the time of the frame, only left out with ignore_time
+TIME_PREFIXES = ('ray_time',)
+# Lines that hold the frame number, which is replaced before hashing
+FRAME_PREFIXES = ('ray_property renderer renderlabel', 'ray_property image:')
+FRAME_TOKEN = '<frame>'
+# The IFD of a held frame
+STUB_IFD = 'ray_quit\n'
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def normalize_line(line, frame, ignore_time=False):
+    """(str) A line of an IFD as it is hashed, None when it is left out. """
+    stripped = line.strip()
+    if stripped.startswith(IGNORED_PREFIXES):
+        return None
+    if ignore_time and stripped.startswith(TIME_PREFIXES):
+        return None
+    if stripped.startswith(FRAME_PREFIXES):
+        # The padded number first, so that it is not left half replaced
+        for token in (str(frame).zfill(4), str(frame)):
+            stripped = stripped.replace(token, FRAME_TOKEN)
+    return stripped
+
+def hash_ifd(path, frame, ignore_time=False):
+    """(str) The hash of an IFD with the frame number left out of its
+    labels and image names.  The time is only left out with ignore_time,
+    as shaders and motion blur may depend on it.
+
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as ifd_file:
+        for line in ifd_file:
+            line = normalize_line(line, frame, ignore_time)
+            if line is not None:
+                digest.update(line)
+                digest.update('\n')
+    return digest.hexdigest()
+
+def held_frames(ifd_path, frames, pattern='$F4', ignore_time=False):
+    """(dict) The frames whose IFD is the same as the one of an earlier
+    frame, mapped to that frame.  Frames without an IFD are left out.
+    Every frame has a time of its own, so holds are only found with
+    ignore_time.
+
+    """
+    first_frames = {}
+    held = {}
+    for frame in frames:
+        path = frame_utils.frame_path(ifd_path, frame, pattern)
+        if not os.path.exists(path):
+            continue
+        ifd_hash = hash_ifd(path, frame, ignore_time)
+        if ifd_hash in first_frames:
+            held[frame] = first_frames[ifd_hash]
+        else:
+            first_frames[ifd_hash] = frame
+    return held
+
+def skip_held_frames(ifd_path, image_path, frames, pattern='$F4',
+                     ignore_time=False):
+    """(dict) Find the held frames of a layer and make sure only the first
+    frame of each hold is rendered.  Returns the held frames mapped to the
+    frame they link to.
+
+    """
+    held = held_frames(ifd_path, frames, pattern, ignore_time)
+    image_dir = os.path.dirname(image_path)
+    for frame, first_frame in sorted(held.items()):
+        with open(frame_utils.frame_path(ifd_path, frame, pattern), 'w') as ifd_file:
+            ifd_file.write(STUB_IFD)
+        image = frame_utils.frame_path(image_path, frame, pattern)
+        target = frame_utils.frame_path(image_path, first_frame, pattern)
+        if os.path.lexists(image):
+            os.remove(image)
+        os.symlink(os.path.relpath(target, image_dir), image)
+    return held
@@ -406,9 +406,12 @@ class RenderObject(RenderItem):
 
 #----------------------------------------------------------------------------#
 #--------------------------------------------------------------- Functions --#
-def render(root, passes = [], to_render = True):
+def render(root, passes = [], to_render = True, merge = False, compatible = None):
     """
     Create Mantra ROPs and apply settings
+    With merge, passes that only differ in their AOVs share one ROP, see
+    merge_passes. compatible maps pass names to anything else that has to
+    match for them to be merged.
     """
     selected_nodes = hou.selectedNodes()
     clean_tmp_geoms()
@@ -416,20 +419,36 @@ def render(root, passes = [], to_render = True):
     take_list = hou.hscript('takels -i -q -p Main')[0].split('\n')[:-1]
 
     layers = root.find(type='Pass')
-    mantras = []
-    #Create and setting Mantras
+    pass_mantras = []
     for layer in layers:
         #Only render selected passes when user specified.
         if passes and layer['name'] not in passes:
             continue
+        hou.hscript('takeset Main')
+        pass_mantras.append(Mantra(layer))
+
+    groups = [[mantra] for mantra in pass_mantras]
+    if merge:
+        groups = merge_passes(pass_mantras, compatible)
+
+    mantras = []
+    #Create and setting Mantras
+    for group in groups:
+        mantra = group[0]
+        layer = mantra.layer
+        if len(group) > 1:
+            #The first pass renders the image planes of all of them
+            mantra.planes = merged_planes(group)
 
         # Make sure we are doing everyting starts with Main take
         hou.hscript('takeset Main')
 
         #For each pass we create a Mantra ROP for it.
-        mantra = Mantra(layer)
         #Move the node posititon
         mantra_ROP = create_Mantra_ROP(mantra, pos = (0, layers.index(layer)*-1))
+        #Let the dispatcher know which passes this ROP renders as well
+        if len(group) > 1:
+            mantra_ROP.setUserData('merged_passes', ' '.join(other.name for other in group[1:]))
 
         #Create all the temp objs we need for this render
         create_tmp_geoms(mantra)
@@ -511,6 +530,50 @@ def render(root, passes = [], to_render = True):
     return mantras
 
 
+def merge_key(mantra):
+    """
+    Everything a pass renders apart from its image planes.
+    Passes with the same key render the same scene.
+    """
+    objects = sorted((obj.obj_path, obj.render_mode, repr(sorted(obj.settings.items()))) for obj in mantra.objects)
+    lights = sorted((light.obj_path, repr(sorted(light.settings.items()))) for light in mantra.lights)
+    settings = repr(sorted(mantra.mantra_settings.items()))
+    return (mantra.pass_type, settings, tuple(objects), tuple(lights), mantra.camera.path())
+
+
+def merge_passes(mantras, compatible = None):
+    """
+    Group the Mantra objects that can be rendered by one ROP, in the
+    order of their first pass.
+    compatible maps pass names to anything else that has to match.
+    """
+    groups = []
+    by_key = {}
+    for mantra in mantras:
+        key = merge_key(mantra)
+        if compatible is not None:
+            key = (key, compatible.get(mantra.name))
+        if key not in by_key:
+            by_key[key] = []
+            groups.append(by_key[key])
+        by_key[key].append(mantra)
+
+    return groups
+
+
+def merged_planes(mantras):
+    """
+    Get the image planes of all the Mantra objects, without duplicates.
+    """
+    planes = []
+    for mantra in mantras:
+        for plane in mantra.planes:
+            if plane not in planes:
+                planes.append(plane)
+
+    return planes
+
+
 def create_Mantra_ROP(mantra, pos = None):
     """
     Create a Mantra ROP in Houdini.
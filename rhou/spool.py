@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+""" A spool directory of IFD work items for warm hbatch workers, see
+hbatch_worker.  The render jobs of an item are submitted held and the
+worker releases them once it wrote the IFDs, so nothing waits on the
+workers in between.  Every item is a small json file that moves between
+the state directories with a rename, so any number of dispatchers and
+workers can share a spool without a lock.
+
+    <spool>/pending/<item>.json  waiting for a worker
+    <spool>/working/<item>.json  claimed by a worker
+    <spool>/done/<item>.json     IFDs written
+    <spool>/failed/<item>.json   the error is kept in the item
+    <spool>/workers/<worker>     touched by every running worker
+
+Nothing in here needs Houdini.
+"""
+
+# Built-in
+import json
+import os
+import tempfile
+import time
+import uuid
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+SPOOL_DIR = os.environ.get(
+    'LIGHTNING_HBATCH_SPOOL',
+    os.path.join(os.path.expanduser('~'), '.lightning', 'hbatch_spool'))
+PENDING = 'pending'
+WORKING = 'working'
+DONE = 'done'
+FAILED = 'failed'
+STATES = (PENDING, WORKING, DONE, FAILED)
+# Directory of the heartbeat files of the running workers
+WORKERS = 'workers'
+# Seconds between looks at an empty spool
+POLL_SECONDS = 0.5
+# Seconds between the heartbeats of a worker, and after which a worker that
+# missed its heartbeats counts as gone
+HEARTBEAT_SECONDS = 10
+WORKER_TIMEOUT = 60
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def state_dir(spool_dir, state):
+    path = os.path.join(spool_dir, state)
+    if not os.path.exists(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # Made by another process in the meantime
+            pass
+    return path
+
+def item_path(spool_dir, state, item_id):
+    return os.path.join(state_dir(spool_dir, state), '{0}.json'.format(item_id))
+
+def _write_item(path, item):
+    """ Write an item next to its final path and rename it into place. """
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                        prefix='.', suffix='.tmp')
+    with os.fdopen(tmp_fd, 'w') as item_file:
+        json.dump(item, item_file)
+    os.rename(tmp_path, path)
+
+def _read_item(path):
+    with open(path) as item_file:
+        return json.load(item_file)
+
+def submit(spool_dir, scene_path, job_args, release=None):
+    """(str) Queue a work item and return its id.  scene_path is the scene
+    the worker loads and job_args the create_renders arguments, the same
+    ones an IFD job gets.  release are the ids of the held qube jobs the
+    worker releases once the item is done.
+
+    """
+    # Ids sort in submission order
+    item_id = '{0:.6f}_{1}'.format(time.time(), uuid.uuid4().hex[:8])
+    item = {
+        'id' : item_id,
+        'scene' : scene_path,
+        'args' : job_args,
+        'release' : list(release or []),
+        'submitted' : time.time(),
+    }
+    _write_item(item_path(spool_dir, PENDING, item_id), item)
+    return item_id
+
+def claim(spool_dir):
+    """(str, dict) Take the oldest pending item for this process and return
+    its id and contents.  None when nothing is pending.
+
+    """
+    pending_dir = state_dir(spool_dir, PENDING)
+    for name in sorted(os.listdir(pending_dir)):
+        if not name.endswith('.json'):
+            continue
+        item_id = name[:-len('.json')]
+        working_path = item_path(spool_dir, WORKING, item_id)
+        try:
+            os.rename(os.path.join(pending_dir, name), working_path)
+        except OSError:
+            # Another worker got there first
+            continue
+        return item_id, _read_item(working_path)
+    return None
+
+def finish(spool_dir, item_id, item, error=None):
+    """ Move a claimed item to done, or to failed with the error. """
+    item = dict(item, finished=time.time())
+    state = DONE
+    if error is not None:
+        item['error'] = error
+        state = FAILED
+    _write_item(item_path(spool_dir, state, item_id), item)
+    try:
+        os.remove(item_path(spool_dir, WORKING, item_id))
+    except OSError:
+        pass
+
+def status(spool_dir, item_id):
+    """(str) The state an item is in, or None if it is unknown. """
+    for state in STATES:
+        if os.path.exists(item_path(spool_dir, state, item_id)):
+            return state
+    return None
+
+def heartbeat(spool_dir, worker_id):
+    """ Let submissions know a worker is running, see live_workers. """
+    path = os.path.join(state_dir(spool_dir, WORKERS), worker_id)
+    with open(path, 'a'):
+        os.utime(path, None)
+
+def retire(spool_dir, worker_id):
+    """ Remove the heartbeat of a worker that stops. """
+    try:
+        os.remove(os.path.join(state_dir(spool_dir, WORKERS), worker_id))
+    except OSError:
+        pass
+
+def live_workers(spool_dir, timeout=WORKER_TIMEOUT):
+    """(list) The ids of the workers whose heartbeat is recent. """
+    workers_dir = os.path.join(spool_dir, WORKERS)
+    if not os.path.isdir(workers_dir):
+        return []
+    now = time.time()
+    workers = []
+    for worker_id in os.listdir(workers_dir):
+        try:
+            beat = os.path.getmtime(os.path.join(workers_dir, worker_id))
+        except OSError:
+            # Retired in the meantime
+            continue
+        if now - beat < timeout:
+            workers.append(worker_id)
+    return sorted(workers)
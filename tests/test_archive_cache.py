@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+""" Tests of the reuse of scene archives by archive_cache. """
+
+# Built-in
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+# ReelFX
+from lightning import archive_cache
+from lightning.archive_cache import ArchiveIndex
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+class ArchiveCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='archive_cache_test_')
+        self.index = ArchiveIndex(os.path.join(self.root, 'index'))
+        self.archived = []
+        # Scenes of the tests reference $JOB, which is set per test
+        self.job = os.environ.pop('JOB', None)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        os.environ.pop('JOB', None)
+        if self.job is not None:
+            os.environ['JOB'] = self.job
+
+    def write(self, name, data):
+        path = os.path.join(self.root, name)
+        with open(path, 'w') as output_file:
+            output_file.write(data)
+        return path
+
+    def archive(self, scene_path, path_formula):
+        """ Stands in for scene_archive, copying the scene. """
+        archive_path = os.path.join(self.root, 'archive_{0}.hip'.format(
+            len(self.archived)))
+        shutil.copy(scene_path, archive_path)
+        self.archived.append(scene_path)
+        return archive_path
+
+    def archive_scene(self, scene_path):
+        return archive_cache.archive_scene(scene_path, 'formula', self.index,
+                                           self.archive)
+
+    def test_index(self):
+        archive = self.write('archive.hip', 'scene')
+        self.assertEqual(self.index.get('a.hip', 'abc'), None)
+        self.index.add('a.hip', 'abc', archive)
+        self.assertEqual(self.index.get('a.hip', 'abc'), archive)
+        self.assertEqual(self.index.get('a.hip', 'def'), None)
+        self.assertEqual(self.index.get('b.hip', 'abc'), None)
+        # Entries of archives that are gone are dropped
+        os.remove(archive)
+        self.assertEqual(self.index.get('a.hip', 'abc'), None)
+        self.assertEqual(os.listdir(self.index.path), [])
+
+    def test_prune(self):
+        self.index.max_entries = 2
+        archive = self.write('archive.hip', 'scene')
+        now = time.time()
+        for number, scene in enumerate(('a.hip', 'b.hip')):
+            self.index.add(scene, 'abc', archive)
+            entry_path = self.index.entry_path(scene, 'abc')
+            os.utime(entry_path, (now - 60 + number, now - 60 + number))
+        self.index.add('c.hip', 'abc', archive)
+        self.assertEqual(self.index.get('a.hip', 'abc'), None)
+        self.assertEqual(self.index.get('b.hip', 'abc'), archive)
+        self.assertEqual(self.index.get('c.hip', 'abc'), archive)
+
+    def test_hash_scene(self):
+        first = self.write('a.hip', 'scene')
+        second = self.write('b.hip', 'scene')
+        self.assertEqual(archive_cache.hash_scene(first),
+                         archive_cache.hash_scene(second))
+        self.write('b.hip', 'other scene')
+        self.assertNotEqual(archive_cache.hash_scene(first),
+                            archive_cache.hash_scene(second))
+
+    def test_hash_scene_of_referenced_files(self):
+        os.makedirs(os.path.join(self.root, 'cache'))
+        for frame in (1, 2):
+            self.write(os.path.join('cache', 'geo.{0:04d}.bgeo'.format(frame)),
+                       'points')
+        scene = self.write('shot.hip', 'file "$HIP/cache/geo.$F4.bgeo"\n'
+                           'object "/obj/geo1"\n')
+        scene_hash = archive_cache.hash_scene(scene)
+        self.assertNotEqual(scene_hash, None)
+        self.assertEqual(archive_cache.hash_scene(scene), scene_hash)
+        # Any frame of a referenced sequence changes the hash
+        self.write(os.path.join('cache', 'geo.0002.bgeo'), 'more points')
+        self.assertNotEqual(archive_cache.hash_scene(scene), scene_hash)
+
+    def test_hash_scene_of_unresolved_references(self):
+        scene = self.write('shot.hip', 'file "$JOB/tex/a.rat"\n')
+        self.assertEqual(archive_cache.hash_scene(scene), None)
+        os.environ['JOB'] = self.root
+        self.assertNotEqual(archive_cache.hash_scene(scene), None)
+
+    def test_archive_scene_without_a_hash(self):
+        scene = self.write('shot.hip', 'file "$JOB/tex/a.rat"\n')
+        first, scene_hash = self.archive_scene(scene)
+        second, scene_hash = self.archive_scene(scene)
+        self.assertEqual(scene_hash, None)
+        self.assertEqual(self.archived, [scene, scene])
+        self.assertFalse(os.path.exists(self.index.path))
+
+    def test_link_archive(self):
+        archive = self.write('archive.hip', 'scene')
+        first = archive_cache.link_archive(archive)
+        second = archive_cache.link_archive(archive)
+        self.assertNotEqual(first, second)
+        for link in (first, second):
+            self.assertEqual(os.stat(link).st_ino, os.stat(archive).st_ino)
+
+    def test_archive_scene_reuses_unchanged_scenes(self):
+        scene = self.write('shot.hip', 'scene')
+        first, scene_hash = self.archive_scene(scene)
+        second, second_hash = self.archive_scene(scene)
+        self.assertEqual(self.archived, [scene])
+        self.assertEqual(scene_hash, second_hash)
+        self.assertNotEqual(first, second)
+        self.assertEqual(os.stat(first).st_ino, os.stat(second).st_ino)
+        # The index keeps pointing at the archive that was written
+        self.assertEqual(self.index.get(scene, scene_hash), first)
+
+    def test_archive_scene_of_changed_references(self):
+        texture = self.write('texture.rat', 'pixels')
+        scene = self.write('shot.hip', 'file "{0}"\n'.format(texture))
+        self.archive_scene(scene)
+        self.archive_scene(scene)
+        self.write('texture.rat', 'other pixels')
+        os.utime(texture, (time.time() + 10, time.time() + 10))
+        self.archive_scene(scene)
+        self.assertEqual(self.archived, [scene, scene])
+
+    def test_archive_scene_of_changed_or_other_scenes(self):
+        scene = self.write('shot.hip', 'scene')
+        other = self.write('other_shot.hip', 'scene')
+        self.archive_scene(scene)
+        self.archive_scene(other)
+        self.write('shot.hip', 'changed scene')
+        self.archive_scene(scene)
+        self.assertEqual(self.archived, [scene, other, scene])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+""" Tests of the job graph the Dispatcher builds, submitted to the local
+farm backend.
+"""
+
+# Built-in
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+# ReelFX
+from lightning import frame_utils
+from lightning import ifd_retention
+from lightning import manifest
+from lightning.benchmark_submission import Resolution
+from lightning.dispatcher import (Dispatcher, HBATCH_DIRECT, HBATCH_FRAME_CHUNK,
+                                  HELD_STATUS)
+from lightning.farm_backend import LocalBackend, LocalWipContext, LocalPathContext
+from lightning.layer_spec import LayerSpec
+from lightning.rhou import spool
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+SHOT = '9999_0010'
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def make_layers(count, frame_range='101-110', **kwargs):
+    """(list) Beauty layers named layer0, layer1 and so on. """
+    return [LayerSpec('layer{0}'.format(i), pass_type='beauty',
+                      frame_range=frame_range, camera='shotcam', **kwargs)
+            for i in range(count)]
+
+def frames_of(layer):
+    return frame_utils.expand_frames(str(layer.frame_range))
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+class CountingBackend(LocalBackend):
+    """ Counts the scene archives that run at the same time. """
+    def __init__(self, root):
+        super(CountingBackend, self).__init__(root)
+        self.archiving = 0
+        self.most_archiving = 0
+        self._count_lock = threading.Lock()
+
+    def scene_archive(self, scene_path, path_formula):
+        with self._count_lock:
+            self.archiving += 1
+            self.most_archiving = max(self.most_archiving, self.archiving)
+        try:
+            time.sleep(0.05)
+            return super(CountingBackend, self).scene_archive(scene_path,
+                                                              path_formula)
+        finally:
+            with self._count_lock:
+                self.archiving -= 1
+
+
+class DispatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='dispatcher_test_')
+        os.environ.setdefault('PKG_LIGHTNING', os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__))))
+        self.backend = LocalBackend(self.root)
+        self.write_scene('0010')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write_scene(self, shot, data='scene'):
+        scene_path = LocalWipContext(self.root, shot=shot).get_default_scene_path()
+        if not os.path.exists(os.path.dirname(scene_path)):
+            os.makedirs(os.path.dirname(scene_path))
+        with open(scene_path, 'w') as scene_file:
+            scene_file.write(data)
+        return scene_path
+
+    def dispatcher(self, layers, shot='0010', **kwargs):
+        kwargs.setdefault('reuse_archives', False)
+        return Dispatcher(LocalWipContext(self.root, shot=shot),
+                          LocalPathContext(self.root), Resolution(), 'exr',
+                          layers, backend=self.backend, **kwargs)
+
+    def jobs(self, prefix=''):
+        """(dict) The jobs of the last submitter by label. """
+        return dict((job.label, job) for job in self.backend.submitters[-1]
+                    if job.label.startswith(prefix))
+
+    def dependencies(self, job):
+        return sorted(dependency.label for dependency, event in job.dependencies)
+
+    def write_frames(self, dispatcher, index, frames, size=1024):
+        image_path = dispatcher.render_paths[index]
+        if not os.path.exists(os.path.dirname(image_path)):
+            os.makedirs(os.path.dirname(image_path))
+        for frame in frames:
+            with open(frame_utils.frame_path(image_path, frame), 'wb') as image:
+                image.write(b'\0' * size)
+
+
+class SubmitTest(DispatcherTestCase):
+    def test_a_job_per_layer(self):
+        dispatcher = self.dispatcher(make_layers(3))
+        result = dispatcher.submit()
+        self.assertEqual(sorted(result), sorted(self.jobs()))
+        ifd_jobs = self.jobs('IFD_Creation_')
+        render_jobs = self.jobs('Render_')
+        self.assertEqual(len(ifd_jobs), 3)
+        self.assertEqual(len(render_jobs), 3)
+        for i in range(3):
+            render_job = render_jobs['Render_{0}_layer{1}'.format(SHOT, i)]
+            self.assertEqual(self.dependencies(render_job),
+                             ['IFD_Creation_{0}_layer{1}'.format(SHOT, i)])
+            self.assertEqual(render_job.executer.kwargs['ifd_path'],
+                             dispatcher.ifd_paths[i])
+        # The IFD jobs read everything else from the manifest
+        ifd_job = ifd_jobs['IFD_Creation_{0}_layer1'.format(SHOT)]
+        job_args = ifd_job.executer.kwargs['py_args']
+        self.assertEqual((job_args['manifest_path'], job_args['layers']),
+                         (dispatcher.manifest_path, [1]))
+        self.assertEqual(ifd_job.executer.kwargs['startup_scene'],
+                         dispatcher.scene_archive_path)
+        data = manifest.load(dispatcher.manifest_path)
+        self.assertEqual(data['image_paths'], dispatcher.render_paths)
+        self.assertEqual([layer.layer for layer in data['layer_info']],
+                         ['layer0', 'layer1', 'layer2'])
+        self.assertTrue(os.path.exists(dispatcher.xml_path))
+
+    def test_one_ifd_job(self):
+        self.dispatcher(make_layers(3), ifd_group_size=0).submit()
+        label = 'IFD_Creation_{0}'.format(SHOT)
+        self.assertEqual(sorted(self.jobs('IFD_')), [label])
+        for render_job in self.jobs('Render_').values():
+            self.assertEqual(self.dependencies(render_job), [label])
+
+    def test_merged_passes_share_a_job(self):
+        layers = make_layers(4)
+        layers[1].pass_type = 'shadow'
+        layers[3].frame_range = layers[3].frame_range.parse('101-105')
+        self.dispatcher(layers, merge_passes=True).submit()
+        ifd_jobs = self.jobs('IFD_Creation_')
+        self.assertEqual(sorted((label, job.executer.kwargs['py_args']['layers'])
+                                for label, job in ifd_jobs.items()),
+                         [('IFD_Creation_{0}_layer1'.format(SHOT), [1]),
+                          ('IFD_Creation_{0}_layer3'.format(SHOT), [3]),
+                          ('IFD_Creation_{0}_part01'.format(SHOT), [0, 2])])
+
+    def test_ifd_retention(self):
+        first = self.dispatcher(make_layers(1))
+        first.submit()
+        registry = first.ifd_registry_dir
+        # Nothing is registered without a policy
+        self.assertFalse(os.path.exists(registry))
+        dispatcher = self.dispatcher(make_layers(2),
+                                     ifd_policy=ifd_retention.RetentionPolicy())
+        dispatcher.submit()
+        self.assertEqual(len(ifd_retention.load_entries(registry)), 2)
+        ifd_dir = os.path.dirname(dispatcher.ifd_paths[1])
+        self.assertEqual(ifd_retention.pending_jobs(registry, ifd_dir),
+                         ['{0}/Render_{1}_layer1'.format(
+                             dispatcher.submission_basename, SHOT)])
+
+    def test_frame_chunks(self):
+        layers = make_layers(1, frame_range='101-125',
+                             hbatch_dist=HBATCH_FRAME_CHUNK)
+        self.dispatcher(layers).submit()
+        ifd_jobs = self.jobs('IFD_Creation_')
+        self.assertEqual(len(ifd_jobs), 3)
+        chunks = [job.executer.kwargs['py_args']['frames']
+                  for label, job in sorted(ifd_jobs.items())]
+        self.assertEqual(chunks, ['101-110', '111-120', '121-125'])
+        # Every chunk is rendered once its own IFDs are written
+        for number in (1, 2, 3):
+            render_job = self.jobs()['Render_{0}_layer0_c{1:02d}'.format(
+                SHOT, number)]
+            self.assertEqual(self.dependencies(render_job),
+                             ['IFD_Creation_{0}_layer0_c{1:02d}'.format(
+                                 SHOT, number)])
+
+    def test_after_job(self):
+        after_job = self.backend.create_job(None, None, 'dead', label='Sim')
+        self.dispatcher(make_layers(1), after_job=after_job).submit()
+        ifd_job = self.jobs('IFD_')['IFD_Creation_{0}'.format(SHOT)]
+        self.assertEqual(self.dependencies(ifd_job), ['Sim'])
+
+    def test_test_only(self):
+        dispatcher = self.dispatcher(make_layers(2), test_only=True)
+        result = dispatcher.submit()
+        self.assertEqual(dict(result), {})
+        self.assertEqual(self.backend.submitters, [])
+        self.assertTrue(os.path.exists(dispatcher.render_args_path))
+        self.assertFalse(os.path.exists(dispatcher.manifest_path))
+
+    def test_spool(self):
+        spool_dir = os.path.join(self.root, 'spool')
+        spool.heartbeat(spool_dir, 'worker')
+        result = self.dispatcher(make_layers(2), spool_dir=spool_dir).submit()
+        # The spool writes the IFDs, the render jobs wait for it held
+        self.assertEqual(self.jobs('IFD_'), {})
+        for render_job in self.jobs('Render_').values():
+            self.assertEqual(render_job.settings['status'], HELD_STATUS)
+            self.assertEqual(render_job.dependencies, [])
+        released = []
+        claimed = spool.claim(spool_dir)
+        while claimed:
+            released.extend(claimed[1]['release'])
+            claimed = spool.claim(spool_dir)
+        self.assertEqual(sorted(released), sorted(result.values()))
+
+    def test_spool_without_workers(self):
+        spool_dir = os.path.join(self.root, 'spool')
+        self.assertRaises(RuntimeError, self.dispatcher, make_layers(2),
+                          spool_dir=spool_dir)
+        self.assertEqual(self.backend.archives, [])
+
+
+class StreamTest(DispatcherTestCase):
+    def test_streamed_layer(self):
+        layers = make_layers(2)
+        layers[1].hbatch_dist = HBATCH_DIRECT
+        self.dispatcher(layers).submit()
+        self.assertEqual(sorted(self.jobs('Render_')),
+                         ['Render_{0}_layer0'.format(SHOT)])
+        job = self.jobs('IFD_')['IFD_Creation_{0}_layer1_direct'.format(SHOT)]
+        # Mantra runs on the host of the IFD job
+        self.assertEqual((job.cluster, job.settings['requirements']),
+                         ('dead', ['host.dead=1']))
+
+    def test_no_stream_with_ifd_options(self):
+        layers = make_layers(1, hbatch_dist=HBATCH_DIRECT)
+        for kwargs in ({'skip_held_frames' : True}, {'reuse_renders' : True},
+                       {'ifd_policy' : ifd_retention.RetentionPolicy()},
+                       {'tiles' : 4}):
+            dispatcher = self.dispatcher(layers, **kwargs)
+            self.assertFalse(dispatcher.streams(0), kwargs)
+
+    def test_streamed_layers_skip_the_spool(self):
+        spool_dir = os.path.join(self.root, 'spool')
+        # No worker is needed when every layer is streamed
+        self.dispatcher(make_layers(1, hbatch_dist=HBATCH_DIRECT),
+                        spool_dir=spool_dir)
+        spool.heartbeat(spool_dir, 'worker')
+        layers = make_layers(2)
+        layers[1].hbatch_dist = HBATCH_DIRECT
+        self.dispatcher(layers, spool_dir=spool_dir).submit()
+        self.assertEqual(sorted(self.jobs('IFD_')),
+                         ['IFD_Creation_{0}_layer1_direct'.format(SHOT)])
+        pending = os.listdir(spool.state_dir(spool_dir, spool.PENDING))
+        self.assertEqual(len(pending), 1)
+
+
+class BatchTest(DispatcherTestCase):
+    def specs(self, shots):
+        specs = []
+        for shot in shots:
+            self.write_scene(shot)
+            specs.append((LocalWipContext(self.root, shot=shot),
+                          LocalPathContext(os.path.join(self.root, shot)),
+                          make_layers(2)))
+        return specs
+
+    def test_submit_batch(self):
+        shots = ['0010', '0020', '0030']
+        results = Dispatcher.submit_batch(
+            self.specs(shots), Resolution(), 'exr', backend=self.backend,
+            reuse_archives=False)
+        self.assertEqual(len(self.backend.submitters), 1)
+        for shot, (dispatcher, result) in zip(shots, results):
+            self.assertEqual(str(dispatcher.wip_ctx.shot), shot)
+            self.assertEqual(len(result), 4)
+            for label in result:
+                self.assertTrue('_{0}_'.format(shot) in label, label)
+            self.assertTrue(os.path.exists(dispatcher.manifest_path))
+        self.assertEqual(len(self.jobs()), 12)
+
+    def test_workers_bound_the_archives(self):
+        self.backend = CountingBackend(self.root)
+        shots = ['00{0}0'.format(number) for number in range(1, 7)]
+        Dispatcher.submit_batch(self.specs(shots), Resolution(), 'exr',
+                                workers=2, backend=self.backend,
+                                reuse_archives=False)
+        self.assertEqual(len(self.backend.archives), 6)
+        self.assertEqual(self.backend.most_archiving, 2)
+
+    def test_test_only(self):
+        results = Dispatcher.submit_batch(
+            self.specs(['0010', '0020']), Resolution(), 'exr',
+            backend=self.backend, reuse_archives=False, test_only=True)
+        self.assertEqual(self.backend.submitters, [])
+        for dispatcher, result in results:
+            self.assertEqual(dict(result), {})
+            self.assertTrue(os.path.exists(dispatcher.render_args_path))
+            self.assertFalse(os.path.exists(dispatcher.manifest_path))
+
+
+class NarrowingTest(DispatcherTestCase):
+    def test_repair(self):
+        first = self.dispatcher(make_layers(3))
+        first.submit()
+        archives = len(self.backend.archives)
+        self.write_frames(first, 0, range(101, 111))
+        self.write_frames(first, 1, [101, 102, 104, 105, 106, 107, 108, 109, 110])
+        self.write_frames(first, 1, [103], size=0)
+        repair = self.dispatcher(make_layers(3), repair=True)
+        repair.submit()
+        self.assertEqual([(layer.layer, frames_of(layer))
+                          for layer in repair.layer_info],
+                         [('layer1', [103]), ('layer2', list(range(101, 111)))])
+        # The frames match the rest of the version
+        self.assertEqual([version.number for version in repair.output_versions],
+                         [1, 1])
+        self.assertEqual(len(self.backend.archives), archives)
+        self.assertEqual(repair.render_args['render_scene'],
+                         first.render_args['render_scene'])
+        self.assertEqual(sorted(self.jobs('Render_')),
+                         ['Render_{0}_layer1'.format(SHOT),
+                          'Render_{0}_layer2'.format(SHOT)])
+
+    def test_incremental(self):
+        first = self.dispatcher(make_layers(3), incremental=True)
+        first.submit()
+        self.write_frames(first, 0, range(101, 111))
+        self.write_frames(first, 1, range(101, 111))
+        self.write_frames(first, 2, range(101, 111))
+        layers = make_layers(3)
+        layers[0].camera = 'othercam'
+        layers[1].frame_range = layers[1].frame_range.parse('101-115')
+        second = self.dispatcher(layers, incremental=True)
+        result = second.submit()
+        self.assertEqual([(layer.layer, frames_of(layer))
+                          for layer in second.layer_info],
+                         [('layer0', list(range(101, 111))),
+                          ('layer1', list(range(111, 116)))])
+        self.assertEqual(result.reused, {'layer1' : '101-110',
+                                         'layer2' : '101-110'})
+        self.assertEqual(second.render_args['render_scene'],
+                         first.render_args['render_scene'])
+
+    def test_incremental_after_repair(self):
+        first = self.dispatcher(make_layers(2), incremental=True)
+        first.submit()
+        self.write_frames(first, 0, range(101, 111))
+        self.write_frames(first, 1, range(101, 110))
+        repair = self.dispatcher(make_layers(2), repair=True)
+        repair.submit()
+        self.assertEqual(repair.render_args['scene_hash'],
+                         first.render_args['scene_hash'])
+        self.write_frames(first, 1, [110])
+        second = self.dispatcher(make_layers(2), incremental=True)
+        result = second.submit()
+        self.assertEqual(second.layer_info, [])
+        self.assertEqual(result.reused, {'layer0' : '101-110',
+                                         'layer1' : '101-110'})
+        self.assertEqual(second.render_args['render_scene'],
+                         first.render_args['render_scene'])
+
+    def test_incremental_changed_scene(self):
+        first = self.dispatcher(make_layers(2), incremental=True)
+        first.submit()
+        self.write_frames(first, 0, range(101, 111))
+        self.write_frames(first, 1, range(101, 111))
+        self.write_scene('0010', 'changed scene')
+        second = self.dispatcher(make_layers(2), incremental=True)
+        result = second.submit()
+        self.assertEqual(result.reused, {})
+        self.assertEqual(len(second.layer_info), 2)
+        self.assertNotEqual(second.render_args['render_scene'],
+                            first.render_args['render_scene'])
+
+
+if __name__ == '__main__':
+    unittest.main()
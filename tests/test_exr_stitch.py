@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+""" Tests of exr_stitch on small tiles with HALF and FLOAT channels, AOVs
+included, written to a temporary directory.
+"""
+
+# Built-in
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+# Third party
+try:
+    import Imath
+    import OpenEXR
+except ImportError:
+    OpenEXR = None
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+WIDTH = 8
+HEIGHT = 6
+# The (min x, min y, max x, max y) of four tiles covering the frame
+TILE_WINDOWS = [(0, 0, 3, 2), (4, 0, 7, 2), (0, 3, 3, 5), (4, 3, 7, 5)]
+FLOAT_CHANNELS = ('R', 'G', 'B', 'diffuse.R')
+HALF_CHANNELS = ('N.x', 'N.y')
+
+#------------------------------------------------------------------------------
+# FUNCTIONS
+#------------------------------------------------------------------------------
+def pixel_bytes(name, x, y):
+    """(bytes) The value of a pixel of a channel, different everywhere. """
+    if name in HALF_CHANNELS:
+        # Half floats between 1 and 2, as raw bits
+        return struct.pack('<H', 0x3C00 + HALF_CHANNELS.index(name) * 64 +
+                           y * WIDTH + x)
+    return struct.pack('<f', FLOAT_CHANNELS.index(name) * 100 + y * 10 + x)
+
+def channel_bytes(name, window):
+    """(bytes) A channel of the pixels of a data window, row by row. """
+    min_x, min_y, max_x, max_y = window
+    return b''.join(pixel_bytes(name, x, y)
+                    for y in range(min_y, max_y + 1)
+                    for x in range(min_x, max_x + 1))
+
+def write_tile(path, window, channels=FLOAT_CHANNELS + HALF_CHANNELS):
+    """ Write an EXR of the frame holding the pixels of one window. """
+    float_type = Imath.PixelType(Imath.PixelType.FLOAT)
+    half_type = Imath.PixelType(Imath.PixelType.HALF)
+    header = OpenEXR.Header(WIDTH, HEIGHT)
+    header['dataWindow'] = Imath.Box2i(Imath.V2i(window[0], window[1]),
+                                       Imath.V2i(window[2], window[3]))
+    header['channels'] = dict(
+        (name, Imath.Channel(half_type if name in HALF_CHANNELS else float_type))
+        for name in channels)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    output = OpenEXR.OutputFile(path, header)
+    try:
+        output.writePixels(dict((name, channel_bytes(name, window))
+                                for name in channels))
+    finally:
+        output.close()
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+@unittest.skipIf(OpenEXR is None, 'OpenEXR is not installed')
+class StitchTest(unittest.TestCase):
+    def setUp(self):
+        # Imported once OpenEXR is known to be there, so that a broken
+        # exr_stitch fails the tests instead of skipping them
+        from lightning import exr_stitch
+        self.exr_stitch = exr_stitch
+        self.root = tempfile.mkdtemp(prefix='exr_stitch_test_')
+        self.image_path = os.path.join(self.root, 'image.$F4.exr')
+        self.tile_paths = [os.path.join(self.root, 'tile{0:02d}'.format(tile),
+                                        'image.$F4.exr')
+                           for tile in range(len(TILE_WINDOWS))]
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write_frame_tiles(self, frame, windows=TILE_WINDOWS):
+        for path, window in zip(self.tile_paths, windows):
+            write_tile(path.replace('$F4', '{0:04d}'.format(frame)), window)
+
+    def read_frame(self, frame):
+        path = self.image_path.replace('$F4', '{0:04d}'.format(frame))
+        image = OpenEXR.InputFile(path)
+        try:
+            header = image.header()
+            channels = dict((name, image.channel(name, channel.type))
+                            for name, channel in header['channels'].items())
+        finally:
+            image.close()
+        return header, channels
+
+    def test_stitched_frame(self):
+        self.write_frame_tiles(101)
+        missing = self.exr_stitch.stitch_frames(self.tile_paths,
+                                                self.image_path, '101')
+        self.assertEqual(missing, [])
+        header, channels = self.read_frame(101)
+        self.assertEqual(self.exr_stitch.data_window(header),
+                         (0, 0, WIDTH - 1, HEIGHT - 1))
+        self.assertEqual(sorted(channels),
+                         sorted(FLOAT_CHANNELS + HALF_CHANNELS))
+        for name in HALF_CHANNELS:
+            self.assertEqual(header['channels'][name].type.v,
+                             Imath.PixelType.HALF)
+        window = (0, 0, WIDTH - 1, HEIGHT - 1)
+        for name, data in channels.items():
+            self.assertEqual(data, channel_bytes(name, window), name)
+
+    def test_uncovered_pixels_are_black(self):
+        windows = [(0, 0, 3, 2), (4, 3, 7, 5)]
+        self.tile_paths = self.tile_paths[:2]
+        self.write_frame_tiles(101, windows)
+        self.exr_stitch.stitch_frames(self.tile_paths, self.image_path, '101')
+        header, channels = self.read_frame(101)
+        self.assertEqual(self.exr_stitch.data_window(header), (0, 0, 7, 5))
+        size = self.exr_stitch.pixel_size(header['channels']['R'])
+        data = channels['R']
+        # Left of the second tile, in its first row
+        start = (3 * WIDTH) * size
+        self.assertEqual(data[start:start + 4 * size], b'\0' * 4 * size)
+        start = (3 * WIDTH + 4) * size
+        self.assertEqual(data[start:start + size], pixel_bytes('R', 4, 3))
+
+    def test_missing_tiles(self):
+        self.write_frame_tiles(101)
+        self.write_frame_tiles(102, TILE_WINDOWS[:3])
+        missing = self.exr_stitch.stitch_frames(self.tile_paths,
+                                                self.image_path, '101-102')
+        self.assertEqual(missing, [102])
+        self.assertTrue(os.path.exists(self.image_path.replace('$F4', '0101')))
+        self.assertFalse(os.path.exists(self.image_path.replace('$F4', '0102')))
+
+    def test_linked_frames_are_kept(self):
+        self.write_frame_tiles(101)
+        image = self.image_path.replace('$F4', '0101')
+        os.symlink('other.0101.exr', image)
+        missing = self.exr_stitch.stitch_frames(self.tile_paths,
+                                                self.image_path, '101')
+        self.assertEqual(missing, [])
+        self.assertEqual(os.readlink(image), 'other.0101.exr')
+
+
+if __name__ == '__main__':
+    unittest.main()
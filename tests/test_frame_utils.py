@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+""" Tests of the frame range helpers of frame_utils. """
+
+# Built-in
+import os
+import shutil
+import tempfile
+import unittest
+
+# ReelFX
+from lightning import frame_utils
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+class FrameRangeTest(unittest.TestCase):
+    def test_expand_frames(self):
+        self.assertEqual(frame_utils.expand_frames('101-105'),
+                         [101, 102, 103, 104, 105])
+        self.assertEqual(frame_utils.expand_frames('101-111x5'), [101, 106, 111])
+        self.assertEqual(frame_utils.expand_frames('101, 105,110-112'),
+                         [101, 105, 110, 111, 112])
+        self.assertEqual(frame_utils.expand_frames(7), [7])
+
+    def test_expand_negative_frames(self):
+        self.assertEqual(frame_utils.expand_frames('-2-1'), [-2, -1, 0, 1])
+        self.assertEqual(frame_utils.expand_frames('-5'), [-5])
+
+    def test_expand_keeps_the_first_of_repeated_frames(self):
+        self.assertEqual(frame_utils.expand_frames('3,1-4,2'), [3, 1, 2, 4])
+
+    def test_compress_frames(self):
+        self.assertEqual(frame_utils.compress_frames([101, 102, 103, 105]),
+                         '101-103,105')
+        self.assertEqual(frame_utils.compress_frames([5, 1, 2]), '5,1-2')
+        self.assertEqual(frame_utils.compress_frames([]), '')
+
+    def test_compress_round_trip(self):
+        frame_range = '1-10,12,20-25'
+        frames = frame_utils.expand_frames(frame_range)
+        self.assertEqual(frame_utils.compress_frames(frames), frame_range)
+
+    def test_chunk_frames(self):
+        self.assertEqual(frame_utils.chunk_frames([1, 2, 3, 4, 5], 2),
+                         [[1, 2], [3, 4], [5]])
+        self.assertEqual(frame_utils.chunk_frames([1, 2], 0), [[1], [2]])
+
+    def test_frame_path(self):
+        self.assertEqual(frame_utils.frame_path('image.$F4.exr', 7),
+                         'image.0007.exr')
+        self.assertEqual(frame_utils.frame_path('image.$F.exr', 7, '$F'),
+                         'image.7.exr')
+
+
+class FrameOrderTest(unittest.TestCase):
+    def test_subdivide_frames(self):
+        frames = list(range(1, 10))
+        order = frame_utils.subdivide_frames(frames)
+        self.assertEqual(order[:3], [1, 9, 5])
+        self.assertEqual(sorted(order), frames)
+
+    def test_subdivide_short_ranges(self):
+        self.assertEqual(frame_utils.subdivide_frames([2, 1]), [2, 1])
+        self.assertEqual(frame_utils.subdivide_frames([]), [])
+
+    def test_key_frames_first(self):
+        order = frame_utils.key_frames_first(range(1, 10), '5,3,42')
+        self.assertEqual(order[:2], [5, 3])
+        self.assertEqual(sorted(order), list(range(1, 10)))
+
+    def test_progressive_frames(self):
+        self.assertEqual(frame_utils.progressive_frames(range(1, 8), 3),
+                         [1, 4, 7, 2, 3, 5, 6])
+
+
+class FrameRenderedTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='frame_utils_test_')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name, size):
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as image_file:
+            image_file.write(b'\0' * size)
+        return path
+
+    def test_missing_and_small_images(self):
+        self.assertFalse(frame_utils.frame_rendered(
+            os.path.join(self.root, 'missing.exr')))
+        self.assertFalse(frame_utils.frame_rendered(self.write('empty.exr', 0)))
+        self.assertFalse(frame_utils.frame_rendered(
+            self.write('header.exr', frame_utils.MIN_IMAGE_BYTES - 1)))
+        self.assertTrue(frame_utils.frame_rendered(
+            self.write('full.exr', frame_utils.MIN_IMAGE_BYTES)))
+
+    def test_links_are_followed(self):
+        link = os.path.join(self.root, 'link.exr')
+        os.symlink('full.exr', link)
+        self.assertFalse(frame_utils.frame_rendered(link))
+        self.write('full.exr', frame_utils.MIN_IMAGE_BYTES)
+        self.assertTrue(frame_utils.frame_rendered(link))
+
+    def test_directories_are_not_images(self):
+        self.assertFalse(frame_utils.frame_rendered(self.root, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+""" Tests of the held frame detection of rhou.ifd_hash. """
+
+# Built-in
+import os
+import shutil
+import tempfile
+import unittest
+
+# ReelFX
+from lightning.rhou import ifd_hash
+
+#------------------------------------------------------------------------------
+# GLOBALS
+#------------------------------------------------------------------------------
+IFD = """# Generated by frame {frame}
+ray_comment written on {frame}
+ray_time {time}
+ray_property renderer renderlabel "shot.beauty.{padded}"
+ray_property image:filename "beauty.{padded}.exr"
+ray_image "beauty.{padded}.exr"
+ray_transform {transform}
+ray_quit
+"""
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+class IfdHashTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='ifd_hash_test_')
+        self.ifd_path = os.path.join(self.root, 'ifds', 'beauty.$F4.ifd')
+        self.image_path = os.path.join(self.root, 'images', 'beauty.$F4.exr')
+        os.makedirs(os.path.dirname(self.ifd_path))
+        os.makedirs(os.path.dirname(self.image_path))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def path(self, path, frame):
+        return path.replace('$F4', str(frame).zfill(4))
+
+    def write_ifd(self, frame, transform=1, time=None):
+        if time is None:
+            time = frame / 24.0
+        with open(self.path(self.ifd_path, frame), 'w') as ifd_file:
+            ifd_file.write(IFD.format(frame=frame, padded=str(frame).zfill(4),
+                                      time=time, transform=transform))
+
+    def test_normalize_line(self):
+        self.assertEqual(ifd_hash.normalize_line('# comment\n', 7), None)
+        self.assertEqual(ifd_hash.normalize_line('ray_image "a.0007.exr"', 7),
+                         None)
+        self.assertEqual(ifd_hash.normalize_line('ray_time 0.29\n', 7),
+                         'ray_time 0.29')
+        self.assertEqual(ifd_hash.normalize_line('ray_time 0.29\n', 7, True),
+                         None)
+        self.assertEqual(ifd_hash.normalize_line(
+            'ray_property image:filename "a.0007.exr"', 7),
+            'ray_property image:filename "a.<frame>.exr"')
+        # The frame number is only replaced in labels and image names
+        self.assertEqual(ifd_hash.normalize_line('ray_transform 7', 7),
+                         'ray_transform 7')
+
+    def test_hash_leaves_the_frame_number_out(self):
+        self.write_ifd(1, time=0)
+        self.write_ifd(2, time=0)
+        self.assertEqual(ifd_hash.hash_ifd(self.path(self.ifd_path, 1), 1),
+                         ifd_hash.hash_ifd(self.path(self.ifd_path, 2), 2))
+
+    def test_hash_keeps_the_time_by_default(self):
+        self.write_ifd(1)
+        self.write_ifd(2)
+        first = self.path(self.ifd_path, 1)
+        second = self.path(self.ifd_path, 2)
+        self.assertNotEqual(ifd_hash.hash_ifd(first, 1),
+                            ifd_hash.hash_ifd(second, 2))
+        self.assertEqual(ifd_hash.hash_ifd(first, 1, ignore_time=True),
+                         ifd_hash.hash_ifd(second, 2, ignore_time=True))
+
+    def test_held_frames(self):
+        for frame, transform in ((1, 1), (2, 1), (3, 2), (4, 1), (5, 2)):
+            self.write_ifd(frame, transform)
+        frames = [1, 2, 3, 4, 5, 6]
+        self.assertEqual(ifd_hash.held_frames(self.ifd_path, frames), {})
+        self.assertEqual(ifd_hash.held_frames(self.ifd_path, frames,
+                                              ignore_time=True),
+                         {2 : 1, 4 : 1, 5 : 3})
+
+    def test_skip_held_frames(self):
+        for frame, transform in ((1, 1), (2, 1), (3, 2)):
+            self.write_ifd(frame, transform)
+        held = ifd_hash.skip_held_frames(self.ifd_path, self.image_path,
+                                         [1, 2, 3], ignore_time=True)
+        self.assertEqual(held, {2 : 1})
+        with open(self.path(self.ifd_path, 2)) as ifd_file:
+            self.assertEqual(ifd_file.read(), ifd_hash.STUB_IFD)
+        with open(self.path(self.ifd_path, 3)) as ifd_file:
+            self.assertNotEqual(ifd_file.read(), ifd_hash.STUB_IFD)
+        self.assertEqual(os.readlink(self.path(self.image_path, 2)),
+                         'beauty.0001.exr')
+        self.assertFalse(os.path.lexists(self.path(self.image_path, 3)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+""" Tests of the IFD retention registry and policy. """
+
+# Built-in
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+# ReelFX
+from lightning import ifd_retention
+from lightning.ifd_retention import RetentionPolicy
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+class RetentionTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='ifd_retention_test_')
+        self.registry = ifd_retention.registry_dir(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def add_version(self, layer, version, frames=(1, 2, 3), size=100,
+                    jobs=('render',), rendered=True):
+        """ Register a version, and report its jobs done unless rendered is
+        False.  The policy they report back with keeps everything.
+        """
+        ifd_dir = os.path.join(self.root, layer, 'v{0:03d}'.format(version))
+        os.makedirs(ifd_dir)
+        for frame in frames:
+            path = os.path.join(ifd_dir, '{0}.{1:04d}.ifd'.format(layer, frame))
+            with open(path, 'w') as ifd_file:
+                ifd_file.write('x' * size)
+        ifd_retention.register(self.registry, ifd_dir, 'sq010', 'sh020', layer,
+                               version, jobs)
+        if rendered:
+            for job in jobs:
+                ifd_retention.on_render_complete(
+                    self.registry, ifd_dir, job, '1-3',
+                    RetentionPolicy(keep_versions=100).to_dict())
+        return ifd_dir
+
+    def entry(self, ifd_dir):
+        return ifd_retention.load_entry(self.registry, ifd_dir)
+
+    def test_policy(self):
+        self.assertRaises(ValueError, RetentionPolicy, action='shred')
+        self.assertEqual(RetentionPolicy(keep_versions=0).keep_versions, 1)
+        policy = RetentionPolicy(3, False, 10, ifd_retention.COMPRESS)
+        self.assertEqual(RetentionPolicy(**policy.to_dict()).to_dict(),
+                         policy.to_dict())
+
+    def test_ifd_frame(self):
+        self.assertEqual(ifd_retention.ifd_frame('beauty.0101.ifd'), 101)
+        self.assertEqual(ifd_retention.ifd_frame('beauty.-003.ifd'), -3)
+        self.assertEqual(ifd_retention.ifd_frame('beauty.0101.ifd.sha1'), None)
+
+    def test_register(self):
+        ifd_dir = self.add_version('beauty', 1, jobs=['left', 'right'],
+                                   rendered=False)
+        entry = self.entry(ifd_dir)
+        # The directory is only sized once a job reports back
+        self.assertEqual((entry['layer'], entry['version'], entry['bytes'],
+                          entry['state']),
+                         ('beauty', 1, 0, ifd_retention.ACTIVE))
+        self.assertEqual(ifd_retention.pending_jobs(self.registry, ifd_dir),
+                         ['left', 'right'])
+        ifd_retention.on_render_complete(self.registry, ifd_dir, 'left', '1-3',
+                                         RetentionPolicy().to_dict())
+        self.assertEqual(self.entry(ifd_dir)['bytes'], 300)
+        self.assertEqual(ifd_retention.pending_jobs(self.registry, ifd_dir),
+                         ['right'])
+        self.assertEqual(self.entry(os.path.join(self.root, 'other')), None)
+
+    def test_keep_versions(self):
+        old = self.add_version('beauty', 1)
+        kept = [self.add_version('beauty', 2), self.add_version('beauty', 3),
+                self.add_version('matte', 1)]
+        cleaned = ifd_retention.apply_policy(self.registry, RetentionPolicy())
+        self.assertEqual([entry['ifd_dir'] for entry in cleaned], [old])
+        self.assertEqual(os.listdir(old), [])
+        self.assertEqual(self.entry(old)['state'], ifd_retention.DELETED)
+        self.assertEqual(self.entry(old)['bytes'], 0)
+        for ifd_dir in kept:
+            self.assertEqual(len(os.listdir(ifd_dir)), 3)
+        # Cleaned versions are not cleaned again
+        self.assertEqual(ifd_retention.apply_policy(self.registry,
+                                                    RetentionPolicy()), [])
+
+    def test_pending_versions_are_kept(self):
+        old = self.add_version('beauty', 1, jobs=['render', 'late'],
+                               rendered=False)
+        ifd_retention.on_render_complete(self.registry, old, 'render', '1-3',
+                                         RetentionPolicy().to_dict())
+        self.add_version('beauty', 2)
+        policy = RetentionPolicy(keep_versions=1)
+        self.assertEqual(ifd_retention.apply_policy(self.registry, policy), [])
+        self.assertEqual(len(os.listdir(old)), 3)
+        ifd_retention.on_render_complete(self.registry, old, 'late', '1-3',
+                                         policy.to_dict())
+        self.assertEqual(os.listdir(old), [])
+
+    def test_failed_frames_are_kept(self):
+        old = self.add_version('beauty', 1, jobs=['c01', 'c02'], rendered=False)
+        ifd_retention.on_render_failed(self.registry, old, 'c01', '1')
+        ifd_retention.on_render_failed(self.registry, old, 'c02', '2-3')
+        # A job that is requeued and completes only clears its own frames
+        ifd_retention.on_render_complete(self.registry, old, 'c01', '1',
+                                         RetentionPolicy().to_dict())
+        self.assertEqual(ifd_retention.failed_frames(self.registry, old), [2, 3])
+        self.add_version('beauty', 2)
+        ifd_retention.apply_policy(self.registry,
+                                   RetentionPolicy(keep_versions=1))
+        self.assertEqual(sorted(os.listdir(old)),
+                         ['beauty.0002.ifd', 'beauty.0003.ifd'])
+
+    def test_sibling_jobs_keep_their_failures(self):
+        ifd_dir = self.add_version('beauty', 1, jobs=['left', 'right'],
+                                   rendered=False)
+        ifd_retention.on_render_failed(self.registry, ifd_dir, 'left', '2')
+        ifd_retention.on_render_complete(self.registry, ifd_dir, 'right', '1-3',
+                                         RetentionPolicy().to_dict())
+        self.assertEqual(ifd_retention.failed_frames(self.registry, ifd_dir), [2])
+
+    def test_compress(self):
+        old = self.add_version('beauty', 1, frames=[1])
+        self.add_version('beauty', 2)
+        ifd_retention.apply_policy(self.registry, RetentionPolicy(
+            keep_versions=1, action=ifd_retention.COMPRESS))
+        self.assertEqual(os.listdir(old), ['beauty.0001.ifd.gz'])
+        with gzip.open(os.path.join(old, 'beauty.0001.ifd.gz'), 'rb') as gz_file:
+            self.assertEqual(gz_file.read(), 'x' * 100)
+        self.assertEqual(self.entry(old)['state'], ifd_retention.COMPRESSED)
+
+    def test_max_bytes(self):
+        oldest = self.add_version('beauty', 1)
+        older = self.add_version('beauty', 2)
+        newest = self.add_version('beauty', 3)
+        policy = RetentionPolicy(keep_versions=3, max_bytes=600)
+        cleaned = ifd_retention.apply_policy(self.registry, policy)
+        self.assertEqual([entry['ifd_dir'] for entry in cleaned], [oldest])
+        # The newest version is kept whatever the budget
+        policy = RetentionPolicy(keep_versions=3, max_bytes=0)
+        cleaned = ifd_retention.apply_policy(self.registry, policy)
+        self.assertEqual([entry['ifd_dir'] for entry in cleaned], [older])
+        self.assertEqual(len(os.listdir(newest)), 3)
+
+    def test_report(self):
+        self.add_version('beauty', 1, size=1024)
+        lines = ifd_retention.report([self.registry]).splitlines()
+        self.assertEqual(lines[0], 'sq010_sh020 : 3.0KB in 1 versions')
+        self.assertEqual(lines[1].split()[:3], ['beauty', 'v001', '3.0KB'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+""" Tests of the cost estimates and packing of layer_packing, and of the
+render history they read.
+"""
+
+# Built-in
+import os
+import shutil
+import tempfile
+import unittest
+
+# ReelFX
+from lightning import frame_utils
+from lightning import layer_packing
+from lightning import render_history
+from lightning.layer_spec import LayerSpec
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+class PackingTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='layer_packing_test_')
+        self.history_path = render_history.history_path(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_estimate_from_pass_costs(self):
+        self.assertEqual(layer_packing.estimate(LayerSpec('beauty', 'beauty')),
+                         None)
+        self.assertEqual(layer_packing.estimate(LayerSpec('matte', 'matte')),
+                         (20.0, 2.0))
+        self.assertEqual(layer_packing.estimate(
+            LayerSpec('matte', 'matte'), pixels=layer_packing.BASE_PIXELS * 4),
+            (80.0, 8.0))
+
+    def test_estimate_from_render_history(self):
+        pixels = layer_packing.BASE_PIXELS
+        render_history.record(self.history_path, 'shadow', 4, 20.0, pixels)
+        render_history.record(self.history_path, 'other', 1, 500.0, pixels)
+        layer = LayerSpec('shadow', 'shadow')
+        self.assertEqual(layer_packing.estimate(layer, self.history_path, pixels),
+                         (5.0, 3.0))
+        # History taken at one resolution applies at another
+        self.assertEqual(
+            layer_packing.estimate(layer, self.history_path, pixels // 2),
+            (2.5, 1.5))
+        # Layers without a history of their own keep the table
+        self.assertEqual(layer_packing.estimate(LayerSpec('depth', 'depth'),
+                                                self.history_path, pixels),
+                         (15.0, 2.0))
+        # Any pass type with a history has an estimate
+        render_history.record(self.history_path, 'beauty', 2, 20.0, pixels)
+        self.assertEqual(layer_packing.estimate(LayerSpec('beauty', 'beauty'),
+                                                self.history_path, pixels),
+                         (10.0, float(layer_packing.DEFAULT_MEMORY)))
+        self.assertEqual(layer_packing.estimate(LayerSpec('beauty', 'beauty')),
+                         None)
+
+    def test_pack(self):
+        layers = [LayerSpec('beauty', 'beauty'), LayerSpec('matte', 'matte'),
+                  LayerSpec('depth', 'depth'), LayerSpec('shadow', 'shadow'),
+                  LayerSpec('occlusion', 'ambientOcclusion')]
+        # Memory keeps the occlusion and shadow apart from the others
+        self.assertEqual(layer_packing.pack(layers), [[1, 2], [3, 4]])
+        self.assertEqual(layer_packing.pack(layers, indices=[0, 1]), [])
+        # A layer left alone in its pack is not packed
+        self.assertEqual(layer_packing.pack(layers, max_seconds=100),
+                         [[1, 2, 3]])
+
+    def test_pack_keeps_mantra_clusters_apart(self):
+        layers = [LayerSpec('matte', 'matte', mantra_cluster='a'),
+                  LayerSpec('depth', 'depth', mantra_cluster='b'),
+                  LayerSpec('shadow', 'shadow', mantra_cluster='a')]
+        self.assertEqual(layer_packing.pack(layers), [[0, 2]])
+
+    def test_pack_with_history(self):
+        pixels = layer_packing.BASE_PIXELS
+        render_history.record(self.history_path, 'matte', 1, 600.0, pixels)
+        layers = [LayerSpec('matte', 'matte'), LayerSpec('depth', 'depth'),
+                  LayerSpec('shadow', 'shadow')]
+        self.assertEqual(layer_packing.pack(layers, history_path=self.history_path,
+                                            pixels=pixels), [[1, 2]])
+
+    def test_write_pack(self):
+        ifd_paths = []
+        for name in ('matte', 'depth'):
+            ifd_path = os.path.join(self.root, name, name + '.$F4.ifd')
+            os.makedirs(os.path.dirname(ifd_path))
+            for frame in (1, 2):
+                with open(ifd_path.replace('$F4', '000{0}'.format(frame)),
+                          'w') as ifd_file:
+                    ifd_file.write('{0} {1}\nray_quit\n'.format(name, frame))
+            ifd_paths.append(ifd_path)
+        output_path = layer_packing.pack_path(self.root, 'shot', 1)
+        frames = layer_packing.write_pack(ifd_paths, ['1-2', '2'], output_path)
+        self.assertEqual(frames, [1, 2])
+        with open(output_path.replace('$F4', '0001')) as ifd_file:
+            self.assertEqual(ifd_file.read(), 'matte 1\nray_quit\n')
+        with open(output_path.replace('$F4', '0002')) as ifd_file:
+            self.assertEqual(ifd_file.read(), 'matte 2\n' +
+                             layer_packing.RAY_RESET + 'depth 2\nray_quit\n')
+
+
+class RenderHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='render_history_test_')
+        self.history_path = render_history.history_path(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_seconds_per_pixel(self):
+        self.assertEqual(render_history.seconds_per_pixel(self.history_path,
+                                                          'beauty'), None)
+        render_history.record(self.history_path, 'beauty', 2, 100.0, 50)
+        render_history.record(self.history_path, 'beauty', 0, 100.0, 50)
+        render_history.record(self.history_path, 'beauty', 2, 100.0, 0)
+        self.assertEqual(render_history.seconds_per_pixel(self.history_path,
+                                                          'beauty'), 1.0)
+
+    def test_recent_records_only(self):
+        render_history.record(self.history_path, 'beauty', 1, 1000.0, 1)
+        for _ in range(render_history.RECENT_RECORDS):
+            render_history.record(self.history_path, 'beauty', 1, 10.0, 1)
+        self.assertEqual(render_history.seconds_per_pixel(self.history_path,
+                                                          'beauty'), 10.0)
+
+    def test_is_stub(self):
+        ifd_path = os.path.join(self.root, 'beauty.$F4.ifd')
+        with open(frame_utils.frame_path(ifd_path, 101), 'w') as ifd_file:
+            ifd_file.write(render_history.STUB_IFD)
+        with open(frame_utils.frame_path(ifd_path, 102), 'w') as ifd_file:
+            ifd_file.write(render_history.STUB_IFD + 'ray_end\n')
+        self.assertTrue(render_history.is_stub(ifd_path, '101'))
+        self.assertFalse(render_history.is_stub(ifd_path, '102'))
+        self.assertFalse(render_history.is_stub(ifd_path, '103'))
+        self.assertFalse(render_history.is_stub(ifd_path, 'all'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+""" Tests of LayerSpec and the eye and tile helpers of layer_spec. """
+
+# Built-in
+import pickle
+import unittest
+
+# ReelFX
+from lightning import layer_spec
+from lightning.layer_spec import LayerSpec
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+class ToIntTest(unittest.TestCase):
+    def test_blank_values_use_the_default(self):
+        self.assertEqual(layer_spec.to_int(None, 5), 5)
+        self.assertEqual(layer_spec.to_int('', 5), 5)
+        self.assertEqual(layer_spec.to_int('  ', 5), 5)
+
+    def test_values(self):
+        self.assertEqual(layer_spec.to_int('12', 5), 12)
+        self.assertEqual(layer_spec.to_int(0, 5), 0)
+
+    def test_bad_values_raise(self):
+        self.assertRaises(ValueError, layer_spec.to_int, 'many', 5)
+
+
+class LayerSpecTest(unittest.TestCase):
+    def test_blank_priority_and_cpus(self):
+        spec = LayerSpec('beauty', frame_range='101-110', priority='', cpus=None)
+        self.assertEqual(spec.priority, layer_spec.DEFAULT_PRIORITY)
+        self.assertEqual(spec.cpus, layer_spec.DEFAULT_CPUS)
+        self.assertEqual(spec.xml_attributes()['priority'],
+                         str(layer_spec.DEFAULT_PRIORITY))
+
+    def test_replace_and_pickle(self):
+        spec = LayerSpec('beauty', frame_range='101-110', left_eye=True,
+                         right_eye=True, priority='50', cpus='4')
+        self.assertTrue(spec.stereo)
+        copy = spec.replace(layer='shadow')
+        self.assertEqual((copy.layer, copy.priority, copy.cpus),
+                         ('shadow', 50, 4))
+        self.assertEqual(spec.layer, 'beauty')
+        loaded = pickle.loads(pickle.dumps(spec, 2))
+        self.assertEqual(loaded.xml_attributes(), spec.xml_attributes())
+
+
+class PathTest(unittest.TestCase):
+    def test_eye_path(self):
+        self.assertEqual(layer_spec.eye_path('/ifds/beauty.$F4.ifd', 'right'),
+                         '/ifds/r/beauty.$F4.ifd')
+
+    def test_tile_path(self):
+        self.assertEqual(layer_spec.tile_path('/images/beauty.$F4.exr', 3),
+                         '/images/tile03/beauty.$F4.exr')
+
+
+class TileTest(unittest.TestCase):
+    def test_tile_grid(self):
+        self.assertEqual(layer_spec.tile_grid(1), (1, 1))
+        self.assertEqual(layer_spec.tile_grid(4), (2, 2))
+        self.assertEqual(layer_spec.tile_grid(6), (3, 2))
+        self.assertEqual(layer_spec.tile_grid(7), (7, 1))
+        self.assertEqual(layer_spec.tile_grid(16), (4, 4))
+        self.assertEqual(layer_spec.tile_grid(0), (1, 1))
+
+    def test_tile_crops(self):
+        self.assertEqual(layer_spec.tile_crops(4), [
+            (0.0, 0.5, 0.0, 0.5), (0.5, 1.0, 0.0, 0.5),
+            (0.0, 0.5, 0.5, 1.0), (0.5, 1.0, 0.5, 1.0)])
+
+    def test_tile_crops_cover_the_frame(self):
+        for count in (1, 2, 6, 9, 12):
+            crops = layer_spec.tile_crops(count)
+            self.assertEqual(len(crops), count)
+            area = sum((right - left) * (top - bottom)
+                       for left, right, bottom, top in crops)
+            self.assertAlmostEqual(area, 1.0)
+            for left, right, bottom, top in crops:
+                self.assertTrue(0.0 <= left < right <= 1.0)
+                self.assertTrue(0.0 <= bottom < top <= 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+""" Tests of the submission manifest. """
+
+# Built-in
+import cPickle
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+# ReelFX
+from lightning import manifest
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='manifest_test_')
+        self.data = {
+            'saved_scene' : '/scenes/shot_v001.hip',
+            'frames' : None,
+            'image_paths' : ['beauty.$F4.exr', 'matte.$F4.exr', 'depth.$F4.exr'],
+            'ifd_paths' : ['beauty.$F4.ifd', 'matte.$F4.ifd', 'depth.$F4.ifd'],
+            'layer_info' : [{'layer' : 'beauty'}, {'layer' : 'matte'},
+                            {'layer' : 'depth'}],
+            'eyes' : [['left'], ['left'], ['left', 'right']],
+            'stream' : [False, True, False],
+            'pack_paths' : [None, None, None],
+            'tiles' : [0, 0, 4],
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_manifest_path(self):
+        self.assertEqual(manifest.manifest_path('/subs/shot_v001.xml'),
+                         '/subs/shot_v001' + manifest.MANIFEST_SUFFIX)
+
+    def test_write_and_load(self):
+        path = manifest.manifest_path(os.path.join(self.root, 'subs', 'a.xml'))
+        manifest.write(path, self.data)
+        loaded = manifest.load(path)
+        self.assertEqual(loaded.pop('version'), manifest.MANIFEST_VERSION)
+        self.assertEqual(loaded, self.data)
+        self.assertEqual(os.listdir(os.path.dirname(path)),
+                         [os.path.basename(path)])
+
+    def test_load_rejects_other_versions(self):
+        path = os.path.join(self.root, 'old' + manifest.MANIFEST_SUFFIX)
+        with open(path, 'wb') as manifest_file:
+            cPickle.dump(dict(self.data, version=manifest.MANIFEST_VERSION - 1),
+                         manifest_file)
+        self.assertRaises(ValueError, manifest.load, path)
+
+    def test_latest_manifest(self):
+        self.assertEqual(manifest.latest_manifest(self.root), None)
+        self.assertEqual(manifest.latest_manifest(
+            os.path.join(self.root, 'missing')), None)
+        old = os.path.join(self.root, 'a' + manifest.MANIFEST_SUFFIX)
+        new = os.path.join(self.root, 'b' + manifest.MANIFEST_SUFFIX)
+        manifest.write(new, self.data)
+        manifest.write(old, self.data)
+        now = time.time()
+        os.utime(old, (now - 60, now - 60))
+        self.assertEqual(manifest.latest_manifest(self.root), new)
+
+    def test_job_args(self):
+        args = manifest.job_args(self.data, [0, 2], 'chunk01', '101-110')
+        self.assertEqual(args['frames'], '101-110')
+        self.assertEqual(args['saved_scene'], '/scenes/shot_v001_chunk01.hip')
+        for key in manifest.LAYER_KEYS:
+            self.assertEqual(args[key], [self.data[key][0], self.data[key][2]])
+        # The manifest itself is left as it is
+        self.assertEqual(len(self.data['layer_info']), 3)
+        self.assertEqual(self.data['saved_scene'], '/scenes/shot_v001.hip')
+
+    def test_job_args_of_every_layer(self):
+        self.assertEqual(manifest.job_args(self.data), self.data)
+        self.assertEqual(manifest.job_args(self.data, [0, 1, 2]), self.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+""" Tests of the render_cache index of frames keyed on IFD hashes. """
+
+# Built-in
+import os
+import shutil
+import tempfile
+import unittest
+
+# ReelFX
+from lightning import render_cache
+from lightning.rhou import ifd_hash
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+class RenderCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='render_cache_test_')
+        self.cache = render_cache.cache_dir(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, path, data):
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as output_file:
+            output_file.write(data)
+        return path
+
+    def version_paths(self, version):
+        version_dir = os.path.join(self.root, version)
+        return (os.path.join(version_dir, 'ifds', 'beauty.$F4.ifd'),
+                os.path.join(version_dir, 'images', 'beauty.$F4.exr'))
+
+    def test_hash_files(self):
+        ifd = self.write(os.path.join(self.root, 'beauty.0001.ifd'), 'ray_quit\n')
+        self.assertEqual(render_cache.read_hash(ifd), None)
+        render_cache.write_hash(ifd, 'abc')
+        self.assertEqual(render_cache.read_hash(ifd), 'abc')
+
+    def test_record_and_lookup(self):
+        image = self.write(os.path.join(self.root, 'beauty.0001.exr'), 'pixels')
+        self.assertEqual(render_cache.lookup(self.cache, 'beauty', 'abc'), None)
+        render_cache.record(self.cache, 'beauty', 'abc', image)
+        self.assertEqual(render_cache.lookup(self.cache, 'beauty', 'abc'), image)
+        self.assertEqual(render_cache.lookup(self.cache, 'shadow', 'abc'), None)
+        self.assertEqual(render_cache.cached_count(self.cache, 'beauty'), 1)
+        # Entries of images that are gone are not used
+        os.remove(image)
+        self.assertEqual(render_cache.lookup(self.cache, 'beauty', 'abc'), None)
+        self.assertEqual(render_cache.cached_count(self.cache, 'beauty'), 0)
+
+    def test_materialize_copies(self):
+        source = self.write(os.path.join(self.root, 'v001', 'a.exr'), 'pixels')
+        image = os.path.join(self.root, 'v002', 'a.exr')
+        render_cache.materialize(source, image)
+        self.assertFalse(os.path.islink(image))
+        self.assertNotEqual(os.stat(source).st_ino, os.stat(image).st_ino)
+        with open(image) as image_file:
+            self.assertEqual(image_file.read(), 'pixels')
+        self.assertEqual(os.listdir(os.path.dirname(image)), ['a.exr'])
+
+    def test_reuse_frames_of_an_earlier_version(self):
+        ifd_v1, image_v1 = self.version_paths('v001')
+        ifd_v2, image_v2 = self.version_paths('v002')
+        for frame in (1, 2):
+            padded = str(frame).zfill(4)
+            for ifd in (ifd_v1, ifd_v2):
+                self.write(ifd.replace('$F4', padded),
+                           'ray_time {0}\nray_quit\n'.format(frame))
+            self.write(image_v1.replace('$F4', padded), 'frame {0}'.format(frame))
+        # Frame 2 changed in the new version
+        self.write(ifd_v2.replace('$F4', '0002'), 'ray_time 2\nobject\nray_quit\n')
+
+        # The first version renders and indexes its frames
+        self.assertEqual(render_cache.reuse_frames(
+            self.cache, 'beauty', ifd_v1, image_v1, [1, 2]), {})
+        render_cache.on_render_complete(self.cache, 'beauty', ifd_v1, image_v1,
+                                        '1-2')
+        self.assertEqual(render_cache.cached_count(self.cache, 'beauty'), 2)
+
+        reused = render_cache.reuse_frames(self.cache, 'beauty', ifd_v2,
+                                           image_v2, [1, 2])
+        self.assertEqual(reused, {1 : image_v1.replace('$F4', '0001')})
+        with open(image_v2.replace('$F4', '0001')) as image_file:
+            self.assertEqual(image_file.read(), 'frame 1')
+        with open(ifd_v2.replace('$F4', '0001')) as ifd_file:
+            self.assertEqual(ifd_file.read(), ifd_hash.STUB_IFD)
+        self.assertFalse(os.path.exists(image_v2.replace('$F4', '0002')))
+        # The hash of the stubbed IFD is kept, so the reused frame is indexed
+        self.assertEqual(render_cache.read_hash(ifd_v2.replace('$F4', '0001')),
+                         render_cache.read_hash(ifd_v1.replace('$F4', '0001')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+""" Tests of the rhou.spool directory of IFD work items. """
+
+# Built-in
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+# ReelFX
+from lightning.rhou import spool
+
+#------------------------------------------------------------------------------
+# CLASSES
+#------------------------------------------------------------------------------
+class SpoolTest(unittest.TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp(prefix='spool_test_')
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_dir)
+
+    def test_submit(self):
+        item_id = spool.submit(self.spool_dir, '/scenes/a.hip', {'frames' : '1-5'},
+                               release=(11, 12))
+        self.assertEqual(spool.status(self.spool_dir, item_id), spool.PENDING)
+        self.assertEqual(spool.status(self.spool_dir, 'unknown'), None)
+        self.assertEqual(os.listdir(os.path.join(self.spool_dir, spool.PENDING)),
+                         [item_id + '.json'])
+
+    def test_claim_oldest_first(self):
+        self.assertEqual(spool.claim(self.spool_dir), None)
+        first = spool.submit(self.spool_dir, '/scenes/a.hip', {})
+        second = spool.submit(self.spool_dir, '/scenes/b.hip', {}, release=[3])
+        item_id, item = spool.claim(self.spool_dir)
+        self.assertEqual((item_id, item['scene'], item['release']),
+                         (first, '/scenes/a.hip', []))
+        self.assertEqual(spool.status(self.spool_dir, first), spool.WORKING)
+        item_id, item = spool.claim(self.spool_dir)
+        self.assertEqual((item_id, item['release']), (second, [3]))
+        self.assertEqual(spool.claim(self.spool_dir), None)
+
+    def test_finish(self):
+        done = spool.submit(self.spool_dir, '/scenes/a.hip', {})
+        failed = spool.submit(self.spool_dir, '/scenes/b.hip', {})
+        for error in (None, 'no camera'):
+            item_id, item = spool.claim(self.spool_dir)
+            spool.finish(self.spool_dir, item_id, item, error)
+        self.assertEqual(spool.status(self.spool_dir, done), spool.DONE)
+        self.assertEqual(spool.status(self.spool_dir, failed), spool.FAILED)
+        self.assertEqual(os.listdir(os.path.join(self.spool_dir, spool.WORKING)),
+                         [])
+
+    def test_live_workers(self):
+        self.assertEqual(spool.live_workers(self.spool_dir), [])
+        spool.heartbeat(self.spool_dir, 'host_1')
+        spool.heartbeat(self.spool_dir, 'host_2')
+        self.assertEqual(spool.live_workers(self.spool_dir),
+                         ['host_1', 'host_2'])
+        # A worker that missed its heartbeats is gone
+        path = os.path.join(self.spool_dir, spool.WORKERS, 'host_2')
+        beat = time.time() - spool.WORKER_TIMEOUT - 1
+        os.utime(path, (beat, beat))
+        self.assertEqual(spool.live_workers(self.spool_dir), ['host_1'])
+        spool.retire(self.spool_dir, 'host_1')
+        self.assertEqual(spool.live_workers(self.spool_dir), [])
+
+if __name__ == '__main__':
+    unittest.main()
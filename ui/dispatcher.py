@@ -59,6 +59,10 @@ from houdini_tools import hda_manager
 from houdini_tools.ui.camera_update_view import OutdatedCameraView
 import lightning
 from lightning.dispatcher import Dispatcher as CmdDispatcher
+from lightning.dispatcher import (FRAME_ORDER_SEQUENTIAL, FRAME_ORDER_KEY_FIRST,
+                                  FRAME_ORDER_PROGRESSIVE, PROGRESSIVE_STEP)
+from lightning.ifd_retention import RetentionPolicy, COMPRESS, DELETE
+from lightning.layer_spec import LayerSpec
 from lightning.ui import file_browsers
 from ui_lib.inputs.pipe_context_input import RPipeContextInput
 from ui_lib.layouts.box_layout import RHBoxLayout, RVBoxLayout
@@ -264,7 +268,7 @@ class Dispatcher(ui_lib_old.BaseWidget):
         mapping = {
             'mantra' : ['dead', 'mantra', 'big_ram'],
             'hbatch' : ['dead_hbatch'],
-            'hbatch_dist' : ['Single Frame', 'Frame Chunk'],
+            'hbatch_dist' : ['Single Frame', 'Frame Chunk', 'Direct to Mantra'],
         }
         [combo_obj.addItem(sel) for sel in mapping[field]]
 
@@ -710,16 +714,20 @@ class Dispatcher(ui_lib_old.BaseWidget):
         """
         self.bottom_button_layout = QtGui.QHBoxLayout()
         self.submit_all_button = QtGui.QPushButton("Submit All")
+        self.repair_button = QtGui.QPushButton("Repair Missing Frames")
         self.load_rlc_layer_button = QtGui.QPushButton("Load RLC Layers")
         self.clear_layers_button = QtGui.QPushButton("Clear Layers")
         self.close_button = QtGui.QPushButton("Close")
         self.bottom_button_layout.addWidget(self.submit_all_button)
+        self.bottom_button_layout.addWidget(self.repair_button)
         self.bottom_button_layout.addWidget(self.load_rlc_layer_button)
         self.bottom_button_layout.addWidget(self.clear_layers_button)
         self.bottom_button_layout.addWidget(self.close_button)
 
         self.connect(self.submit_all_button, QtCore.SIGNAL('clicked()'),
                      self.submit_render)
+        self.connect(self.repair_button, QtCore.SIGNAL('clicked()'),
+                     self.repair_render)
         self.connect(self.load_rlc_layer_button, QtCore.SIGNAL('clicked()'),
                      self._load_passes)
         self.connect(self.clear_layers_button, QtCore.SIGNAL('clicked()'),
@@ -2202,6 +2210,21 @@ class Dispatcher(ui_lib_old.BaseWidget):
         self.submission()
         self.setCursor(temp)
 
+    def repair_render(self):
+        """
+        repair_render is a method of RSTDispatcher that ...
+        submits only the frames missing from the current versions of the
+        layers, without versioning up or archiving the scene again
+
+        @returns: None
+        @rtype:
+
+        """
+        temp = self.cursor()
+        self.setCursor(QtGui.QCursor(QtCore.Qt.WaitCursor))
+        self.submission(repair=True)
+        self.setCursor(temp)
+
     def _read_farm_xml_cluster(self):
         context = PathContext(project=self.show_longname, disc=self.department)
         # Old pipeline read farm xml to get farm information
@@ -2241,10 +2264,18 @@ class Dispatcher(ui_lib_old.BaseWidget):
             cam_view.exec_()
 
 
-    def submission(self):
+    def get_key_frames(self):
+        """(str) The hero frame and the key frames of the shot as one frame
+        range, hero frame first.
+        """
+        frames = [self.hero_frame, self.key_frames.strip('[]()')]
+        return ','.join(frame for frame in frames if frame)
+
+    def submission(self, repair=False):
         """
         Create the submission object that will create the xml and the job
-        to the farm.
+        to the farm.  A repair only renders the missing frames of the
+        current versions.
         """
         # self.prompt_to_save()
         # self.prompt_update_cameras()
@@ -2255,16 +2286,44 @@ class Dispatcher(ui_lib_old.BaseWidget):
         after_job = topform_info['waitfor']
         #self.shotopt = self.toplayout.shot_opt_check.isChecked()
         table_info = self.get_table_info()
+        # Old IFDs are only cleaned up when asked for
+        ifd_policy = None
+        if topform_info['ifd_retention']:
+            ifd_policy = RetentionPolicy(action=topform_info['ifd_retention'])
         self.wip_ctx = WipContext.from_path(
             str(self.toplayout.scene_render_edit.text())
         )
         submission = CmdDispatcher(self.wip_ctx, self.path_ctx, resolution,
                                           outformat, table_info, after_job=after_job,
-                                          test_only = False, notes=str(self.note_edit.toPlainText()))
+                                          test_only = False, notes=str(self.note_edit.toPlainText()),
+                                          ifd_group_size=topform_info['ifd_group_size'],
+                                          split_stereo=topform_info['split_stereo'],
+                                          repair=repair,
+                                          incremental=topform_info['incremental'],
+                                          pack_layers=topform_info['pack_layers'],
+                                          merge_passes=topform_info['merge_passes'],
+                                          frame_order=topform_info['frame_order'],
+                                          skip_held_frames=topform_info['skip_held_frames'],
+                                          reuse_renders=topform_info['reuse_renders'],
+                                          tiles=topform_info['tiles'],
+                                          key_frames=self.get_key_frames(),
+                                          ifd_policy=ifd_policy)
         job_ids = submission.submit()
         log_str = 'Submitted the following jobs:\n'
         for key, val in job_ids.iteritems():
             log_str = log_str + '{0} : {1}\n'.format(key, val)
+        if job_ids.reused:
+            log_str = log_str + 'Reused from the last submission:\n'
+            for key, val in sorted(job_ids.reused.iteritems()):
+                log_str = log_str + '{0} : {1}\n'.format(key, val)
+        if topform_info['reuse_renders']:
+            cached = submission.cached_frames()
+            if cached:
+                log_str = log_str + 'Frames available in the render cache:\n'
+                for key, val in sorted(cached.iteritems()):
+                    log_str = log_str + '{0} : {1}\n'.format(key, val)
+        log_str = log_str + 'Submission timings ({0:.2f}s):\n{1}\n'.format(
+            job_ids.timings['seconds'], submission.format_timings())
 
         self.log_edit.append(log_str)
         ifd_log = '\n'.join(submission.ifd_paths)
@@ -2319,7 +2378,7 @@ class Dispatcher(ui_lib_old.BaseWidget):
         each pass selected to render.
 
         @returns: all of the information contained in each layer
-        @rtype: list of dictionaries
+        @rtype: list of LayerSpec
 
         """
         table_list = []
@@ -2376,8 +2435,22 @@ class Dispatcher(ui_lib_old.BaseWidget):
             tmpdict['priority'] = str(self.table.indexWidget(model.index(row, 9)).displayText())
             tmpdict['cpus'] = str(self.table.indexWidget(model.index(row, 10)).displayText())
             tmpdict['mantra_cluster'] = str(self.table.indexWidget(model.index(row, 11)).displayText())
-
-            table_list.append(tmpdict)
+            tmpdict['hbatch_dist'] = str(self.table.indexWidget(model.index(row, 12)).currentText())
+
+            table_list.append(LayerSpec(
+                tmpdict['layer'],
+                pass_type=tmpdict['pass_type'],
+                frame_range=tmpdict['frame_range'],
+                original_frame_range=tmpdict['original_frame_range'],
+                left_eye=tmpdict['renderLeftEye'],
+                right_eye=tmpdict['renderRightEye'],
+                up=tmpdict['up'],
+                camera=tmpdict['camera'],
+                priority=tmpdict['priority'],
+                cpus=tmpdict['cpus'],
+                mantra_cluster=tmpdict['mantra_cluster'],
+                hbatch_dist=tmpdict['hbatch_dist'],
+            ))
 
         return table_list
 
@@ -2517,6 +2590,30 @@ class DispatcherTopformLayout(QtGui.QGridLayout):
 
         topform_info['waitfor'] = int(self.qube_waitfor_edit.text())
 
+        index = self.ifd_jobs_combo.currentIndex()
+        topform_info['ifd_group_size'] = self.ifd_jobs_combo.itemData(index).toPyObject()[0]
+
+        topform_info['split_stereo'] = self.split_stereo_check.isChecked()
+
+        topform_info['incremental'] = self.incremental_check.isChecked()
+
+        topform_info['pack_layers'] = self.pack_layers_check.isChecked()
+
+        topform_info['merge_passes'] = self.merge_passes_check.isChecked()
+
+        index = self.frame_order_combo.currentIndex()
+        topform_info['frame_order'] = self.frame_order_combo.itemData(index).toPyObject()[0]
+
+        topform_info['skip_held_frames'] = self.skip_held_check.isChecked()
+
+        topform_info['reuse_renders'] = self.reuse_renders_check.isChecked()
+
+        index = self.tiles_combo.currentIndex()
+        topform_info['tiles'] = self.tiles_combo.itemData(index).toPyObject()[0]
+
+        index = self.ifd_retention_combo.currentIndex()
+        topform_info['ifd_retention'] = self.ifd_retention_combo.itemData(index).toPyObject()[0]
+
         return topform_info
 
     def set_validations(self):
@@ -2675,6 +2772,102 @@ class DispatcherTopformLayout(QtGui.QGridLayout):
         self.addWidget(self.half_res_keys_label, 6, 0)
         self.addWidget(self.half_res_keys_check, 6, 1)
 
+        # How the IFD creation is split into hbatch jobs
+        self.ifd_jobs_label = QtGui.QLabel("IFD Jobs:")
+        self.ifd_jobs_label.setAlignment(QtCore.Qt.AlignRight)
+        self.ifd_jobs_combo = QtGui.QComboBox()
+        self.ifd_jobs_combo.setPalette(self.pal)
+        self.ifd_jobs_combo.addItem("One Job", userData=(0,))
+        self.ifd_jobs_combo.addItem("One Per Layer", userData=(1,))
+        self.ifd_jobs_combo.addItem("One Per 5 Layers", userData=(5,))
+        # Render jobs start as soon as the IFDs of their own layer are written
+        self.ifd_jobs_combo.setCurrentIndex(1)
+        self.addWidget(self.ifd_jobs_label, 7, 0)
+        self.addWidget(self.ifd_jobs_combo, 7, 1)
+
+        # Write both eyes of stereo layers from one take set up
+        self.split_stereo_label = QtGui.QLabel("Split Stereo Eyes")
+        self.split_stereo_label.setAlignment(QtCore.Qt.AlignRight)
+        self.split_stereo_check = QtGui.QCheckBox()
+        self.split_stereo_check.setStyleSheet(self.sheet)
+        self.addWidget(self.split_stereo_label, 8, 0)
+        self.addWidget(self.split_stereo_check, 8, 1)
+
+        # Leave out what did not change since the last submission
+        self.incremental_label = QtGui.QLabel("Only Changed Layers")
+        self.incremental_label.setAlignment(QtCore.Qt.AlignRight)
+        self.incremental_check = QtGui.QCheckBox()
+        self.incremental_check.setStyleSheet(self.sheet)
+        self.addWidget(self.incremental_label, 9, 0)
+        self.addWidget(self.incremental_check, 9, 1)
+
+        # Render cheap layers together in one mantra task per frame
+        self.pack_layers_label = QtGui.QLabel("Pack Small Layers")
+        self.pack_layers_label.setAlignment(QtCore.Qt.AlignRight)
+        self.pack_layers_check = QtGui.QCheckBox()
+        self.pack_layers_check.setStyleSheet(self.sheet)
+        self.addWidget(self.pack_layers_label, 10, 0)
+        self.addWidget(self.pack_layers_check, 10, 1)
+
+        # Render passes that only differ in their AOVs once
+        self.merge_passes_label = QtGui.QLabel("Merge Compatible Passes")
+        self.merge_passes_label.setAlignment(QtCore.Qt.AlignRight)
+        self.merge_passes_check = QtGui.QCheckBox()
+        self.merge_passes_check.setStyleSheet(self.sheet)
+        self.addWidget(self.merge_passes_label, 11, 0)
+        self.addWidget(self.merge_passes_check, 11, 1)
+
+        # The order mantra renders the frames of a layer in
+        self.frame_order_label = QtGui.QLabel("Frame Order")
+        self.frame_order_label.setAlignment(QtCore.Qt.AlignRight)
+        self.frame_order_combo = QtGui.QComboBox()
+        self.frame_order_combo.setPalette(self.pal)
+        self.frame_order_combo.addItem("Sequential", userData=(FRAME_ORDER_SEQUENTIAL,))
+        self.frame_order_combo.addItem("Hero And Key Frames First", userData=(FRAME_ORDER_KEY_FIRST,))
+        self.frame_order_combo.addItem("Progressive (Every {0}th First)".format(PROGRESSIVE_STEP),
+                                       userData=(FRAME_ORDER_PROGRESSIVE,))
+        self.addWidget(self.frame_order_label, 12, 0)
+        self.addWidget(self.frame_order_combo, 12, 1)
+
+        # Render one frame of every hold and link the others to it
+        self.skip_held_label = QtGui.QLabel("Skip Held Frames")
+        self.skip_held_label.setAlignment(QtCore.Qt.AlignRight)
+        self.skip_held_check = QtGui.QCheckBox()
+        self.skip_held_check.setStyleSheet(self.sheet)
+        self.addWidget(self.skip_held_label, 13, 0)
+        self.addWidget(self.skip_held_check, 13, 1)
+
+        # Take frames that were rendered before from earlier versions
+        self.reuse_renders_label = QtGui.QLabel("Reuse Rendered Frames")
+        self.reuse_renders_label.setAlignment(QtCore.Qt.AlignRight)
+        self.reuse_renders_check = QtGui.QCheckBox()
+        self.reuse_renders_check.setStyleSheet(self.sheet)
+        self.addWidget(self.reuse_renders_label, 14, 0)
+        self.addWidget(self.reuse_renders_check, 14, 1)
+
+        # Split the frames of big resolutions over several mantra jobs
+        self.tiles_label = QtGui.QLabel("Tiles")
+        self.tiles_label.setAlignment(QtCore.Qt.AlignRight)
+        self.tiles_combo = QtGui.QComboBox()
+        self.tiles_combo.setPalette(self.pal)
+        self.tiles_combo.addItem("Whole Frames", userData=(0,))
+        self.tiles_combo.addItem("4 Tiles", userData=(4,))
+        self.tiles_combo.addItem("9 Tiles", userData=(9,))
+        self.tiles_combo.addItem("16 Tiles", userData=(16,))
+        self.addWidget(self.tiles_label, 15, 0)
+        self.addWidget(self.tiles_combo, 15, 1)
+
+        # What happens to the IFDs of older versions once frames render
+        self.ifd_retention_label = QtGui.QLabel("Old IFDs")
+        self.ifd_retention_label.setAlignment(QtCore.Qt.AlignRight)
+        self.ifd_retention_combo = QtGui.QComboBox()
+        self.ifd_retention_combo.setPalette(self.pal)
+        self.ifd_retention_combo.addItem("Keep", userData=(None,))
+        self.ifd_retention_combo.addItem("Delete", userData=(DELETE,))
+        self.ifd_retention_combo.addItem("Compress", userData=(COMPRESS,))
+        self.addWidget(self.ifd_retention_label, 16, 0)
+        self.addWidget(self.ifd_retention_combo, 16, 1)
+
         # self.addWidget(self.shot_opt_label, 7, 0)
         #self.addWidget(self.shot_opt_check, 7, 1)
 